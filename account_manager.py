@@ -5,11 +5,13 @@ Manages Modal accounts: add, remove, switch, track balances.
 Uses SQLite database for encrypted storage.
 """
 
+import os
 import sqlite3
 import logging
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from pathlib import Path
+from cryptography.fernet import Fernet
 import config
 import utils
 
@@ -29,11 +31,19 @@ CREATE TABLE IF NOT EXISTS accounts (
     status TEXT DEFAULT 'ready',
     is_active INTEGER DEFAULT 0,
     selected_gpu TEXT DEFAULT NULL,
+    provisioned_version TEXT DEFAULT NULL,
+    provisioned_at TIMESTAMP DEFAULT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 )
 """
 
+# Columns added to the accounts table after it was first created
+ACCOUNTS_TABLE_MIGRATIONS = {
+    'provisioned_version': 'TEXT DEFAULT NULL',  # Manifest version the volume was fully set up for
+    'provisioned_at': 'TIMESTAMP DEFAULT NULL',
+}
+
 CREATE_USAGE_LOG_TABLE = """
 CREATE TABLE IF NOT EXISTS usage_log (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -67,6 +77,13 @@ class AccountManager:
             cursor = conn.cursor()
             cursor.execute(CREATE_ACCOUNTS_TABLE)
             cursor.execute(CREATE_USAGE_LOG_TABLE)
+            
+            # Add columns missing from databases created by older versions
+            cursor.execute("PRAGMA table_info(accounts)")
+            columns = {row[1] for row in cursor.fetchall()}
+            for column, definition in ACCOUNTS_TABLE_MIGRATIONS.items():
+                if column not in columns:
+                    cursor.execute(f"ALTER TABLE accounts ADD COLUMN {column} {definition}")
             conn.commit()
             conn.close()
             logger.info(f"Database initialized: {self.db_path}")
@@ -290,6 +307,56 @@ class AccountManager:
             logger.error(f"Failed to decrypt credentials for '{username}': {e}")
             return None
     
+    def rotate_encryption_key(self) -> tuple[bool, str]:
+        """
+        Replace the encryption key and re-encrypt every stored token with it.
+        
+        The new key is written next to the old one first, the tokens are
+        re-encrypted in one transaction, and only then is the key swapped in.
+        If the swap fails, the new key is still in '.encryption_key.new'.
+        
+        Returns:
+            (success, message)
+        """
+        old_key = utils.get_encryption_key()
+        new_key = Fernet.generate_key()
+        key_file = config.ENCRYPTION_KEY_FILE
+        pending_file = key_file.with_name(key_file.name + '.new')
+        
+        try:
+            pending_file.write_bytes(new_key)
+            os.chmod(pending_file, 0o600)
+            
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, username, token_id_encrypted, token_secret_encrypted FROM accounts")
+            
+            for row in cursor.fetchall():
+                token_id = utils.decrypt_data(row['token_id_encrypted'], old_key)
+                token_secret = utils.decrypt_data(row['token_secret_encrypted'], old_key)
+                cursor.execute("""
+                    UPDATE accounts
+                    SET token_id_encrypted = ?, token_secret_encrypted = ?
+                    WHERE id = ?
+                """, (utils.encrypt_data(token_id, new_key), utils.encrypt_data(token_secret, new_key), row['id']))
+            
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            pending_file.unlink(missing_ok=True)
+            logger.error(f"Failed to re-encrypt tokens: {e}")
+            return False, f"Failed to re-encrypt tokens: {e}"
+        
+        try:
+            pending_file.replace(key_file)
+        except Exception as e:
+            # The tokens are already under the new key, which stays in pending_file
+            logger.critical(f"Tokens were re-encrypted but {pending_file} could not replace {key_file}: {e}")
+            return False, f"Move {pending_file.name} to {key_file.name} by hand: {e}"
+        
+        logger.info("Rotated the encryption key and re-encrypted all stored tokens")
+        return True, "Encryption key rotated"
+    
     # ========================================================================
     # UPDATE ACCOUNT DATA
     # ========================================================================
@@ -397,16 +464,50 @@ class AccountManager:
             logger.error(f"Failed to update GPU for '{username}': {e}")
             return False
     
+    def update_provisioning(self, username: str, version: Optional[str]) -> bool:
+        """
+        Cache an account's provisioning state.
+        
+        Args:
+            username: Account username
+            version: Manifest version its volume is fully set up for (None if not set up)
+        """
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE accounts
+                SET provisioned_version = ?,
+                    provisioned_at = CASE WHEN ? IS NULL THEN NULL ELSE CURRENT_TIMESTAMP END,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE username = ?
+            """, (version, version, username))
+            conn.commit()
+            conn.close()
+            
+            logger.info(f"Updated provisioning for '{username}': {version or 'not provisioned'}")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to update provisioning for '{username}': {e}")
+            return False
+    
     # ========================================================================
     # ACCOUNT SELECTION LOGIC
     # ========================================================================
     
-    def get_next_available_account(self, min_balance: float = None) -> Optional[Dict[str, Any]]:
+    def get_next_available_account(
+        self,
+        min_balance: float = None,
+        prefer_version: str = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Get next available account with sufficient balance.
         
         Args:
             min_balance: Minimum balance required (default: config.MIN_CREDIT_THRESHOLD)
+            prefer_version: Prefer accounts already provisioned for this manifest
+                            version (they skip setup), then the highest balance
         
         Returns:
             Account dict or None if no available account
@@ -422,9 +523,9 @@ class AccountManager:
                 WHERE is_active = 0 
                 AND balance >= ? 
                 AND status != 'dead'
-                ORDER BY balance DESC
+                ORDER BY (provisioned_version IS NOT NULL AND provisioned_version = ?) DESC, balance DESC
                 LIMIT 1
-            """, (min_balance,))
+            """, (min_balance, prefer_version))
             row = cursor.fetchone()
             conn.close()
             
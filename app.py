@@ -5,10 +5,17 @@ GPU_TYPE = os.environ.get("GPU_TYPE", "T4") #NEW
 app = modal.App("comfyui-antique")
 vol = modal.Volume.from_name("workspace", create_if_missing=True)
 
+# The dependency cache (built by app2.py) lives in provisioning.py
+HERE = os.path.dirname(os.path.abspath(__file__))
+provisioning_files = [
+    modal.Mount.from_local_file(os.path.join(HERE, "provisioning.py"), remote_path="/root/provisioning.py"),
+    modal.Mount.from_local_file(os.path.join(HERE, "provisioning.json"), remote_path="/root/provisioning.json"),
+]
+
 def install_comfyui_dependencies():
-    os.system("cd /root/workspace/ComfyUI && uv pip install --system -r requirements.txt")
-    os.system("cd /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager && uv pip install --system -r requirements.txt")
-    os.system("python /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager/cm-cli.py restore-dependencies")
+    # Offline from the volume's wheelhouse when setup step 2 cached these requirements
+    import provisioning
+    provisioning.install_dependencies()
     
 image = (
     modal.Image.debian_slim(python_version="3.11")
@@ -24,7 +31,8 @@ image = (
     
     .run_function(
         install_comfyui_dependencies,
-        volumes={"/root/workspace": vol}
+        volumes={"/root/workspace": vol},
+        mounts=provisioning_files,
     )
 )
 
@@ -33,13 +41,17 @@ image = (
     gpu=GPU_TYPE,
     timeout=24*3600,  # 24 hour
     volumes={"/root/workspace": vol},
+    mounts=provisioning_files,
 )
-def run():
+def run(tunnel_name: str = "tensorart"):
+    # The image isn't rebuilt when a requirements.txt on the volume changes;
+    # this catches up (offline from the cache) and is skipped when nothing did
+    install_comfyui_dependencies()
     os.system("jupyter lab --ip=0.0.0.0 --port=5000 --no-browser --allow-root --NotebookApp.token='' --NotebookApp.password='' &")
     time.sleep(5)
-    os.system("cd /root/workspace/ComfyUI && python main.py --listen 0.0.0.0 --port 8188 &")
+    os.system("cd /root/workspace/ComfyUI && python main.py --listen 0.0.0.0 --port 8188 --preview-method auto &")
     time.sleep(10)
-    os.system("cloudflared tunnel run tensorart")
+    os.system(f"cloudflared tunnel run {tunnel_name}")
     print("Starting ComfyUI...✅")
 
   
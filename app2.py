@@ -5,11 +5,7 @@ GPU_TYPE = os.environ.get("GPU_TYPE", "T4") #NEW
 app = modal.App("setup-step2")
 vol = modal.Volume.from_name("workspace", create_if_missing=True)
 
-def install_comfyui_dependencies():
-    os.system("cd /root/workspace/ComfyUI && uv pip install --system -r requirements.txt")
-    os.system("cd /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager && uv pip install --system -r requirements.txt")
-    os.system("python /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager/cm-cli.py restore-dependencies")
-    
+# Same base as app.py's image, so the cache holds exactly what ComfyUI adds to it
 image = (
     modal.Image.debian_slim(python_version="3.11")
     .apt_install("git", "wget", "curl", "aria2", "libgl1", "lsof", "libglib2.0-0", "unzip")
@@ -21,20 +17,32 @@ image = (
         "wget https://github.com/cloudflare/cloudflared/releases/latest/download/cloudflared-linux-amd64 -O cloudflared && chmod +x cloudflared && mv cloudflared /usr/local/bin/",
          # "",    
     )
-           
-    .run_function(
-        install_comfyui_dependencies,
-        volumes={"/root/workspace": vol}
-    )
 )
 
+# Builds the dependency cache and records that this step finished (see provisioning.py)
+HERE = os.path.dirname(os.path.abspath(__file__))
+provisioning_files = [
+    modal.Mount.from_local_file(os.path.join(HERE, "provisioning.py"), remote_path="/root/provisioning.py"),
+    modal.Mount.from_local_file(os.path.join(HERE, "provisioning.json"), remote_path="/root/provisioning.json"),
+]
+
 @app.function(
     image=image,
     gpu=GPU_TYPE,
     timeout=1*3600,  # 1 hour
     volumes={"/root/workspace": vol},
+    mounts=provisioning_files,
 )
 def run():
-    print("Dependencies Installed...✅")
+    import provisioning
+    
+    # Installs and caches (lock + wheelhouse) only when a requirements.txt
+    # changed; app.py's image then installs offline from the cache
+    if provisioning.build_dependency_cache()["status"] == "failed":
+        provisioning.write_marker("step2", None)
+        print("⚠️ Some dependencies failed to install, run setup again to retry them")
+    else:
+        provisioning.write_marker("step2", provisioning.manifest_version())
+        print("Dependencies Installed...✅")
   
 
@@ -49,6 +49,8 @@ MODAL_PATHS = {
     'outputs': '/root/workspace/ComfyUI/output',
     'workflows': '/root/workspace/ComfyUI/user/default/workflows',
     'balance_json': '/root/workspace/ComfyUI/custom_nodes/ModalCredits/balance.json',
+    'integrity_report': '/.provisioning/integrity_report.json',  # Written by app1.py::verify (path inside the volume)
+    'provisioning_marker': '/.provisioning/marker.json',  # Setup stages completed (path inside the volume)
 }
 
 # Modal Python files
@@ -67,13 +69,76 @@ CLOUDFLARE_URLS = {
     'comfyui': 'https://comfyui.tensorart.site/',
 }
 
+# Deployment pool: ComfyUI can run on several accounts at once, one per endpoint.
+# Each endpoint is a named Cloudflare tunnel (passed to app.py as --tunnel-name)
+# with its own hostnames. Add an entry per extra tunnel to scale out.
+DEPLOYMENT_POOL = {
+    'endpoints': [
+        {'tunnel': 'tensorart', 'jupyter': CLOUDFLARE_URLS['jupyter'], 'comfyui': CLOUDFLARE_URLS['comfyui']},
+        # {'tunnel': 'tensorart-2', 'jupyter': 'https://jupyter2.tensorart.site/', 'comfyui': 'https://comfyui2.tensorart.site/'},
+    ],
+}
+
 # ComfyUI API endpoints (relative to comfyui URL)
 COMFYUI_API = {
     'system_stats': '/system_stats',
+    'object_info': '/object_info',
     'prompt': '/prompt',
     'history': '/history',
     'queue': '/queue',
     'view': '/view',
+    'ws': '/ws',
+    'interrupt': '/interrupt',
+}
+
+# ComfyUI websocket execution tracking
+EXECUTION_TRACKER = {
+    'heartbeat': 30,                  # Websocket ping interval (in seconds)
+    'reconnect_max_delay': 30,        # Max delay between reconnect attempts (in seconds)
+    'job_timeout': 3 * 3600,          # Give up on a prompt after this long (in seconds)
+    'early_event_buffer': 200,        # Events kept for prompts not registered yet
+}
+
+# Bot-side generation job queue
+JOB_QUEUE = {
+    'lanes': ['priority', 'normal', 'low'],   # Dispatch order (owner jobs go to 'priority')
+    'default_lane': 'normal',
+    'max_in_flight': 2,               # Prompts submitted by the bot and not finished yet (per deployment)
+    'max_comfyui_queue': 3,           # Don't submit while a ComfyUI's /queue is this deep
+    'max_jobs_per_user': 5,           # Queued + in-flight jobs allowed per user
+    'poll_interval': 5,               # Recheck ComfyUI's queue this often when blocked (in seconds)
+}
+
+# Admission control for new generation jobs (see GenerationScheduler.admit)
+ADMISSION_CONTROL = {
+    'enabled': True,
+    'queue_cache_ttl': 5,             # Reuse a /queue read for this long (in seconds)
+    'defer_depth': 4,                 # Jobs ahead (ComfyUI + bot queue) before users get an ETA
+    'reject_depth': 12,               # Jobs ahead before new jobs are rejected (owner exempt)
+    'heavy_job_seconds': 180,         # Workflows usually running this long go to the low lane when busy
+    'heavy_keywords': ['video', 'animate', 'wan', 'hunyuan', 'ltx'],  # Heavy workflows before any run was timed
+    'default_job_seconds': 60,        # Assumed run time when there is no history
+    'duration_samples': 20,           # Recent run times kept per workflow
+}
+
+# Live latent previews (ComfyUI must run with --preview-method, see app.py)
+LIVE_PREVIEW = {
+    'enabled_by_default': False,      # Default for /generate's live_preview option
+    'edit_interval': 2.5,             # Min seconds between status message edits
+}
+
+# Batch / variation generation
+BATCH = {
+    'default_count': 4,               # Seeds per batch when no count is given
+    'max_variants': 16,               # Max prompts one batch may submit
+    'files_per_message': 10,          # Discord's attachment limit per message
+}
+
+# Result cache (identical workflows are served from earlier outputs, stored in DATABASE_FILE)
+RESULT_CACHE = {
+    'enabled': True,                  # Set False to always render
+    'ttl': 7 * 24 * 3600,             # Entries older than this are re-rendered (in seconds)
+    'max_entries': 5000,              # Oldest entries are dropped beyond this
 }
 
 # ============================================================================
@@ -101,12 +166,48 @@ CREDIT_CHECK_INTERVAL = 3600
 # Default: 1200 seconds = 20 minutes
 SWITCH_WARNING_TIME = 1200
 
+# Durable timers (auto-switch countdowns survive bot restarts)
+TIMERS = {
+    'poll_interval': 15,     # Seconds between checks for due timers
+    'snooze_time': 1200,     # Seconds added by the Snooze button (20 minutes)
+    'keep_days': 7,          # Days to keep finished timers in the database
+}
+
+# Model downloads in setup step 1 (app1.py)
+MODEL_DOWNLOADS = {
+    'max_concurrent': 4,          # Files downloaded at the same time
+    'connections_per_file': 8,    # aria2c connections per file
+}
+
+# Custom node clones in setup step 1 (app1.py)
+CUSTOM_NODE_CLONES = {
+    'max_concurrent': 8,          # Repos cloned at the same time
+}
+
 # Setup time estimates (in seconds)
 SETUP_TIME = {
     'step1': 14400,   # 4 hours for model downloads (100GB+ on slower connections)
     'step2': 2400,    # 40 minutes for dependency installation
 }
 
+# Standby pre-provisioning (see standby_planner.py)
+# Sets up the next accounts on SETUP_GPU before the running ones deplete
+STANDBY_POLICY = {
+    'enabled': True,
+    'check_interval': 600,     # Seconds between forecasts (10 minutes)
+    'standby_count': 1,        # Accounts to keep set up and ready to switch to
+    'safety_margin': 1800,     # Extra lead time on top of the setup time (30 minutes)
+    'balance_samples': 12,     # Balance readings kept per account for the trend
+    'min_trend_span': 3600,    # Readings must span this long before the trend replaces the GPU price
+    'min_build_time': 300,     # Runs shorter than this were skips, not builds (not learned from)
+}
+
+# Bulk setup of unprovisioned accounts (/setup_all)
+SETUP_ALL = {
+    'max_parallel': 3,         # Accounts set up at the same time
+    'progress_interval': 30,   # Seconds between progress table updates
+}
+
 # ComfyUI startup timeout (in seconds)
 # How long to wait for ComfyUI to become ready
 COMFYUI_STARTUP_TIMEOUT = 900  # 15 minutes (increased for slower GPU spin-up)
@@ -114,6 +215,69 @@ COMFYUI_STARTUP_TIMEOUT = 900  # 15 minutes (increased for slower GPU spin-up)
 # How often to check if ComfyUI is ready (in seconds)
 COMFYUI_CHECK_INTERVAL = 5
 
+# ComfyUI readiness probing after a start (see readiness_prober.py)
+READINESS_PROBE = {
+    'initial_interval': 1.0,          # First polls are fast (in seconds)
+    'max_interval': 10.0,             # Polls back off up to this interval (in seconds)
+    'backoff': 1.5,                   # Interval multiplier after each failed poll
+    'request_timeout': 10,            # Max time per probe request (in seconds)
+    'eta_samples': 10,                # Recent cold starts used for the ETA
+    'default_eta': 180,               # ETA before any cold start was recorded (in seconds)
+}
+
+# Background health monitoring of the running deployment (see health_monitor.py)
+HEALTH_MONITOR = {
+    'enabled': True,
+    'interval': 30,                   # Seconds between health checks
+    'request_timeout': 10,            # Max time per probe (in seconds)
+    'latency_buckets': [0.1, 0.25, 0.5, 1, 2.5, 5, 10],  # Histogram bucket bounds (in seconds)
+    'error_window': 20,               # Recent probes used for the error rate
+    'hung_after': 300,                # Prompts pending with nothing running this long = hung (in seconds)
+    'auto_restart': True,             # Restart the deployment after repeated failures
+    'restart_after': 3,               # Consecutive failed checks before restarting
+    'restart_cooldown': 1800,         # Min seconds between automatic restarts
+}
+
+# Stop deployments nobody uses (see idle_manager.py)
+IDLE_POLICY = {
+    'enabled': True,
+    'check_interval': 60,             # Seconds between idle checks
+    'warn_before': 300,               # Warn this long before stopping (in seconds)
+    'default_timeout': 1800,          # Idle time before stopping, for GPUs not listed below (in seconds)
+    'timeouts': {                     # Idle time before stopping, per GPU (pricier GPUs stop sooner)
+        'T4': 3600,
+        'L4': 3600,
+        'A10': 2700,
+        'L40S': 1800,
+        'A100, 40 GB': 1200,
+        'A100, 80 GB': 1200,
+        'H100': 900,
+        'H200': 900,
+        'B200': 600,
+    },
+    'resume_on_generate': True,       # /generate starts an idle-stopped deployment again
+    'resume_window': 43200,           # Only resume deployments stopped within this long (in seconds)
+}
+
+# GPU recommendations from measured runtimes (see gpu_advisor.py)
+GPU_ADVISOR = {
+    'target_latency': 60,             # Max average seconds per job the recommended GPU should reach
+    'auto_pick': True,                # Start on the recommended GPU when none was chosen
+    'samples': 20,                    # Recent runs used per workflow and GPU
+    'mix_size': 50,                   # Recent runs used as the workflow mix when nothing is queued
+    'relative_speed': {               # Rough speed vs. T4, used for GPUs a workflow never ran on
+        'T4': 1.0,
+        'L4': 1.6,
+        'A10': 2.0,
+        'L40S': 3.5,
+        'A100, 40 GB': 4.0,
+        'A100, 80 GB': 4.3,
+        'H100': 6.5,
+        'H200': 7.0,
+        'B200': 10.0,
+    },
+}
+
 # ============================================================================
 # GPU CONFIGURATION
 # ============================================================================
@@ -163,12 +327,54 @@ DISCORD_CHANNELS = {
 # This will be generated automatically on first run
 ENCRYPTION_KEY_FILE = BASE_DIR / ".encryption_key"
 
+# sha256 of keys that were published; a bot still using one re-encrypts its
+# tokens under a new key at startup (see AccountManager.rotate_encryption_key)
+LEAKED_ENCRYPTION_KEYS = {
+    '662ee4b6edc377057ccafb6f6fa2570f15f535e42a8260102dad4a151440ae61',
+}
+
 # Allowed file extensions for outputs
 ALLOWED_OUTPUT_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.mp4', '.webm', '.webp']
 
 # Maximum file size for Discord uploads (in MB)
 MAX_DISCORD_FILE_SIZE = 25  # Discord limit is 25MB for regular users
 
+# ============================================================================
+# MEDIA PROCESSING
+# ============================================================================
+
+# Worker processes for CPU-heavy media work (re-encoding, thumbnails)
+MEDIA_PROCESS_WORKERS = 2
+
+# Re-encoded outputs (cached by source hash so each file is encoded once)
+ENCODED_CACHE_DIR = TEMP_DIR / "encoded"
+
+# Output gallery (thumbnail contact sheets for /list_outputs)
+THUMBNAIL_CACHE_DIR = TEMP_DIR / "thumbnails"
+OUTPUT_INDEX_FILE = TEMP_DIR / "output_index.json"
+
+GALLERY = {
+    'per_page': 12,           # Thumbnails per contact sheet
+    'columns': 4,             # Thumbnails per row
+    'thumbnail_size': 256,    # Max thumbnail width/height (in pixels)
+    'label_height': 22,       # Space under each thumbnail for its number
+    'fetch_concurrency': 4,   # Outputs fetched in parallel for new thumbnails
+}
+
+# Re-encoding settings for outputs larger than MAX_DISCORD_FILE_SIZE
+REENCODE = {
+    'enabled': True,
+    'size_margin': 0.95,              # Aim slightly below the limit (upload overhead)
+    'image_formats': ['WEBP', 'JPEG'],
+    'image_min_quality': 40,
+    'image_max_quality': 92,
+    'image_scales': [1.0, 0.85, 0.7, 0.5, 0.35, 0.25],
+    'video_heights': [None, 720, 480, 360],   # None = keep original resolution
+    'video_min_bitrate_kbps': 250,    # Below this, drop frames instead
+    'video_decimated_fps': 12,
+    'video_audio_bitrate_kbps': 64,
+}
+
 # ============================================================================
 # LOGGING CONFIGURATION
 # ============================================================================
@@ -220,6 +426,35 @@ WORKFLOW_CHANNEL = {
 # Workflow file extensions
 WORKFLOW_EXTENSIONS = ['.json']
 
+# Per-workflow injection point overrides (<workflow name>.json)
+WORKFLOW_OVERRIDES_DIR = BASE_DIR / "workflow_overrides"
+
+# Compiled workflow templates
+WORKFLOW_TEMPLATES = {
+    'cache_ttl': 600,              # Seconds before a template is re-downloaded and recompiled
+    'prompt_node_types': [         # Nodes that hold prompt text
+        'CLIPTextEncode',
+        'CLIPTextEncodeSDXL',
+        'CLIPTextEncodeFlux',
+        'Text',
+        'String',
+        'Prompt',
+        'PromptText',
+        'TextInput',
+    ],
+    'prompt_fields': ['text', 'prompt', 'string', 'value', 'text_g', 'text_l', 'clip_l', 't5xxl'],
+    'seed_fields': ['seed', 'noise_seed'],
+    'steps_fields': ['steps'],
+    'size_fields': ['width', 'height'],
+    'latent_node_types': [         # Nodes that set the output size
+        'EmptyLatentImage',
+        'EmptySD3LatentImage',
+        'EmptyHunyuanLatentVideo',
+        'EmptyMochiLatentVideo',
+        'EmptyLTXVLatentVideo',
+    ],
+}
+
 # ============================================================================
 # MODAL CLI COMMANDS
 # ============================================================================
@@ -251,6 +486,20 @@ MAX_RETRIES = 3
 # Retry delay (in seconds)
 RETRY_DELAY = 5
 
+# Chunk size for streamed downloads (in bytes)
+DOWNLOAD_CHUNK_SIZE = 256 * 1024  # 256KB
+
+# Streamed outputs stay in memory up to this size, then spill to TEMP_DIR
+OUTPUT_SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # 8MB
+
+# Shared HTTP client (one pooled session for every request, see http_client.py)
+HTTP_CLIENT = {
+    'limit': 100,                     # Max open connections in total
+    'limit_per_host': 10,             # Max open connections per host (websockets count too)
+    'ttl_dns_cache': 300,             # Seconds to cache DNS lookups
+    'keepalive_timeout': 60,          # Seconds an idle connection stays open for reuse
+}
+
 # ============================================================================
 # FEATURE FLAGS
 # ============================================================================
@@ -298,12 +547,15 @@ def validate_config():
     
     return True
 
-def get_modal_command(command_name, **kwargs):
-    """Get a formatted Modal CLI command."""
+def get_modal_command(command_name, profile=None, **kwargs):
+    """Get a formatted Modal CLI command (run against `profile` if given, not the active one)."""
     template = MODAL_COMMANDS.get(command_name)
     if not template:
         raise ValueError(f"Unknown Modal command: {command_name}")
-    return template.format(**kwargs)
+    command = template.format(**kwargs)
+    if profile:
+        command = f"MODAL_PROFILE={profile} {command}"
+    return command
 
 # ============================================================================
 # INITIALIZATION
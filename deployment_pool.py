@@ -0,0 +1,189 @@
+"""
+Deployment Pool Module
+======================
+Tracks the ComfyUI deployments running across accounts:
+- One deployment per account, each on its own tunnel endpoint
+- Health state per deployment (set by the health monitor)
+- Ranks deployments for new jobs by load, GPU tier and remaining credits
+"""
+
+import logging
+import time
+from typing import Optional, Dict, Any, List
+import config
+from account_manager import account_manager
+from ui_config import GPU_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+# GPUs from slowest to fastest (GPU_OPTIONS is sorted by price)
+GPU_TIERS = [gpu['name'] for gpu in GPU_OPTIONS]
+
+# ============================================================================
+# DEPLOYMENT POOL CLASS
+# ============================================================================
+
+class DeploymentPool:
+    """Registry of running ComfyUI deployments."""
+    
+    def __init__(self):
+        """Initialize deployment pool."""
+        self.deployments: Dict[str, Dict[str, Any]] = {}  # Maps username -> deployment, in start order
+    
+    # ========================================================================
+    # ENDPOINTS
+    # ========================================================================
+    
+    def get_endpoints(self) -> List[Dict[str, str]]:
+        """Get all configured endpoints ({'tunnel', 'jupyter', 'comfyui'})."""
+        return config.DEPLOYMENT_POOL['endpoints']
+    
+    def get_free_endpoint(self) -> Optional[Dict[str, str]]:
+        """Get an endpoint no deployment is using (None if all are taken)."""
+        used = {deployment['tunnel'] for deployment in self.deployments.values()}
+        for endpoint in self.get_endpoints():
+            if endpoint['tunnel'] not in used:
+                return endpoint
+        return None
+    
+    def get_capacity(self) -> int:
+        """Get how many deployments can run at once."""
+        return len(self.get_endpoints())
+    
+    # ========================================================================
+    # REGISTRY
+    # ========================================================================
+    
+    def add(self, username: str, gpu: str, endpoint: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Register a started deployment.
+        
+        Args:
+            username: Account it runs on
+            gpu: GPU it runs on
+            endpoint: Endpoint from get_free_endpoint()
+        
+        Returns:
+            Deployment dict
+        """
+        deployment = {
+            'username': username,
+            'gpu': gpu,
+            'tunnel': endpoint['tunnel'],
+            'jupyter_url': endpoint['jupyter'],
+            'comfyui_url': endpoint['comfyui'],
+            'started_at': time.time(),
+            'healthy': True,
+        }
+        self.deployments[username] = deployment
+        logger.info(f"Deployment added: '{username}' on {gpu} via tunnel '{endpoint['tunnel']}'")
+        return deployment
+    
+    def remove(self, username: str) -> Optional[Dict[str, Any]]:
+        """Unregister a deployment (returns it, or None if it wasn't running)."""
+        deployment = self.deployments.pop(username, None)
+        if deployment:
+            logger.info(f"Deployment removed: '{username}'")
+        return deployment
+    
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        """Get the deployment running on an account."""
+        return self.deployments.get(username)
+    
+    def get_all(self) -> List[Dict[str, Any]]:
+        """Get all deployments, in start order."""
+        return list(self.deployments.values())
+    
+    def get_primary(self) -> Optional[Dict[str, Any]]:
+        """Get the first started deployment (None if nothing is running)."""
+        return next(iter(self.deployments.values()), None)
+    
+    def get_by_url(self, base_url: str) -> Optional[Dict[str, Any]]:
+        """Get the deployment serving a ComfyUI URL."""
+        if not base_url:
+            return None
+        for deployment in self.deployments.values():
+            if deployment['comfyui_url'].rstrip('/') == base_url.rstrip('/'):
+                return deployment
+        return None
+    
+    def set_healthy(self, username: str, healthy: bool):
+        """Mark a deployment healthy or not (unhealthy ones get no new jobs)."""
+        deployment = self.deployments.get(username)
+        if deployment and deployment['healthy'] != healthy:
+            deployment['healthy'] = healthy
+            logger.info(f"Deployment '{username}' marked {'healthy' if healthy else 'unhealthy'}")
+    
+    # ========================================================================
+    # ROUTING
+    # ========================================================================
+    
+    def get_targets(self) -> List[Dict[str, Any]]:
+        """
+        Get the deployments that can take jobs.
+        
+        If no deployment was started by the bot, the default endpoint is
+        used, so a ComfyUI that outlived a bot restart still gets jobs.
+        
+        Returns:
+            List of deployments (username is None for the default endpoint)
+        """
+        if not self.deployments:
+            return [{
+                'username': None,
+                'gpu': None,
+                'tunnel': None,
+                'jupyter_url': config.CLOUDFLARE_URLS['jupyter'],
+                'comfyui_url': config.CLOUDFLARE_URLS['comfyui'],
+                'healthy': True,
+            }]
+        
+        return [
+            deployment for deployment in self.deployments.values()
+            if deployment['healthy'] and self._get_balance(deployment['username']) >= config.MIN_CREDIT_THRESHOLD
+        ]
+    
+    def _get_balance(self, username: str) -> float:
+        """Get an account's last known balance (0 if unknown)."""
+        account = account_manager.get_account_by_username(username) if username else None
+        return account['balance'] if account else 0.0
+    
+    def get_gpu_tier(self, gpu: str) -> int:
+        """Get a GPU's speed tier (higher is faster, -1 if unknown)."""
+        return GPU_TIERS.index(gpu) if gpu in GPU_TIERS else -1
+    
+    def rank(self, loads: Dict[str, int], heavy: bool = False) -> List[Dict[str, Any]]:
+        """
+        Order the available deployments from best to worst for a new job.
+        
+        Least loaded first, then the faster GPU, then the account with more
+        credits left. Heavy jobs (e.g. video) prefer the faster GPU over a
+        shorter queue.
+        
+        Args:
+            loads: Maps ComfyUI URL -> prompts running or pending on it
+            heavy: Whether the job is a long-running one
+        
+        Returns:
+            Ranked list of deployments
+        """
+        def key(deployment: Dict[str, Any]):
+            load = loads.get(deployment['comfyui_url'], 0)
+            tier = self.get_gpu_tier(deployment['gpu'])
+            balance = self._get_balance(deployment['username'])
+            if heavy:
+                return (-tier, load, -balance)
+            return (load, -tier, -balance)
+        
+        return sorted(self.get_targets(), key=key)
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+deployment_pool = DeploymentPool()
+
+# ============================================================================
+# END OF DEPLOYMENT POOL
+# ============================================================================
@@ -18,8 +18,10 @@ from discord import option
 from discord.ext import commands, tasks
 import asyncio
 import logging
+import random
 import logging.config
 import sys
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from pathlib import Path
@@ -27,13 +29,26 @@ from pathlib import Path
 # Import our modules
 import config
 import utils
-from ui_config import COLORS, ICONS, MESSAGES, BUTTON_LABELS, get_battery_icon, format_currency
+import provisioning
+from ui_config import COLORS, ICONS, MESSAGES, BUTTON_LABELS, GPU_OPTIONS, get_battery_icon, format_currency
 from account_manager import account_manager
 from modal_manager import modal_manager
 from workflow_manager import initialize_workflow_manager, workflow_manager as wf_manager
+from media_encoder import output_encoder
+from gallery import output_gallery
+from job_scheduler import job_scheduler
+from result_cache import result_cache
+from http_client import http_client
+from readiness_prober import readiness_prober
+from health_monitor import health_monitor
+from deployment_pool import deployment_pool
+from idle_manager import idle_manager
+from gpu_advisor import gpu_advisor
+from timer_manager import timer_manager
+from standby_planner import standby_planner
 
 # Import button-based views
-from views import MainControlPanel
+from views import MainControlPanel, TimerView
 
 # Setup logging
 logging.config.dictConfig(config.LOGGING)
@@ -52,10 +67,6 @@ bot = discord.Bot(intents=intents)
 # Initialize workflow manager with bot
 workflow_manager = None
 
-# Track warnings sent (to avoid spam)
-warning_sent = {}
-switch_timers = {}
-
 # ============================================================================
 # BOT EVENTS
 # ============================================================================
@@ -80,6 +91,18 @@ async def on_ready():
         sys.exit(1)
     
     # Start background tasks
+    job_scheduler.start(workflow_manager)
+    
+    # Resume timers from before a restart; their warning buttons keep working
+    timer_manager.register('auto_switch', handle_auto_switch)
+    timer_manager.start()
+    for timer in timer_manager.get_pending('auto_switch'):
+        bot.add_view(TimerView(timer['id']))
+    
+    health_monitor.start(notify_owner)
+    idle_manager.start(notify_owner)
+    standby_planner.start(notify_owner)
+    
     if config.FEATURES['auto_credit_check']:
         credit_checker.start()
         logger.info("Credit checker task started")
@@ -130,26 +153,36 @@ async def credit_checker():
             return
         
         logger.info(f"Account '{active_account['username']}' balance: ${balance:.2f}")
+        standby_planner.record_balance(active_account['username'], balance)
+        username = active_account['username']
+        
+        # A cancelled auto-switch holds until the balance recovers or another account is active
+        if balance >= config.MIN_CREDIT_THRESHOLD:
+            timer_manager.clear_cancelled('auto_switch')
+        else:
+            timer_manager.clear_cancelled('auto_switch', keep_key=username)
         
         # Check if below threshold
         if balance < config.MIN_CREDIT_THRESHOLD:
-            logger.warning(f"Account '{active_account['username']}' below threshold!")
-            
-            # Check if we already sent a warning
-            username = active_account['username']
-            if username not in warning_sent:
-                # Send warning and start timer
-                await send_low_balance_warning(active_account, balance)
-                warning_sent[username] = True
-                
-                # Start 20-minute countdown
-                asyncio.create_task(handle_auto_switch(active_account))
-        
+            logger.warning(f"Account '{username}' below threshold!")
+            
+            last_timer = timer_manager.get_last('auto_switch', username)
+            if last_timer and last_timer['status'] == 'cancelled':
+                logger.info(f"Auto-switch for '{username}' was cancelled, not scheduling it again")
+                return
+            
+            # Schedule the switch once; an existing countdown (also from before a restart) is kept
+            created, timer = timer_manager.schedule(
+                'auto_switch', username, config.SWITCH_WARNING_TIME, {'username': username}
+            )
+            if created:
+                await send_low_balance_warning(active_account, balance, timer['id'])
+    
     except Exception as e:
         logger.error(f"Error in credit checker: {e}")
 
-async def send_low_balance_warning(account: dict, balance: float):
-    """Send low balance warning to owner."""
+async def send_low_balance_warning(account: dict, balance: float, timer_id: int):
+    """Send low balance warning to owner, with buttons to switch now, snooze or cancel."""
     try:
         owner = await bot.fetch_user(int(config.OWNER_ID))
         
@@ -166,7 +199,7 @@ async def send_low_balance_warning(account: dict, balance: float):
         
         embed.add_field(
             name="Next Action",
-            value=f"In **20 minutes**, the bot will:\n"
+            value=f"In **{utils.format_time_remaining(config.SWITCH_WARNING_TIME)}**, the bot will:\n"
                   f"1. Stop ComfyUI on `{account['username']}`\n"
                   f"2. Switch to next available account\n"
                   f"3. Start setup on new account",
@@ -174,25 +207,36 @@ async def send_low_balance_warning(account: dict, balance: float):
         )
         
         if config.FEATURES['send_dm_alerts']:
-            await owner.send(embed=embed)
+            await owner.send(embed=embed, view=TimerView(timer_id))
             logger.info("Sent low balance warning to owner")
-        
+    
     except Exception as e:
         logger.error(f"Failed to send warning: {e}")
 
-async def handle_auto_switch(account: dict):
-    """Handle automatic account switching after 20 minute timer."""
-    username = account['username']
-    logger.info(f"Starting 20-minute countdown for account '{username}'")
+async def handle_auto_switch(payload: dict):
+    """Switch away from a low-balance account when its auto-switch timer is due."""
+    username = payload['username']
+    logger.info(f"Timer expired for '{username}', switching accounts...")
     
-    # Wait 20 minutes
-    await asyncio.sleep(config.SWITCH_WARNING_TIME)
+    # The timer may fire late (snoozed, or resumed after a restart)
+    active_account = account_manager.get_active_account()
+    if active_account and active_account['username'] != username:
+        logger.info(f"'{username}' is no longer the active account, skipping switch")
+        return
     
-    logger.info(f"Timer expired for '{username}', switching accounts...")
+    balance = await modal_manager.check_balance(username)
+    if balance is not None and balance >= config.MIN_CREDIT_THRESHOLD:
+        logger.info(f"'{username}' balance recovered (${balance:.2f}), skipping switch")
+        await notify_owner(
+            f"{ICONS['success']} Auto-Switch Skipped",
+            f"`{username}` has {format_currency(balance)} again, staying on it.",
+            COLORS['success']
+        )
+        return
     
     try:
-        # Stop current ComfyUI
-        await modal_manager.stop_comfyui()
+        # Stop ComfyUI on this account (other deployments keep running)
+        await modal_manager.stop_comfyui(username)
         logger.info(f"Stopped ComfyUI on '{username}'")
         
         # Update status
@@ -221,11 +265,7 @@ async def handle_auto_switch(account: dict):
         
         # Start setup on new account
         await run_full_setup(next_account['username'])
-        
-        # Clear warning flag
-        if username in warning_sent:
-            del warning_sent[username]
-        
+    
     except Exception as e:
         logger.error(f"Error during auto-switch: {e}")
         await notify_owner(
@@ -271,7 +311,7 @@ async def run_full_setup(username: str):
             f"Use `/start` to run ComfyUI.",
             COLORS['success']
         )
-        
+    
     except Exception as e:
         logger.error(f"Error during setup for '{username}': {e}")
         await notify_owner(
@@ -350,6 +390,9 @@ async def list_accounts(ctx: discord.ApplicationContext):
         await ctx.respond("No accounts found. Use `/add_account` to add one!", ephemeral=True)
         return
     
+    # Accounts whose volume was set up for the current manifest skip setup
+    manifest_version = provisioning.manifest_version()
+    
     # Create embed
     embed = discord.Embed(
         title=f"{ICONS['credits']} Modal Accounts",
@@ -373,7 +416,8 @@ async def list_accounts(ctx: discord.ApplicationContext):
         value = (
             f"{status_icon} Status: {status_text}\n"
             f"{battery} Balance: {format_currency(balance)}\n"
-            f"{ICONS['gpu']} GPU: {selected_gpu}"
+            f"{ICONS['gpu']} GPU: {selected_gpu}\n"
+            f"📦 Setup: {'ready' if account['provisioned_version'] == manifest_version else 'needed'}"
         )
         
         embed.add_field(name=username, value=value, inline=True)
@@ -507,6 +551,7 @@ async def check_balance(ctx: discord.ApplicationContext):
     )
     
     for username, balance in balances.items():
+        standby_planner.record_balance(username, balance)
         battery = get_battery_icon(balance)
         account = account_manager.get_account_by_username(username)
         status_icon = ICONS[account['status']]
@@ -544,6 +589,7 @@ async def start_comfyui(ctx: discord.ApplicationContext):
     
     username = active_account['username']
     status = active_account.get('status', 'unknown')
+    idle_manager.record_panel(ctx.channel)
     
     # Create embed with current status
     embed = discord.Embed(
@@ -573,6 +619,8 @@ async def start_comfyui(ctx: discord.ApplicationContext):
     
     await ctx.respond(embed=embed, view=MainControlPanel(bot), ephemeral=False)
     
+    recommended_gpu, comparison = gpu_advisor.recommend()
+    
     # Create GPU selection view
     class GPUSelectView(discord.ui.View):
         def __init__(self):
@@ -581,13 +629,23 @@ async def start_comfyui(ctx: discord.ApplicationContext):
             # Create select menu
             from ui_config import GPU_OPTIONS
             
+            # Measured latency and cost per output for the current workflow mix
+            estimates = {row['gpu']: row for row in comparison}
+            
             options = []
             for gpu in GPU_OPTIONS:
+                eta, _ = readiness_prober.estimate_ready_time(gpu['name'], active_account['username'])
+                ready = f"ready in ~{utils.format_time_remaining(int(eta))}"
+                row = estimates.get(gpu['name'])
+                label = f"{gpu['name']} - ${gpu['price']}/h"
+                if gpu['name'] == recommended_gpu:
+                    label += " (recommended)"
                 options.append(discord.SelectOption(
-                    label=f"{gpu['name']} - ${gpu['price']}/h",
+                    label=label,
                     value=gpu['name'],
                     emoji=gpu['emoji'],
-                    description=f"${gpu['price']} per hour"
+                    description=f"{gpu_advisor.format_estimate(row)}, {ready}" if row
+                                else f"${gpu['price']} per hour, {ready}"
                 ))
             
             select = discord.ui.Select(
@@ -601,13 +659,22 @@ async def start_comfyui(ctx: discord.ApplicationContext):
         async def select_callback(self, interaction: discord.Interaction):
             self.selected_gpu = interaction.data['values'][0]
             
-            await interaction.response.edit_message(
-                content=f"{ICONS['loading']} Starting ComfyUI on {self.selected_gpu}...",
-                view=None
-            )
+            eta = readiness_prober.format_eta(self.selected_gpu, active_account['username'])
+            starting = f"{ICONS['loading']} Starting ComfyUI on {self.selected_gpu}... (expected {eta})"
+            
+            await interaction.response.edit_message(content=starting, view=None)
+            
+            async def on_stage(stage: str, description: str, elapsed: float):
+                await interaction.edit_original_response(
+                    content=f"{starting}\n{description}... ({int(elapsed)}s elapsed)"
+                )
             
             # Start ComfyUI
-            success, msg = await modal_manager.start_comfyui(active_account['username'], self.selected_gpu)
+            success, msg = await modal_manager.start_comfyui(
+                active_account['username'],
+                self.selected_gpu,
+                on_stage=on_stage
+            )
             
             if success:
                 jupyter_url = config.CLOUDFLARE_URLS['jupyter']
@@ -626,6 +693,7 @@ async def start_comfyui(ctx: discord.ApplicationContext):
                 )
                 embed.add_field(name="GPU", value=self.selected_gpu, inline=True)
                 embed.add_field(name="Account", value=active_account['username'], inline=True)
+                embed.set_footer(text=msg)
                 
                 await interaction.edit_original_response(content=None, embed=embed)
             else:
@@ -638,15 +706,18 @@ async def start_comfyui(ctx: discord.ApplicationContext):
     embed = discord.Embed(
         title=f"{ICONS['gpu']} Select GPU",
         description=f"Account: `{active_account['username']}`\n\n"
-                    "Choose a GPU to start ComfyUI:",
+                    + (f"Recommended: **{recommended_gpu}** (cheapest per output within "
+                       f"{config.GPU_ADVISOR['target_latency']}s per job, see `/gpu_advice`)\n\n"
+                       if recommended_gpu else "")
+                    + "Choose a GPU to start ComfyUI:",
         color=COLORS['info']
     )
     
     await ctx.respond(embed=embed, view=view)
 
-@bot.slash_command(name="stop", description="Stop ComfyUI")
+@bot.slash_command(name="stop", description="Stop ComfyUI on all accounts")
 async def stop_comfyui(ctx: discord.ApplicationContext):
-    """Stop the currently running ComfyUI."""
+    """Stop every running ComfyUI deployment."""
     await ctx.defer()
     
     success, msg = await modal_manager.stop_comfyui()
@@ -661,6 +732,123 @@ async def stop_comfyui(ctx: discord.ApplicationContext):
     else:
         await ctx.respond(f"{ICONS['error']} {msg}", ephemeral=True)
 
+@bot.slash_command(name="pool", description="Show ComfyUI deployments on all accounts")
+async def show_pool(ctx: discord.ApplicationContext):
+    """Show every running deployment with its load, GPU and balance."""
+    await ctx.defer(ephemeral=True)
+    
+    deployments = deployment_pool.get_all()
+    embed = discord.Embed(
+        title=f"{ICONS['gpu']} Deployment Pool",
+        description=f"{len(deployments)}/{deployment_pool.get_capacity()} endpoints in use",
+        color=COLORS['info']
+    )
+    
+    loads = await job_scheduler.get_loads()
+    for deployment in deployments:
+        account = account_manager.get_account_by_username(deployment['username'])
+        load = loads.get(deployment['comfyui_url'])
+        routed = deployment in deployment_pool.get_targets()
+        embed.add_field(
+            name=f"{deployment['username']} ({deployment['gpu']})",
+            value=f"**Queue:** {'unreachable' if load is None else f'{load} prompt(s)'}\n"
+                  f"**Balance:** {format_currency(account['balance']) if account else 'unknown'}\n"
+                  f"**Routing:** {'receiving jobs' if routed else 'paused (unhealthy or low balance)'}\n"
+                  f"**ComfyUI:** [Open]({deployment['comfyui_url']})",
+            inline=True
+        )
+    
+    if not deployments:
+        embed.add_field(name="No Deployments", value="Use `/start` or `/pool_add` to run ComfyUI.", inline=False)
+    
+    await ctx.respond(embed=embed, ephemeral=True)
+
+@bot.slash_command(name="pool_add", description="Run ComfyUI on another account alongside the current ones")
+@option("account", description="Account to start on")
+@option(
+    "gpu",
+    description="GPU to use (default: the account's selected GPU)",
+    required=False,
+    default=None,
+    choices=[gpu['name'] for gpu in GPU_OPTIONS]
+)
+async def pool_add(ctx: discord.ApplicationContext, account: str, gpu: str = None):
+    """Add a deployment on another account to share the generation load."""
+    await ctx.defer()
+    
+    status_message = await ctx.respond(f"{ICONS['loading']} Starting ComfyUI on `{account}`...")
+    if isinstance(status_message, discord.Interaction):
+        status_message = await status_message.original_response()
+    
+    async def on_stage(stage: str, description: str, elapsed: float):
+        await status_message.edit(content=f"{ICONS['loading']} `{account}`: {description}... ({int(elapsed)}s elapsed)")
+    
+    success, msg = await modal_manager.add_deployment(account, gpu, on_stage=on_stage)
+    
+    if success:
+        deployment = deployment_pool.get(account)
+        embed = discord.Embed(
+            title=f"{ICONS['success']} Deployment Added",
+            description=msg,
+            color=COLORS['success']
+        )
+        embed.add_field(name="Account", value=account, inline=True)
+        embed.add_field(name="GPU", value=deployment['gpu'], inline=True)
+        embed.add_field(name="Pool", value=f"{len(deployment_pool.get_all())} deployment(s)", inline=True)
+        embed.add_field(name="ComfyUI", value=deployment['comfyui_url'], inline=False)
+        await status_message.edit(content=None, embed=embed)
+    else:
+        await status_message.edit(content=f"{ICONS['error']} {msg}")
+
+@bot.slash_command(name="pool_remove", description="Stop ComfyUI on one account")
+@option("account", description="Account to stop")
+async def pool_remove(ctx: discord.ApplicationContext, account: str):
+    """Stop one deployment, the others keep running."""
+    await ctx.defer()
+    
+    success, msg = await modal_manager.stop_comfyui(account)
+    
+    if success:
+        await ctx.respond(f"{ICONS['stop']} Stopped ComfyUI on `{account}`.")
+    else:
+        await ctx.respond(f"{ICONS['error']} {msg}", ephemeral=True)
+
+@bot.slash_command(name="gpu_advice", description="Compare GPUs by measured latency and cost per output")
+@option("workflow", description="Workflow to plan for (default: queued jobs, else recent runs)", required=False, default=None)
+@option("target_latency", description="Max seconds per job", required=False, default=None, min_value=1)
+async def gpu_advice(ctx: discord.ApplicationContext, workflow: str = None, target_latency: int = None):
+    """Show what each GPU would cost and how fast it would be for a workflow mix."""
+    if target_latency is None:
+        target_latency = config.GPU_ADVISOR['target_latency']
+    
+    recommended, comparison = gpu_advisor.recommend([workflow] if workflow else None, target_latency)
+    
+    if not comparison:
+        await ctx.respond(
+            f"{ICONS['info']} No runtimes recorded yet. Generate something first, then ask again.",
+            ephemeral=True
+        )
+        return
+    
+    mix = gpu_advisor.get_workflow_mix([workflow] if workflow else None)
+    embed = discord.Embed(
+        title=f"{ICONS['gpu']} GPU Advice",
+        description=f"Workflows: {', '.join(f'`{name}` x{count}' for name, count in mix.most_common(5))}\n"
+                    f"Target: {target_latency}s per job\n"
+                    f"Recommended: **{recommended}**",
+        color=COLORS['info']
+    )
+    
+    lines = []
+    for row in comparison:
+        marker = ICONS['success'] if row['latency'] <= target_latency else ICONS['warning']
+        star = " ⭐" if row['gpu'] == recommended else ""
+        lines.append(f"{marker} **{row['gpu']}**{star} (${row['price']}/h): {gpu_advisor.format_estimate(row)}")
+    embed.add_field(name="Per GPU", value="\n".join(lines), inline=False)
+    embed.set_footer(text="(est.) = scaled from other GPUs, not measured on this one")
+    
+    await ctx.respond(embed=embed, ephemeral=True)
+
 @bot.slash_command(name="status", description="Check ComfyUI status")
 async def status(ctx: discord.ApplicationContext):
     """Check current ComfyUI status."""
@@ -698,6 +886,8 @@ async def status(ctx: discord.ApplicationContext):
         embed.add_field(name="ComfyUI URL", value=comfyui_url, inline=False)
         embed.add_field(name="JupyterLab URL", value=config.CLOUDFLARE_URLS['jupyter'], inline=False)
     
+    embed.add_field(name="HTTP Connections", value=http_client.format_stats(), inline=False)
+    
     await ctx.respond(embed=embed)
 
 # ============================================================================
@@ -705,7 +895,18 @@ async def status(ctx: discord.ApplicationContext):
 # ============================================================================
 
 @bot.slash_command(name="generate", description="Generate an image with ComfyUI")
-async def generate(ctx: discord.ApplicationContext):
+@option(
+    "live_preview",
+    description="Show live previews while sampling",
+    required=False,
+    default=config.LIVE_PREVIEW['enabled_by_default']
+)
+@option("use_cache", description="Reuse the output of an identical earlier request", required=False, default=True)
+async def generate(
+    ctx: discord.ApplicationContext,
+    live_preview: bool = config.LIVE_PREVIEW['enabled_by_default'],
+    use_cache: bool = True
+):
     """Generate an image using a workflow."""
     
     # Create modal for generation
@@ -727,34 +928,335 @@ async def generate(ctx: discord.ApplicationContext):
                 style=discord.InputTextStyle.paragraph,
                 max_length=1000
             ))
+            
+            self.add_item(discord.ui.InputText(
+                label="Negative Prompt",
+                placeholder="Leave empty to keep the workflow's negative prompt",
+                required=False,
+                style=discord.InputTextStyle.paragraph,
+                max_length=1000
+            ))
         
         async def callback(self, interaction: discord.Interaction):
             workflow_name = self.children[0].value
             prompt = self.children[1].value
+            negative_prompt = self.children[2].value or None
             
             await interaction.response.defer()
+            idle_manager.record_prompt()
             
-            # Generate
-            success, msg, response = await workflow_manager.generate_with_workflow(workflow_name, prompt)
-            
-            if success:
-                embed = discord.Embed(
-                    title=f"{ICONS['loading']} Generating...",
-                    description=f"Workflow: `{workflow_name}`\n"
-                                f"Prompt: {prompt[:100]}...",
-                    color=COLORS['progress']
-                )
-                await interaction.followup.send(embed=embed)
+            # Requests rendered before are answered right away, without queueing
+            if use_cache:
+                async def send_status():
+                    embed = discord.Embed(
+                        title=f"{ICONS['loading']} Found in Cache",
+                        description=f"Workflow: `{workflow_name}`",
+                        color=COLORS['progress']
+                    )
+                    return await interaction.followup.send(embed=embed, wait=True)
                 
-                # Note: In real implementation, you'd need to poll ComfyUI
-                # for completion and then download the output
-            else:
-                await interaction.followup.send(f"{ICONS['error']} {msg}", ephemeral=True)
+                if await workflow_manager.serve_cached(
+                    workflow_name,
+                    prompt,
+                    params={'negative_prompt': negative_prompt},
+                    guild=interaction.guild,
+                    send_status=send_status
+                ):
+                    return
+            
+            # Check how backed up ComfyUI is before taking the job
+            admitted, lane, notice = await job_scheduler.admit(interaction.user.id, workflow_name)
+            if not admitted:
+                await interaction.followup.send(f"{ICONS['warning']} {notice}", ephemeral=True)
+                return
+            
+            # Start ComfyUI again if it was stopped for being idle, the job waits in the queue
+            resuming, resume_notice = idle_manager.resume_if_stopped()
+            
+            # Status message is updated by the scheduler and the execution tracker
+            embed = discord.Embed(
+                title=f"{ICONS['clock']} Queued",
+                description=f"Workflow: `{workflow_name}`\n"
+                            f"Prompt: {prompt[:100]}...",
+                color=COLORS['progress']
+            )
+            if notice:
+                embed.add_field(name="Busy", value=notice, inline=False)
+            if resuming:
+                embed.add_field(name="Starting", value=resume_notice, inline=False)
+            status_message = await interaction.followup.send(embed=embed, wait=True)
+            
+            # Queue the job, the scheduler submits it when ComfyUI has room
+            success, msg, job = job_scheduler.submit(
+                interaction.user.id,
+                workflow_name,
+                prompt,
+                guild=interaction.guild,
+                status_message=status_message,
+                live_preview=live_preview,
+                lane=lane,
+                params={'negative_prompt': negative_prompt},
+                use_cache=use_cache
+            )
+            
+            if not success:
+                await status_message.edit(content=f"{ICONS['error']} {msg}", embed=None)
+                return
+            
+            position = job_scheduler.get_position(job)
+            if position:
+                embed.add_field(name="Job ID", value=f"`{job['job_id']}`", inline=True)
+                embed.add_field(name="Position", value=f"{position}/{job_scheduler.get_queue_length()}", inline=True)
+                try:
+                    await status_message.edit(embed=embed)
+                except Exception:
+                    pass  # Scheduler may have already picked it up
     
     await ctx.send_modal(GenerateModal())
 
+@bot.slash_command(name="generate_batch", description="Generate several seeds or a parameter sweep of one prompt")
+@option("workflow", description="Workflow name")
+@option("prompt", description="Text prompt")
+@option(
+    "count",
+    description="Number of seeds",
+    required=False,
+    default=config.BATCH['default_count'],
+    min_value=1,
+    max_value=config.BATCH['max_variants']
+)
+@option("seed", description="First seed (default: random)", required=False, default=None)
+@option("sweep", description="Parameters to vary, e.g. steps=20,30; width=512,768", required=False, default=None)
+@option("negative_prompt", description="Negative prompt", required=False, default=None)
+@option("use_cache", description="Reuse outputs of identical earlier requests", required=False, default=True)
+async def generate_batch(
+    ctx: discord.ApplicationContext,
+    workflow: str,
+    prompt: str,
+    count: int = config.BATCH['default_count'],
+    seed: int = None,
+    sweep: str = None,
+    negative_prompt: str = None,
+    use_cache: bool = True
+):
+    """Queue a batch of variants that is posted as one group."""
+    await ctx.defer()
+    
+    try:
+        sweep_values = workflow_manager.parse_sweep(sweep) if sweep else None
+    except ValueError as e:
+        await ctx.respond(f"{ICONS['error']} {e}", ephemeral=True)
+        return
+    
+    if seed is None:
+        seed = random.randint(0, 2**32 - 1)
+    seeds = list(range(seed, seed + count))
+    
+    variants = workflow_manager.build_variants(seeds, sweep_values)
+    if len(variants) > config.BATCH['max_variants']:
+        await ctx.respond(
+            f"{ICONS['error']} That's {len(variants)} variants (max: {config.BATCH['max_variants']}).",
+            ephemeral=True
+        )
+        return
+    
+    idle_manager.record_prompt()
+    admitted, lane, notice = await job_scheduler.admit(ctx.author.id, workflow)
+    if not admitted:
+        await ctx.respond(f"{ICONS['warning']} {notice}", ephemeral=True)
+        return
+    
+    resuming, resume_notice = idle_manager.resume_if_stopped()
+    
+    embed = discord.Embed(
+        title=f"{ICONS['clock']} Batch Queued",
+        description=f"Workflow: `{workflow}`\n"
+                    f"Prompt: {prompt[:100]}...\n"
+                    f"Variants: {len(variants)} (seeds {seeds[0]}-{seeds[-1]})",
+        color=COLORS['progress']
+    )
+    if notice:
+        embed.add_field(name="Busy", value=notice, inline=False)
+    if resuming:
+        embed.add_field(name="Starting", value=resume_notice, inline=False)
+    status_message = await ctx.respond(embed=embed)
+    if isinstance(status_message, discord.Interaction):
+        status_message = await status_message.original_response()
+    
+    success, msg, job = job_scheduler.submit(
+        ctx.author.id,
+        workflow,
+        prompt,
+        guild=ctx.guild,
+        status_message=status_message,
+        lane=lane,
+        params={'negative_prompt': negative_prompt},
+        batch={'seeds': seeds, 'sweep': sweep_values},
+        use_cache=use_cache
+    )
+    
+    if not success:
+        await status_message.edit(content=f"{ICONS['error']} {msg}", embed=None)
+
+@bot.slash_command(name="queue", description="Show your queued generation jobs")
+async def show_queue(ctx: discord.ApplicationContext):
+    """Show the user's jobs and their queue positions."""
+    jobs = job_scheduler.get_user_jobs(ctx.author.id)
+    
+    embed = discord.Embed(
+        title=f"{ICONS['clock']} Generation Queue",
+        description=f"{job_scheduler.get_queue_length()} job(s) waiting, "
+                    f"{len(job_scheduler.in_flight)} running",
+        color=COLORS['info']
+    )
+    
+    if not jobs:
+        embed.add_field(name="Your Jobs", value="You have no queued jobs.", inline=False)
+    
+    for job in jobs:
+        if job['state'] == 'queued':
+            state = f"Position {job_scheduler.get_position(job)}"
+        else:
+            state = "Generating"
+        kind = "Batch" if job['batch'] else "Job"
+        embed.add_field(
+            name=f"{kind} {job['job_id']} - {job['workflow_name']}",
+            value=f"{state} ({job['lane']} lane)\n{job['prompt'][:80]}",
+            inline=False
+        )
+    
+    await ctx.respond(embed=embed, ephemeral=True)
+
+@bot.slash_command(name="cancel", description="Cancel your generation jobs")
+@option("job_id", description="Job to cancel (default: all your jobs)", required=False, default=None)
+async def cancel_job(ctx: discord.ApplicationContext, job_id: int = None):
+    """Cancel one or all of the user's jobs."""
+    await ctx.defer(ephemeral=True)
+    
+    if job_id is None:
+        cancelled = await job_scheduler.cancel_user_jobs(ctx.author.id)
+        await ctx.respond(f"{ICONS['stop']} Cancelled {cancelled} job(s).", ephemeral=True)
+        return
+    
+    job = next((j for j in job_scheduler.get_user_jobs(ctx.author.id) if j['job_id'] == job_id), None)
+    if not job:
+        await ctx.respond(f"{ICONS['error']} You have no job with ID {job_id}.", ephemeral=True)
+        return
+    
+    if await job_scheduler.cancel(job):
+        await ctx.respond(f"{ICONS['stop']} Cancelled job {job_id}.", ephemeral=True)
+    else:
+        await ctx.respond(f"{ICONS['error']} Job {job_id} already finished.", ephemeral=True)
+
+@bot.slash_command(name="cache_stats", description="Show result cache statistics")
+@option("clear", description="Clear the cache (owner only)", required=False, default=False)
+async def cache_stats(ctx: discord.ApplicationContext, clear: bool = False):
+    """Show how often identical requests were served from the result cache."""
+    if clear:
+        if str(ctx.author.id) != str(config.OWNER_ID):
+            await ctx.respond(f"{ICONS['error']} Only the owner can clear the cache.", ephemeral=True)
+            return
+        removed = result_cache.clear()
+        await ctx.respond(f"{ICONS['success']} Cleared {removed} cache entries.", ephemeral=True)
+        return
+    
+    stats = result_cache.get_stats()
+    
+    embed = discord.Embed(
+        title=f"{ICONS['info']} Result Cache",
+        description="Enabled" if config.RESULT_CACHE['enabled'] else "Disabled",
+        color=COLORS['info']
+    )
+    embed.add_field(name="Entries", value=str(stats['entries']), inline=True)
+    embed.add_field(
+        name="Hit Rate",
+        value=f"{stats['hit_rate']:.0%} ({stats['hits']}/{stats['lookups']} since start)",
+        inline=True
+    )
+    embed.add_field(name="Total Hits", value=str(stats['total_hits']), inline=True)
+    embed.add_field(name="GPU Time Saved", value=utils.format_time_remaining(int(stats['seconds_saved'])), inline=True)
+    
+    await ctx.respond(embed=embed, ephemeral=True)
+
+@bot.slash_command(name="health", description="Show deployment health")
+async def health(ctx: discord.ApplicationContext):
+    """Show probe latencies, error rates and the monitor's state per deployment."""
+    if not modal_manager.current_deployment:
+        await ctx.respond(f"{ICONS['info']} No deployment is running.", ephemeral=True)
+        return
+    
+    summary = health_monitor.get_summary()
+    unhealthy = [username for username, state in summary.items() if state['incident_open']]
+    
+    embed = discord.Embed(
+        title=f"{ICONS['info']} Deployment Health",
+        description=f"{len(unhealthy)} of {len(deployment_pool.get_all())} deployment(s) unhealthy"
+                    if unhealthy else f"{ICONS['success']} All deployments healthy",
+        color=COLORS['warning'] if unhealthy else COLORS['success']
+    )
+    
+    for deployment in deployment_pool.get_all():
+        username = deployment['username']
+        state = summary.get(username)
+        if not state:
+            value = "No checks yet"
+        else:
+            if state['restarting']:
+                status = f"{ICONS['loading']} Restarting"
+            elif state['incident_open']:
+                status = f"{ICONS['warning']} Unhealthy ({state['failed_checks']} failed checks)"
+            else:
+                status = f"{ICONS['success']} Healthy"
+            value = f"{status}\n**ComfyUI:** {state['comfyui']}\n**JupyterLab:** {state['jupyter']}"
+            if state['hung']:
+                value += "\nPrompts pending with nothing executing"
+        embed.add_field(name=f"{username} ({deployment['gpu']})", value=value, inline=False)
+    
+    await ctx.respond(embed=embed, ephemeral=True)
+
+@bot.slash_command(name="standby", description="Show the balance forecast and standby accounts")
+async def standby(ctx: discord.ApplicationContext):
+    """Show when running accounts deplete and which accounts are ready to take over."""
+    forecasts = standby_planner.get_forecasts()
+    ready, building, candidates = standby_planner.get_standbys()
+    lead_time = standby_planner.get_lead_time()
+    
+    embed = discord.Embed(
+        title=f"{ICONS['info']} Standby Accounts",
+        description=f"Standbys are set up on {config.SETUP_GPU} once an account is within "
+                    f"{utils.format_time_remaining(int(lead_time))} of ${config.MIN_CREDIT_THRESHOLD:.2f} "
+                    f"(keeping {config.STANDBY_POLICY['standby_count']} ready)",
+        color=COLORS['info']
+    )
+    
+    if not forecasts:
+        embed.add_field(name="Forecast", value="No deployment is running.", inline=False)
+    for forecast in forecasts:
+        if forecast['seconds_left'] is None:
+            value = "Not spending credits"
+        else:
+            soon = forecast['seconds_left'] <= lead_time
+            value = (
+                f"{format_currency(forecast['balance'])} at {format_currency(forecast['burn_rate'])}/h\n"
+                f"{ICONS['warning'] if soon else ICONS['success']} Below threshold in "
+                f"~{utils.format_time_remaining(int(forecast['seconds_left']))}"
+            )
+        embed.add_field(name=f"{forecast['username']} ({forecast['gpu']})", value=value, inline=False)
+    
+    lines = [f"{ICONS['ready']} `{account['username']}` ready ({format_currency(account['balance'])})" for account in ready]
+    lines += [f"{ICONS['building']} `{username}` setting up" for username in building]
+    if not lines:
+        lines = ["None yet"]
+    if candidates:
+        lines.append(f"Next to set up: `{candidates[0]['username']}`")
+    embed.add_field(name="Standbys", value="\n".join(lines), inline=False)
+    
+    await ctx.respond(embed=embed, ephemeral=True)
+
 @bot.slash_command(name="list_outputs", description="List generated outputs")
-async def list_outputs(ctx: discord.ApplicationContext):
+@option("gallery", description="Show thumbnail contact sheets instead of filenames", required=False, default=False)
+@option("page", description="Gallery page to open", required=False, default=1, min_value=1)
+async def list_outputs(ctx: discord.ApplicationContext, gallery: bool = False, page: int = 1):
     """List all output files."""
     await ctx.defer()
     
@@ -764,6 +1266,10 @@ async def list_outputs(ctx: discord.ApplicationContext):
         await ctx.respond("No outputs found.", ephemeral=True)
         return
     
+    if gallery:
+        await send_output_gallery(ctx, outputs, page)
+        return
+    
     # Create embed with list of outputs
     embed = discord.Embed(
         title=f"{ICONS['folder']} Generated Outputs",
@@ -776,39 +1282,124 @@ async def list_outputs(ctx: discord.ApplicationContext):
         embed.add_field(name=output, value="Use `/get_output` to download", inline=False)
     
     if len(outputs) > 25:
-        embed.set_footer(text=f"Showing 25 of {len(outputs)} files")
+        embed.set_footer(text=f"Showing 25 of {len(outputs)} files • Use gallery:True to browse all")
     
     await ctx.respond(embed=embed)
 
+def build_gallery_embed(outputs: list, page: int, page_count: int) -> discord.Embed:
+    """Build the embed shown above a gallery contact sheet."""
+    per_page = config.GALLERY['per_page']
+    start = (page - 1) * per_page
+    
+    lines = [
+        f"`#{start + i + 1}` {utils.truncate_string(name, 60)}"
+        for i, name in enumerate(outputs[start:start + per_page])
+    ]
+    
+    embed = discord.Embed(
+        title=f"{ICONS['folder']} Output Gallery",
+        description="\n".join(lines),
+        color=COLORS['info']
+    )
+    embed.set_image(url="attachment://gallery.webp")
+    embed.set_footer(text=f"Page {page}/{page_count} • {len(outputs)} files • Use /get_output to download")
+    return embed
+
+async def send_output_gallery(ctx: discord.ApplicationContext, outputs: list, page: int):
+    """Send a paged gallery of output thumbnails."""
+    page_count = output_gallery.get_page_count(len(outputs))
+    page = min(max(1, page), page_count)
+    
+    sheet = await output_gallery.render_page(outputs, page)
+    if not sheet:
+        await ctx.respond(f"{ICONS['error']} Failed to build gallery", ephemeral=True)
+        return
+    
+    # Page navigation buttons
+    class GalleryView(discord.ui.View):
+        def __init__(self):
+            super().__init__(timeout=300)
+            self.page = page
+            self.update_buttons()
+        
+        def update_buttons(self):
+            self.previous_button.disabled = self.page <= 1
+            self.next_button.disabled = self.page >= page_count
+        
+        async def show_page(self, interaction: discord.Interaction, new_page: int):
+            await interaction.response.defer()
+            
+            new_sheet = await output_gallery.render_page(outputs, new_page)
+            if not new_sheet:
+                await interaction.followup.send(f"{ICONS['error']} Failed to build page {new_page}", ephemeral=True)
+                return
+            
+            self.page = new_page
+            self.update_buttons()
+            
+            await interaction.edit_original_response(
+                embed=build_gallery_embed(outputs, self.page, page_count),
+                file=discord.File(new_sheet, filename="gallery.webp"),
+                attachments=[],
+                view=self
+            )
+        
+        @discord.ui.button(label="◀️ Previous", style=discord.ButtonStyle.secondary)
+        async def previous_button(self, button: discord.ui.Button, interaction: discord.Interaction):
+            await self.show_page(interaction, self.page - 1)
+        
+        @discord.ui.button(label="Next ▶️", style=discord.ButtonStyle.secondary)
+        async def next_button(self, button: discord.ui.Button, interaction: discord.Interaction):
+            await self.show_page(interaction, self.page + 1)
+    
+    await ctx.respond(
+        embed=build_gallery_embed(outputs, page, page_count),
+        file=discord.File(sheet, filename="gallery.webp"),
+        view=GalleryView()
+    )
+
 @bot.slash_command(name="get_output", description="Download an output file")
 @option("filename", description="Output filename", required=True)
 async def get_output(ctx: discord.ApplicationContext, filename: str):
     """Download an output file."""
     await ctx.defer()
     
-    # Download file
-    file_path = await modal_manager.get_output_file(filename)
+    # Fetch file (streamed from ComfyUI if running, otherwise from the volume)
+    output = await modal_manager.open_output(filename)
     
-    if not file_path:
+    if not output:
         await ctx.respond(f"{ICONS['error']} File not found: {filename}", ephemeral=True)
         return
     
-    # Check size
-    size_mb = utils.get_file_size_mb(file_path)
-    if size_mb > config.MAX_DISCORD_FILE_SIZE:
-        await ctx.respond(
-            f"{ICONS['error']} File too large: {size_mb:.1f}MB (max: {config.MAX_DISCORD_FILE_SIZE}MB)",
-            ephemeral=True
-        )
-        return
-    
-    # Send file
     try:
-        file = discord.File(file_path)
+        # Check size (re-encode oversized outputs so they fit)
+        size_mb = utils.get_stream_size(output) / (1024 * 1024)
+        if size_mb > config.MAX_DISCORD_FILE_SIZE:
+            encoded = await output_encoder.fit_for_discord(output, filename)
+            
+            if not encoded:
+                await ctx.respond(
+                    f"{ICONS['error']} File too large: {size_mb:.1f}MB (max: {config.MAX_DISCORD_FILE_SIZE}MB)",
+                    ephemeral=True
+                )
+                return
+            
+            encoded_path, upload_filename = encoded
+            file = discord.File(encoded_path, filename=upload_filename)
+            await ctx.respond(
+                f"{ICONS['info']} Re-encoded to fit Discord (original: {size_mb:.1f}MB)",
+                file=file
+            )
+            return
+        
+        # Send file
+        file = discord.File(output, filename=filename)
         await ctx.respond(file=file)
     except Exception as e:
         logger.error(f"Failed to send file: {e}")
         await ctx.respond(f"{ICONS['error']} Failed to send file", ephemeral=True)
+    finally:
+        output.close()
 
 # ============================================================================
 # SETUP COMMANDS
@@ -842,6 +1433,152 @@ async def setup(ctx: discord.ApplicationContext):
     # Run setup in background
     asyncio.create_task(run_full_setup(active_account['username']))
 
+SETUP_STATES = {
+    'queued': f"{ICONS['clock']} queued",
+    'checking': f"{ICONS['loading']} checking",
+    'step1': f"{ICONS['building']} step 1",
+    'step2': f"{ICONS['building']} step 2",
+    'skipped': f"{ICONS['success']} already set up",
+    'done': f"{ICONS['success']} done",
+    'failed': f"{ICONS['error']} failed",
+}
+
+def build_setup_all_embed(progress: dict, started_at: float, max_parallel: int) -> discord.Embed:
+    """Build the /setup_all progress table (and the timing summary once every build finished)."""
+    now = time.time()
+    finished = all(entry['finished_at'] for entry in progress.values())
+    failed = [username for username, entry in progress.items() if entry['state'] == 'failed']
+    
+    lines = []
+    for username, entry in progress.items():
+        if entry['started_at']:
+            elapsed = utils.format_time_remaining(int((entry['finished_at'] or now) - entry['started_at']))
+        else:
+            elapsed = "-"
+        lines.append(f"{username:<16} {SETUP_STATES[entry['state']]:<18} {elapsed}")
+    
+    if not finished:
+        title, color = f"{ICONS['building']} Setting Up {len(progress)} Account(s)", COLORS['building']
+    elif failed:
+        title, color = f"{ICONS['warning']} Setup Finished With Errors", COLORS['warning']
+    else:
+        title, color = f"{ICONS['success']} Setup Complete", COLORS['success']
+    
+    embed = discord.Embed(
+        title=title,
+        description="```\n" + "\n".join(lines) + "\n```",
+        color=color
+    )
+    
+    wall_clock = now - started_at
+    embed.add_field(name="Wall Clock", value=utils.format_time_remaining(int(wall_clock)), inline=True)
+    embed.add_field(name="Parallel Builds", value=str(max_parallel), inline=True)
+    if finished:
+        # One after another, the builds would have taken the sum of their durations
+        serial = sum(entry['finished_at'] - entry['started_at'] for entry in progress.values())
+        speedup = f" ({serial / wall_clock:.1f}x faster)" if wall_clock > 0 else ""
+        embed.add_field(name="Serial Estimate", value=utils.format_time_remaining(int(serial)) + speedup, inline=True)
+        for username in failed:
+            embed.add_field(name=f"{username} failed", value=progress[username]['message'][:1000], inline=False)
+    
+    return embed
+
+@bot.slash_command(name="setup_all", description="Set up every account that isn't provisioned yet, in parallel")
+@option(
+    "parallel",
+    description="Accounts set up at the same time",
+    required=False,
+    default=config.SETUP_ALL['max_parallel'],
+    min_value=1,
+    max_value=config.MAX_ACCOUNTS
+)
+async def setup_all(ctx: discord.ApplicationContext, parallel: int = config.SETUP_ALL['max_parallel']):
+    """Run setup on all ready but unprovisioned accounts at once, with a progress table."""
+    await ctx.defer()
+    
+    # Anything being built already (e.g. a standby) or running ComfyUI is left alone
+    manifest_version = provisioning.manifest_version()
+    usernames = [
+        account['username'] for account in account_manager.get_all_accounts()
+        if account['status'] == 'ready'
+        and not account['is_active']
+        and account['provisioned_version'] != manifest_version
+        and not deployment_pool.get(account['username'])
+        and account['username'] not in modal_manager.setting_up
+    ]
+    
+    if not usernames:
+        await ctx.respond(f"{ICONS['success']} Every ready account is already set up.", ephemeral=True)
+        return
+    
+    await ctx.respond(
+        f"{ICONS['building']} Setting up {len(usernames)} account(s) on {config.SETUP_GPU}, "
+        f"{min(parallel, len(usernames))} at a time. I'll notify you when all of them finish."
+    )
+    
+    progress = {}
+    started_at = time.time()
+    build = asyncio.create_task(modal_manager.deploy_setup_many(usernames, parallel, progress))
+    await asyncio.sleep(0)  # Let the builds register before the first table
+    
+    # Setup takes hours, longer than an interaction can be edited, so the table is a channel message
+    message = await ctx.channel.send(embed=build_setup_all_embed(progress, started_at, parallel))
+    while not build.done():
+        await asyncio.wait({build}, timeout=config.SETUP_ALL['progress_interval'])
+        try:
+            await message.edit(embed=build_setup_all_embed(progress, started_at, parallel))
+        except Exception as e:
+            logger.warning(f"Failed to update setup progress: {e}")
+    
+    embed = build_setup_all_embed(progress, started_at, parallel)
+    summary = "\n".join(f"**{field.name}:** {field.value}" for field in embed.fields)
+    await notify_owner(embed.title, f"{embed.description}\n{summary}", embed.color.value)
+
+@bot.slash_command(name="verify_models", description="Check the models on an account's volume for corrupt or missing files")
+@option("account", description="Account to check (default: active account)", required=False, default=None)
+@option("recheck", description="Verify again now instead of showing the last report", required=False, default=True)
+async def verify_models(ctx: discord.ApplicationContext, account: str = None, recheck: bool = True):
+    """Report corrupt (truncated, bad header or checksum) and missing models."""
+    await ctx.defer(ephemeral=True)
+    
+    if account is None:
+        active_account = account_manager.get_active_account()
+        if not active_account:
+            await ctx.respond(f"{ICONS['error']} No active account.", ephemeral=True)
+            return
+        account = active_account['username']
+    
+    if recheck:
+        await ctx.respond(f"{ICONS['loading']} Verifying models on `{account}` (only changed files are re-hashed)...", ephemeral=True)
+    
+    success, msg, report = await modal_manager.verify_models(account, recheck)
+    
+    if not success:
+        await ctx.respond(f"{ICONS['error']} {msg}", ephemeral=True)
+        return
+    
+    healthy = not report['corrupt'] and not report['missing']
+    checked = datetime.fromtimestamp(report['checked_at']).strftime('%Y-%m-%d %H:%M')
+    embed = discord.Embed(
+        title=f"{ICONS['success'] if healthy else ICONS['warning']} Model Integrity: {account}",
+        description=f"{msg}\nChecked {checked} ({report['hashed']} file(s) hashed in {int(report['seconds'])}s)",
+        color=COLORS['success'] if healthy else COLORS['warning']
+    )
+    
+    for key, title in (('corrupt', "Corrupt"), ('missing', "Missing")):
+        if report[key]:
+            lines = [f"`{problem['id']}`: {problem['error']}" for problem in report[key]]
+            embed.add_field(
+                name=f"{title} ({len(lines)})",
+                value=utils.truncate_string("\n".join(lines), 1024),
+                inline=False
+            )
+    
+    if not healthy:
+        embed.set_footer(text="Run /setup to download them again")
+    
+    await ctx.respond(embed=embed, ephemeral=True)
+
 # ============================================================================
 # ADMIN COMMANDS
 # ============================================================================
@@ -862,6 +1599,17 @@ async def refresh_channels(ctx: discord.ApplicationContext):
 # RUN BOT
 # ============================================================================
 
+async def run_bot():
+    """Run the bot and release shared resources when it stops."""
+    try:
+        # Entering the client binds it (and its HTTP rate limiter) to this loop;
+        # bot.start() alone keeps the loop from import time, which never runs
+        async with bot:
+            await bot.start(config.DISCORD_TOKEN)
+    finally:
+        await http_client.close()
+        utils.shutdown_process_pool()
+
 def main():
     """Main entry point."""
     # Check token
@@ -872,9 +1620,17 @@ def main():
     # Initialize config
     config.initialize()
     
+    # A published key protects nothing: move the stored tokens to a new one
+    if utils.is_leaked_encryption_key():
+        logger.warning("The encryption key is a published one, rotating it")
+        success, msg = account_manager.rotate_encryption_key()
+        if not success:
+            logger.error(f"Could not rotate the encryption key: {msg}")
+            sys.exit(1)
+    
     # Run bot
     logger.info("Starting bot...")
-    bot.run(config.DISCORD_TOKEN)
+    asyncio.run(run_bot())
 
 if __name__ == "__main__":
     main()
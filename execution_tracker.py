@@ -0,0 +1,419 @@
+"""
+Execution Tracker Module
+========================
+Follows ComfyUI prompt execution over the /ws websocket:
+- One persistent socket per ComfyUI server serves every in-flight prompt
+- Maps prompt_id -> originating job (workflow, prompt, Discord context)
+- Tracks executing/progress/executed events and collects outputs
+- Routes latent preview frames to the job's preview streamer
+- Measures queue time and execution time
+- Calls the job's completion callback when a prompt finishes
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+import aiohttp
+import config
+import utils
+from http_client import http_client
+from preview_streamer import decode_preview_frame
+
+logger = logging.getLogger(__name__)
+
+# Output keys that ComfyUI uses for files in 'executed' messages
+OUTPUT_KEYS = ['images', 'gifs', 'videos']
+
+# ============================================================================
+# EXECUTION TRACKER CLASS
+# ============================================================================
+
+class ExecutionTracker:
+    """Tracks ComfyUI prompt execution through websocket events."""
+    
+    def __init__(self):
+        """Initialize execution tracker."""
+        self.client_id = uuid.uuid4().hex  # Sent with every /prompt so events come to us
+        self.jobs: Dict[str, Dict[str, Any]] = {}  # Maps prompt_id -> job
+        self.queue_remaining: Dict[str, int] = {}  # Maps base_url -> last reported queue size
+        self.executing: Dict[str, str] = {}  # Maps base_url -> prompt_id currently executing
+        self._sockets: Dict[str, asyncio.Task] = {}  # Maps base_url -> socket task
+        self._connected: Dict[str, asyncio.Event] = {}
+        self._early_events: OrderedDict = OrderedDict()  # prompt_id -> events seen before track()
+        self._tasks: set = set()  # Background tasks (replays, timeouts, callbacks), kept referenced until done
+    
+    # ========================================================================
+    # CONNECTION MANAGEMENT
+    # ========================================================================
+    
+    def get_ws_url(self, base_url: str) -> str:
+        """Get the websocket URL for a ComfyUI server."""
+        url = base_url.rstrip('/') + config.COMFYUI_API['ws']
+        if url.startswith('https://'):
+            return 'wss://' + url[len('https://'):]
+        if url.startswith('http://'):
+            return 'ws://' + url[len('http://'):]
+        return url
+    
+    async def ensure_connected(self, base_url: str, timeout: float = 10) -> bool:
+        """
+        Make sure the websocket to a ComfyUI server is open.
+        
+        Call this before submitting a prompt so no events are missed.
+        
+        Returns:
+            True if connected, False if it didn't connect in time
+        """
+        task = self._sockets.get(base_url)
+        if task is None or task.done():
+            self._connected[base_url] = asyncio.Event()
+            self._sockets[base_url] = asyncio.create_task(self._socket_loop(base_url))
+        
+        try:
+            await asyncio.wait_for(self._connected[base_url].wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Websocket to {base_url} not connected after {timeout}s")
+            return False
+    
+    async def disconnect(self, base_url: str):
+        """Close the websocket to a ComfyUI server (e.g. when it is stopped)."""
+        task = self._sockets.pop(base_url, None)
+        self._connected.pop(base_url, None)
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        logger.info(f"Websocket to {base_url} closed")
+    
+    def _has_jobs(self, base_url: str) -> bool:
+        """Check if any in-flight job runs on a ComfyUI server."""
+        return any(job['base_url'] == base_url for job in self.jobs.values())
+    
+    async def _socket_loop(self, base_url: str):
+        """Keep a websocket open to a ComfyUI server and dispatch its events."""
+        ws_url = self.get_ws_url(base_url)
+        delay = 1
+        
+        while True:
+            try:
+                session = http_client.get_session()
+                async with session.ws_connect(
+                    ws_url,
+                    params={'clientId': self.client_id},
+                    heartbeat=config.EXECUTION_TRACKER['heartbeat'],
+                    max_msg_size=0
+                ) as ws:
+                    logger.info(f"Websocket connected: {ws_url}")
+                    self._connected[base_url].set()
+                    delay = 1
+                    
+                    # Catch up on prompts that finished while we were disconnected
+                    await self._recover_from_history(base_url)
+                    
+                    async for message in ws:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            await self._handle_event(base_url, json.loads(message.data))
+                        elif message.type == aiohttp.WSMsgType.BINARY:
+                            self._handle_binary(base_url, message.data)
+                        elif message.type == aiohttp.WSMsgType.ERROR:
+                            break
+                
+                logger.warning(f"Websocket closed: {ws_url}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Websocket error on {ws_url}: {e}")
+            
+            self._connected[base_url].clear()
+            
+            # Nothing to track, reconnect lazily on the next prompt
+            if not self._has_jobs(base_url):
+                self._sockets.pop(base_url, None)
+                return
+            
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, config.EXECUTION_TRACKER['reconnect_max_delay'])
+    
+    # ========================================================================
+    # JOB REGISTRATION
+    # ========================================================================
+    
+    def track(
+        self,
+        prompt_id: str,
+        base_url: str,
+        on_finish: Callable[[Dict[str, Any]], Awaitable[None]] = None,
+        **info
+    ) -> Dict[str, Any]:
+        """
+        Start tracking a submitted prompt.
+        
+        Args:
+            prompt_id: Prompt ID returned by ComfyUI's /prompt
+            base_url: ComfyUI server the prompt was sent to
+            on_finish: Coroutine called with the job when it finishes or fails
+            **info: Extra job data (workflow name, prompt, Discord context, ...)
+        
+        Returns:
+            Job dict
+        """
+        job = {
+            'prompt_id': prompt_id,
+            'base_url': base_url,
+            'status': 'queued',  # queued -> running -> success / error
+            'submitted_at': time.monotonic(),
+            'started_at': None,
+            'finished_at': None,
+            'current_node': None,
+            'progress': None,  # (value, max) of the running node
+            'outputs': [],
+            'error': None,
+            'on_finish': on_finish,
+            **info,
+        }
+        self.jobs[prompt_id] = job
+        
+        loop = asyncio.get_running_loop()
+        loop.call_later(config.EXECUTION_TRACKER['job_timeout'], self._expire_job, prompt_id)
+        
+        logger.info(f"Tracking prompt {prompt_id} on {base_url}")
+        
+        # Replay events that arrived before the prompt was registered
+        early_events = self._early_events.pop(prompt_id, [])
+        if early_events:
+            self._spawn(self._replay_events(base_url, early_events), f"Replaying events for prompt {prompt_id}")
+        
+        return job
+    
+    async def discard(self, prompt_id: str):
+        """Stop tracking a prompt without finishing it (its callback never runs)."""
+        job = self.jobs.pop(prompt_id, None)
+        if job and job.get('preview'):
+            await job['preview'].close()
+    
+    def get_job(self, prompt_id: str) -> Optional[Dict[str, Any]]:
+        """Get an in-flight job by prompt ID."""
+        return self.jobs.get(prompt_id)
+    
+    def get_queue_time(self, job: Dict[str, Any]) -> Optional[float]:
+        """Get how long a job waited in ComfyUI's queue (in seconds)."""
+        if job['started_at'] is None:
+            return None
+        return job['started_at'] - job['submitted_at']
+    
+    def get_execution_time(self, job: Dict[str, Any]) -> Optional[float]:
+        """Get how long a job took to execute (in seconds)."""
+        if job['started_at'] is None or job['finished_at'] is None:
+            return None
+        return job['finished_at'] - job['started_at']
+    
+    def _expire_job(self, prompt_id: str):
+        """Fail a job that has been running longer than job_timeout."""
+        job = self.jobs.get(prompt_id)
+        if job:
+            logger.warning(f"Prompt {prompt_id} timed out")
+            self._spawn(self._finish(job, error="Timed out waiting for ComfyUI"), f"Expiring prompt {prompt_id}")
+    
+    # ========================================================================
+    # EVENT HANDLING
+    # ========================================================================
+    
+    def _buffer_early_event(self, prompt_id: str, event: Dict[str, Any]):
+        """Keep an event for a prompt that hasn't been registered yet."""
+        self._early_events.setdefault(prompt_id, []).append(event)
+        self._early_events.move_to_end(prompt_id)
+        
+        while len(self._early_events) > config.EXECUTION_TRACKER['early_event_buffer']:
+            self._early_events.popitem(last=False)
+    
+    async def _replay_events(self, base_url: str, events: List[Dict[str, Any]]):
+        """Handle buffered events in the order they arrived."""
+        for event in events:
+            await self._handle_event(base_url, event)
+    
+    async def _handle_event(self, base_url: str, event: Dict[str, Any]):
+        """Handle a JSON websocket event from ComfyUI."""
+        event_type = event.get('type')
+        data = event.get('data') or {}
+        
+        if event_type == 'status':
+            exec_info = data.get('status', {}).get('exec_info', {})
+            if 'queue_remaining' in exec_info:
+                self.queue_remaining[base_url] = exec_info['queue_remaining']
+            return
+        
+        prompt_id = data.get('prompt_id')
+        if not prompt_id:
+            return
+        
+        job = self.jobs.get(prompt_id)
+        if not job:
+            self._buffer_early_event(prompt_id, event)
+            return
+        
+        if event_type == 'execution_start':
+            self.executing[base_url] = prompt_id
+            self._mark_started(job)
+        
+        elif event_type == 'executing':
+            node = data.get('node')
+            if node is None:
+                # Older ComfyUI versions signal completion this way
+                await self._finish(job)
+            else:
+                self.executing[base_url] = prompt_id
+                self._mark_started(job)
+                job['current_node'] = node
+                job['progress'] = None
+        
+        elif event_type == 'progress':
+            self._mark_started(job)
+            job['progress'] = (data.get('value', 0), data.get('max', 0))
+            if job.get('preview'):
+                job['preview'].update_progress(job)
+        
+        elif event_type == 'executed':
+            self._collect_outputs(job, data.get('output') or {})
+        
+        elif event_type == 'execution_success':
+            await self._finish(job)
+        
+        elif event_type == 'execution_error':
+            message = data.get('exception_message') or 'Unknown error'
+            node_type = data.get('node_type')
+            error = f"{node_type}: {message}" if node_type else message
+            await self._finish(job, error=error.strip())
+        
+        elif event_type == 'execution_interrupted':
+            await self._finish(job, error="Execution was interrupted")
+    
+    def _handle_binary(self, base_url: str, data: bytes):
+        """Handle a binary websocket message from ComfyUI (latent preview frames)."""
+        frame = decode_preview_frame(data)
+        if not frame:
+            return
+        
+        image, extension, prompt_id = frame
+        
+        # Frames without metadata belong to whatever is executing on that server
+        job = self.jobs.get(prompt_id or self.executing.get(base_url))
+        if job and job.get('preview'):
+            job['preview'].offer_frame(image, extension)
+    
+    def _mark_started(self, job: Dict[str, Any]):
+        """Record when a job left the queue and started executing."""
+        if job['started_at'] is None:
+            job['started_at'] = time.monotonic()
+            job['status'] = 'running'
+            logger.info(
+                f"Prompt {job['prompt_id']} started after "
+                f"{self.get_queue_time(job):.1f}s in queue"
+            )
+    
+    def _collect_outputs(self, job: Dict[str, Any], output: Dict[str, Any]):
+        """Collect output files from an 'executed' event (or history entry)."""
+        for key in OUTPUT_KEYS:
+            for item in output.get(key, []):
+                # Skip previews, only keep files saved to the output folder
+                if item.get('type', 'output') != 'output':
+                    continue
+                
+                entry = {
+                    'filename': item['filename'],
+                    'subfolder': item.get('subfolder', ''),
+                    'type': item.get('type', 'output'),
+                }
+                if entry not in job['outputs']:
+                    job['outputs'].append(entry)
+    
+    async def _finish(self, job: Dict[str, Any], error: str = None):
+        """Mark a job as finished and run its completion callback."""
+        if self.jobs.pop(job['prompt_id'], None) is None:
+            return  # Already finished
+        
+        job['finished_at'] = time.monotonic()
+        if job['started_at'] is None:
+            job['started_at'] = job['finished_at']  # Fully cached prompt
+        job['status'] = 'error' if error else 'success'
+        job['error'] = error
+        
+        if self.executing.get(job['base_url']) == job['prompt_id']:
+            del self.executing[job['base_url']]
+        
+        if job.get('preview'):
+            await job['preview'].close()
+        
+        logger.info(
+            f"Prompt {job['prompt_id']} finished ({job['status']}): "
+            f"queue {self.get_queue_time(job):.1f}s, "
+            f"execution {self.get_execution_time(job):.1f}s, "
+            f"{len(job['outputs'])} output(s)"
+        )
+        
+        # Delivery (download, re-encode, post) can be slow; run it beside the
+        # socket loop so it doesn't hold up events for the other jobs
+        if job['on_finish']:
+            self._spawn(self._run_callback(job), f"Completion callback for prompt {job['prompt_id']}")
+    
+    def _spawn(self, coroutine, description: str):
+        """
+        Run a coroutine as a background task.
+        
+        The loop only keeps weak references to tasks, so the task is held
+        until it's done, and an exception it raises is logged.
+        """
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        
+        def done(task: asyncio.Task):
+            self._tasks.discard(task)
+            if not task.cancelled() and task.exception():
+                logger.error(f"{description} failed: {task.exception()}")
+        
+        task.add_done_callback(done)
+    
+    async def _run_callback(self, job: Dict[str, Any]):
+        """Run a finished job's completion callback."""
+        try:
+            await job['on_finish'](job)
+        except Exception as e:
+            logger.error(f"Completion callback failed for prompt {job['prompt_id']}: {e}")
+    
+    async def _recover_from_history(self, base_url: str):
+        """Finish jobs whose completion events were missed while disconnected."""
+        for job in [j for j in self.jobs.values() if j['base_url'] == base_url]:
+            url = f"{base_url.rstrip('/')}{config.COMFYUI_API['history']}/{job['prompt_id']}"
+            history = await utils.fetch_url(url)
+            entry = (history or {}).get(job['prompt_id'])
+            
+            status = (entry or {}).get('status', {})
+            # Failed prompts are recorded with completed: False
+            failed = status.get('status_str') == 'error'
+            if not failed and not status.get('completed', False):
+                continue
+            
+            for output in entry.get('outputs', {}).values():
+                self._collect_outputs(job, output)
+            
+            if failed:
+                await self._finish(job, error="Execution failed (recovered from history)")
+            else:
+                await self._finish(job)
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+execution_tracker = ExecutionTracker()
+
+# ============================================================================
+# END OF EXECUTION TRACKER
+# ============================================================================
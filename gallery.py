@@ -0,0 +1,312 @@
+"""
+Gallery Module
+==============
+Renders thumbnail contact sheets of generated outputs:
+- Keeps an output index (filename -> content hash -> thumbnail)
+- Thumbnails are cached on disk by content hash and only built for new outputs
+- Thumbnails and sheets are rendered in the shared process pool
+- One small image per page instead of one download per output
+"""
+
+import asyncio
+import hashlib
+import logging
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+from PIL import Image, ImageDraw
+import config
+import utils
+from modal_manager import modal_manager
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = ['.mp4', '.webm']
+
+# ============================================================================
+# WORKER FUNCTIONS (run inside the process pool)
+# ============================================================================
+
+def _placeholder_tile(size: int, text: str) -> Image.Image:
+    """Create a plain tile with a label (for outputs that can't be previewed)."""
+    tile = Image.new('RGB', (size, size), (43, 45, 49))
+    draw = ImageDraw.Draw(tile)
+    draw.text((size // 2, size // 2), text, fill=(220, 221, 222), anchor='mm')
+    return tile
+
+def make_thumbnail(source: str, cache_dir: str, size: int) -> Dict[str, str]:
+    """
+    Hash an output file and build its thumbnail (unless already cached).
+    
+    Videos use their first frame (needs ffmpeg), anything that can't be
+    decoded gets a placeholder tile.
+    
+    Returns:
+        {'hash': sha256, 'thumbnail': thumbnail_path}
+    """
+    content_hash = utils.hash_file(Path(source))
+    thumbnail = Path(cache_dir) / f"{content_hash}-{size}.png"
+    
+    if thumbnail.exists():
+        return {'hash': content_hash, 'thumbnail': str(thumbnail)}
+    
+    extension = Path(source).suffix.lower()
+    image_source = source
+    frame_dir = None
+    
+    if extension in VIDEO_EXTENSIONS and shutil.which('ffmpeg'):
+        frame_dir = tempfile.mkdtemp(dir=cache_dir)
+        image_source = str(Path(frame_dir) / 'frame.png')
+        subprocess.run(
+            ['ffmpeg', '-y', '-v', 'error', '-i', source, '-frames:v', '1', image_source],
+            capture_output=True,
+            timeout=120
+        )
+    
+    try:
+        with Image.open(image_source) as image:
+            image = image.convert('RGB')
+            image.thumbnail((size, size), Image.LANCZOS)
+            image.save(thumbnail, format='PNG', optimize=True)
+    except Exception:
+        _placeholder_tile(size, extension.lstrip('.').upper() or '?').save(thumbnail, format='PNG')
+    finally:
+        if frame_dir:
+            shutil.rmtree(frame_dir, ignore_errors=True)
+    
+    return {'hash': content_hash, 'thumbnail': str(thumbnail)}
+
+def build_contact_sheet(
+    thumbnails: List[str],
+    labels: List[str],
+    destination: str,
+    columns: int,
+    tile_size: int,
+    label_height: int
+) -> str:
+    """
+    Lay out thumbnails in a grid with a label under each one.
+    
+    Returns:
+        Path to the contact sheet
+    """
+    rows = max(1, (len(thumbnails) + columns - 1) // columns)
+    columns = min(columns, max(1, len(thumbnails)))
+    cell_height = tile_size + label_height
+    
+    sheet = Image.new('RGB', (columns * tile_size, rows * cell_height), (30, 31, 34))
+    draw = ImageDraw.Draw(sheet)
+    
+    for index, (thumbnail_path, label) in enumerate(zip(thumbnails, labels)):
+        x = (index % columns) * tile_size
+        y = (index // columns) * cell_height
+        
+        try:
+            with Image.open(thumbnail_path) as thumbnail:
+                thumbnail = thumbnail.convert('RGB')
+        except Exception:
+            thumbnail = _placeholder_tile(tile_size, '?')
+        
+        # Center the thumbnail in its cell
+        offset_x = x + (tile_size - thumbnail.width) // 2
+        offset_y = y + (tile_size - thumbnail.height) // 2
+        sheet.paste(thumbnail, (offset_x, offset_y))
+        
+        draw.text(
+            (x + tile_size // 2, y + tile_size + label_height // 2),
+            label,
+            fill=(220, 221, 222),
+            anchor='mm'
+        )
+    
+    sheet.save(destination, format='WEBP', quality=80)
+    return destination
+
+# ============================================================================
+# OUTPUT GALLERY CLASS
+# ============================================================================
+
+class OutputGallery:
+    """Builds and caches thumbnail contact sheets of outputs."""
+    
+    def __init__(self, cache_dir: Path = None, index_file: Path = None):
+        """
+        Initialize output gallery.
+        
+        Args:
+            cache_dir: Thumbnail/sheet cache directory (default: config.THUMBNAIL_CACHE_DIR)
+            index_file: Output index JSON file (default: config.OUTPUT_INDEX_FILE)
+        """
+        if cache_dir is None:
+            cache_dir = config.THUMBNAIL_CACHE_DIR
+        if index_file is None:
+            index_file = config.OUTPUT_INDEX_FILE
+        
+        self.cache_dir = cache_dir
+        self.index_file = index_file
+        self.index: Dict[str, Dict[str, Any]] = {}
+        if index_file.exists():
+            self.index = utils.read_json_file(index_file) or {}
+        self._index_lock = asyncio.Lock()
+        self._indexing: Dict[str, asyncio.Task] = {}  # Maps filename -> thumbnail being built
+        self._fetch_semaphore = asyncio.Semaphore(config.GALLERY['fetch_concurrency'])
+    
+    # ========================================================================
+    # OUTPUT INDEX
+    # ========================================================================
+    
+    def get_page_count(self, total: int) -> int:
+        """Get number of gallery pages for a number of outputs."""
+        per_page = config.GALLERY['per_page']
+        return max(1, (total + per_page - 1) // per_page)
+    
+    async def add_output(self, filename: str, source: Path) -> Optional[Dict[str, Any]]:
+        """
+        Add an output that is already on disk to the index.
+        
+        Args:
+            filename: Output filename
+            source: Local path to the output
+        
+        Returns:
+            Index entry or None if failed
+        """
+        utils.ensure_directory(self.cache_dir)
+        
+        try:
+            entry = await utils.run_in_process(
+                make_thumbnail,
+                str(source),
+                str(self.cache_dir),
+                config.GALLERY['thumbnail_size']
+            )
+        except Exception as e:
+            logger.error(f"Failed to build thumbnail for '{filename}': {e}")
+            return None
+        
+        self.index[filename] = entry
+        return entry
+    
+    async def _index_output(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Fetch a new output and add it to the index."""
+        async with self._fetch_semaphore:
+            output = await modal_manager.open_output(filename)
+            if not output:
+                logger.warning(f"Could not fetch '{filename}' for thumbnail")
+                return None
+            
+            try:
+                source = await utils.spool_stream(output, filename)
+            finally:
+                output.close()
+            
+            try:
+                return await self.add_output(filename, source)
+            finally:
+                source.unlink(missing_ok=True)
+    
+    async def ensure_indexed(self, filenames: List[str]):
+        """
+        Make sure every filename has a thumbnail.
+        
+        Only outputs missing from the index (or whose thumbnail was deleted)
+        are fetched, so the index grows incrementally as new outputs appear.
+        An output another render is already fetching is waited for, not fetched again.
+        """
+        tasks = []
+        started = 0
+        for name in filenames:
+            task = self._indexing.get(name)
+            if task is None:
+                if name in self.index and Path(self.index[name]['thumbnail']).exists():
+                    continue
+                task = asyncio.create_task(self._index_output(name))
+                self._indexing[name] = task
+                task.add_done_callback(lambda _, name=name: self._indexing.pop(name, None))
+                started += 1
+            tasks.append(task)
+        
+        if not tasks:
+            return
+        
+        if started:
+            logger.info(f"Building thumbnails for {started} new output(s)")
+        
+        # wait() (unlike gather) doesn't cancel builds other renders share if this one is cancelled
+        done, _ = await asyncio.wait(tasks)
+        for task in done:
+            if task.exception():
+                logger.error(f"Failed to index an output: {task.exception()}")
+        
+        async with self._index_lock:
+            utils.write_json_file(self.index_file, self.index)
+    
+    # ========================================================================
+    # CONTACT SHEETS
+    # ========================================================================
+    
+    async def render_page(self, outputs: List[str], page: int) -> Optional[Path]:
+        """
+        Render one page of outputs as a contact sheet.
+        
+        Args:
+            outputs: All output filenames (in display order)
+            page: Page number (starting at 1)
+        
+        Returns:
+            Path to the contact sheet image or None if failed
+        """
+        per_page = config.GALLERY['per_page']
+        start = (page - 1) * per_page
+        page_outputs = outputs[start:start + per_page]
+        
+        if not page_outputs:
+            return None
+        
+        await self.ensure_indexed(page_outputs)
+        
+        entries = [(start + i + 1, self.index.get(name)) for i, name in enumerate(page_outputs)]
+        entries = [(number, entry) for number, entry in entries if entry]
+        if not entries:
+            return None
+        
+        thumbnails = [entry['thumbnail'] for _, entry in entries]
+        labels = [f"#{number}" for number, _ in entries]
+        
+        # Same thumbnails in the same slots -> same sheet
+        sheet_key = hashlib.sha256(
+            '|'.join(f"{label}:{entry['hash']}" for label, (_, entry) in zip(labels, entries)).encode()
+        ).hexdigest()
+        sheet = self.cache_dir / f"sheet-{sheet_key}.webp"
+        
+        if sheet.exists():
+            return sheet
+        
+        try:
+            await utils.run_in_process(
+                build_contact_sheet,
+                thumbnails,
+                labels,
+                str(sheet),
+                config.GALLERY['columns'],
+                config.GALLERY['thumbnail_size'],
+                config.GALLERY['label_height']
+            )
+        except Exception as e:
+            logger.error(f"Failed to build contact sheet for page {page}: {e}")
+            return None
+        
+        return sheet
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+output_gallery = OutputGallery()
+
+# ============================================================================
+# END OF GALLERY
+# ============================================================================
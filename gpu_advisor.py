@@ -0,0 +1,348 @@
+"""
+GPU Advisor Module
+==================
+Picks GPUs from measured runtimes instead of guesswork:
+- Records execution time per workflow and GPU from finished jobs
+- Estimates unmeasured GPUs from measured ones (relative speed)
+- Computes latency and cost per output of a workflow mix on each GPU
+- Recommends the cheapest GPU that meets a target latency
+"""
+
+import logging
+import sqlite3
+import statistics
+from collections import Counter
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+import config
+from ui_config import GPU_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+# Hourly price per GPU
+GPU_PRICES = {gpu['name']: gpu['price'] for gpu in GPU_OPTIONS}
+
+# ============================================================================
+# DATABASE SCHEMA
+# ============================================================================
+
+CREATE_GPU_RUNTIMES_TABLE = """
+CREATE TABLE IF NOT EXISTS gpu_runtimes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workflow_name TEXT NOT NULL,
+    gpu TEXT NOT NULL,
+    execution_time REAL NOT NULL,
+    outputs INTEGER DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# ============================================================================
+# GPU ADVISOR CLASS
+# ============================================================================
+
+class GpuAdvisor:
+    """Learns runtimes per workflow and GPU and recommends GPUs."""
+    
+    def __init__(self, db_path: Path = None):
+        """
+        Initialize GPU advisor.
+        
+        Args:
+            db_path: SQLite database file (default: config.DATABASE_FILE)
+        """
+        if db_path is None:
+            db_path = config.DATABASE_FILE
+        
+        self.db_path = db_path
+        self._init_database()
+    
+    def _init_database(self):
+        """Initialize database table."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(CREATE_GPU_RUNTIMES_TABLE)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_gpu_runtimes_workflow ON gpu_runtimes (workflow_name, gpu)"
+            )
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to initialize GPU runtimes table: {e}")
+            raise
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get database connection."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        return conn
+    
+    # ========================================================================
+    # RECORDING
+    # ========================================================================
+    
+    def record_run(self, workflow_name: str, gpu: str, execution_time: float, outputs: int = 1):
+        """
+        Store the runtime of a finished job.
+        
+        Args:
+            workflow_name: Workflow name
+            gpu: GPU it ran on
+            execution_time: Execution time in seconds (without queue time)
+            outputs: Number of outputs it produced
+        """
+        if not gpu or not execution_time or execution_time <= 0:
+            return
+        
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO gpu_runtimes (workflow_name, gpu, execution_time, outputs)
+                VALUES (?, ?, ?, ?)
+            """, (workflow_name, gpu, execution_time, max(1, outputs)))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to record GPU runtime: {e}")
+    
+    def _get_measurements(self, workflow_name: str) -> Dict[str, Tuple[float, float]]:
+        """
+        Get recent measurements of a workflow.
+        
+        Returns:
+            Dict mapping GPU -> (median execution time, average outputs per run)
+        """
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT gpu, execution_time, outputs FROM gpu_runtimes
+                WHERE workflow_name = ?
+                ORDER BY id DESC
+            """, (workflow_name,))
+            rows = cursor.fetchall()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to read GPU runtimes: {e}")
+            return {}
+        
+        samples: Dict[str, List[sqlite3.Row]] = {}
+        for row in rows:
+            gpu_samples = samples.setdefault(row['gpu'], [])
+            if len(gpu_samples) < config.GPU_ADVISOR['samples']:
+                gpu_samples.append(row)
+        
+        return {
+            gpu: (
+                statistics.median(row['execution_time'] for row in rows),
+                statistics.mean(row['outputs'] for row in rows)
+            )
+            for gpu, rows in samples.items()
+        }
+    
+    def _get_recent_workflows(self) -> Counter:
+        """Get the workflow mix of recent runs."""
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT workflow_name FROM gpu_runtimes
+                ORDER BY id DESC
+                LIMIT ?
+            """, (config.GPU_ADVISOR['mix_size'],))
+            rows = cursor.fetchall()
+            conn.close()
+            return Counter(row['workflow_name'] for row in rows)
+        except Exception as e:
+            logger.error(f"Failed to read recent workflows: {e}")
+            return Counter()
+    
+    # ========================================================================
+    # ESTIMATES
+    # ========================================================================
+    
+    def estimate(
+        self,
+        workflow_name: str,
+        gpu: str,
+        measurements: Dict[str, Tuple[float, float]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Estimate a workflow's runtime on a GPU.
+        
+        Measured GPUs use their median. Others are scaled from the measured
+        ones by config.GPU_ADVISOR['relative_speed'].
+        
+        Args:
+            workflow_name: Workflow name
+            gpu: GPU name
+            measurements: The workflow's measurements, if already loaded
+        
+        Returns:
+            {'latency', 'outputs', 'measured'} or None if the workflow never ran
+        """
+        if measurements is None:
+            measurements = self._get_measurements(workflow_name)
+        if not measurements:
+            return None
+        
+        if gpu in measurements:
+            latency, outputs = measurements[gpu]
+            return {'latency': latency, 'outputs': outputs, 'measured': True}
+        
+        speeds = config.GPU_ADVISOR['relative_speed']
+        if gpu not in speeds:
+            return None
+        
+        # Convert every measurement to the reference GPU's time, then to this GPU's
+        reference_times = [
+            latency * speeds[measured_gpu]
+            for measured_gpu, (latency, _) in measurements.items()
+            if measured_gpu in speeds
+        ]
+        if not reference_times:
+            return None
+        
+        outputs = statistics.mean(outputs for _, outputs in measurements.values())
+        return {
+            'latency': statistics.median(reference_times) / speeds[gpu],
+            'outputs': outputs,
+            'measured': False,
+        }
+    
+    def get_workflow_mix(self, workflows: List[str] = None) -> Counter:
+        """
+        Get the workflow mix to plan for.
+        
+        Args:
+            workflows: Workflow names (default: the queued jobs, else recent runs)
+        
+        Returns:
+            Counter mapping workflow -> count
+        """
+        if workflows:
+            return Counter(workflows)
+        
+        from job_scheduler import job_scheduler
+        
+        queued = [job['workflow_name'] for job in job_scheduler.get_dispatch_order()]
+        if queued:
+            return Counter(queued)
+        return self._get_recent_workflows()
+    
+    def compare(self, workflows: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        Estimate latency and cost of a workflow mix on every GPU.
+        
+        Args:
+            workflows: Workflow names (default: see get_workflow_mix)
+        
+        Returns:
+            List of {'gpu', 'price', 'latency' (average per job, seconds),
+            'cost_per_output' ($), 'measured' (share of the mix measured on it)}
+            for GPUs with an estimate, in GPU_OPTIONS order
+        """
+        mix = self.get_workflow_mix(workflows)
+        measurements = {workflow_name: self._get_measurements(workflow_name) for workflow_name in mix}
+        results = []
+        
+        for gpu, price in GPU_PRICES.items():
+            total_jobs = 0
+            total_time = 0.0
+            total_outputs = 0.0
+            measured_jobs = 0
+            
+            for workflow_name, count in mix.items():
+                estimate = self.estimate(workflow_name, gpu, measurements[workflow_name])
+                if not estimate:
+                    continue
+                total_jobs += count
+                total_time += estimate['latency'] * count
+                total_outputs += estimate['outputs'] * count
+                if estimate['measured']:
+                    measured_jobs += count
+            
+            if not total_jobs:
+                continue
+            
+            results.append({
+                'gpu': gpu,
+                'price': price,
+                'latency': total_time / total_jobs,
+                'cost_per_output': total_time / 3600 * price / total_outputs,
+                'measured': measured_jobs / total_jobs,
+            })
+        
+        return results
+    
+    def recommend(
+        self,
+        workflows: List[str] = None,
+        target_latency: float = None,
+        measured_only: bool = False
+    ) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        Pick the cheapest GPU per output that meets a target latency.
+        
+        If no GPU meets the target, the fastest one is picked.
+        
+        Args:
+            workflows: Workflow names (default: see get_workflow_mix)
+            target_latency: Max average seconds per job (default: config.GPU_ADVISOR['target_latency'])
+            measured_only: Only pick GPUs the whole mix was measured on (no estimates)
+        
+        Returns:
+            (gpu or None if there is no data, comparison from compare())
+        """
+        if target_latency is None:
+            target_latency = config.GPU_ADVISOR['target_latency']
+        
+        comparison = self.compare(workflows)
+        candidates = [row for row in comparison if row['measured'] == 1] if measured_only else comparison
+        if not candidates:
+            return None, comparison
+        
+        meeting = [row for row in candidates if row['latency'] <= target_latency]
+        if meeting:
+            best = min(meeting, key=lambda row: row['cost_per_output'])
+        else:
+            best = min(candidates, key=lambda row: row['latency'])
+        return best['gpu'], comparison
+    
+    def pick_gpu(self) -> Optional[str]:
+        """
+        Get the GPU to start on when none was chosen.
+        
+        Only GPUs with real measurements are picked: estimates scaled from a
+        faster GPU can land a workflow on a card with too little memory for it.
+        
+        Returns:
+            GPU name, or None if auto-pick is off or nothing was measured
+        """
+        if not config.GPU_ADVISOR['auto_pick']:
+            return None
+        
+        gpu, _ = self.recommend(measured_only=True)
+        if gpu:
+            logger.info(f"GPU advisor picked {gpu}")
+        return gpu
+    
+    def format_estimate(self, row: Dict[str, Any]) -> str:
+        """Format one comparison row, e.g. "~12s/job, $0.0031/output"."""
+        text = f"~{row['latency']:.0f}s/job, ${row['cost_per_output']:.4f}/output"
+        if row['measured'] < 1:
+            text += " (est.)"
+        return text
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+gpu_advisor = GpuAdvisor()
+
+# ============================================================================
+# END OF GPU ADVISOR
+# ============================================================================
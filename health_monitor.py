@@ -0,0 +1,358 @@
+"""
+Health Monitor Module
+=====================
+Watches the running deployment in the background:
+- Probes each deployment's ComfyUI and JupyterLab tunnels on an interval
+- Keeps a latency histogram and a recent error rate per target
+- Detects a hung ComfyUI (prompts pending but nothing executing)
+- Takes unhealthy deployments out of job routing
+- Restarts a deployment after repeated failures
+- Notifies the owner once per incident, not on every failed probe
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+import aiohttp
+import config
+import utils
+from deployment_pool import deployment_pool
+from http_client import http_client
+from modal_manager import modal_manager
+from ui_config import COLORS, ICONS
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# TARGET STATS
+# ============================================================================
+
+class TargetStats:
+    """Latency histogram and error window of one probed URL."""
+    
+    def __init__(self, name: str, url: str):
+        """
+        Initialize target stats.
+        
+        Args:
+            name: Target name (e.g. 'comfyui')
+            url: URL that is probed
+        """
+        self.name = name
+        self.url = url
+        self.buckets: List[float] = config.HEALTH_MONITOR['latency_buckets']
+        self.histogram = [0] * (len(self.buckets) + 1)  # Last bucket is "slower than all"
+        self.results = deque(maxlen=config.HEALTH_MONITOR['error_window'])
+        self.consecutive_failures = 0
+        self.last_latency: Optional[float] = None
+        self.last_error: Optional[str] = None
+    
+    def record(self, latency: Optional[float], error: str = None):
+        """Record one probe (latency is None when it failed)."""
+        self.results.append(error is None)
+        if error is None:
+            self.histogram[bisect.bisect_left(self.buckets, latency)] += 1
+            self.last_latency = latency
+            self.consecutive_failures = 0
+        else:
+            self.last_error = error
+            self.consecutive_failures += 1
+    
+    def get_error_rate(self) -> float:
+        """Get the share of failed probes in the error window."""
+        if not self.results:
+            return 0.0
+        return self.results.count(False) / len(self.results)
+    
+    def get_percentile(self, percentile: float) -> Optional[float]:
+        """
+        Estimate a latency percentile from the histogram.
+        
+        Returns:
+            Upper bound of the bucket holding the percentile (None if no data)
+        """
+        total = sum(self.histogram)
+        if not total:
+            return None
+        
+        target = total * percentile
+        count = 0
+        for index, bucket_count in enumerate(self.histogram):
+            count += bucket_count
+            if count >= target:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return None
+    
+    def format_summary(self) -> str:
+        """Format latency and error rate as one line."""
+        p50 = self.get_percentile(0.5)
+        p95 = self.get_percentile(0.95)
+        if p50 is None:
+            latency = "no successful probes"
+        else:
+            latency = f"p50 ≤{p50:g}s, p95 ≤{p95:g}s"
+        return f"{latency}, errors {self.get_error_rate():.0%} of last {len(self.results)}"
+
+# ============================================================================
+# HEALTH MONITOR CLASS
+# ============================================================================
+
+class HealthMonitor:
+    """Probes every running deployment and recovers the ones that die."""
+    
+    def __init__(self):
+        """Initialize health monitor."""
+        self.states: Dict[str, Dict[str, Any]] = {}  # Maps username -> monitor state of its deployment
+        self._notify: Optional[Callable[[str, str, int], Awaitable[None]]] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    # ========================================================================
+    # LIFECYCLE
+    # ========================================================================
+    
+    def start(self, notify: Callable[[str, str, int], Awaitable[None]] = None):
+        """
+        Start monitoring in the background.
+        
+        Args:
+            notify: Coroutine called as (title, description, color) to alert the owner
+        """
+        if not config.HEALTH_MONITOR['enabled']:
+            return
+        
+        self._notify = notify
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._monitor_loop())
+            logger.info("Health monitor started")
+    
+    def get_state(self, deployment: Dict[str, Any]) -> Dict[str, Any]:
+        """Get a deployment's monitor state (reset when its URLs change)."""
+        state = self.states.get(deployment['username'])
+        comfyui_url = deployment['comfyui_url'].rstrip('/')
+        
+        if state is None or state['comfyui'].url != comfyui_url + config.COMFYUI_API['system_stats']:
+            state = {
+                'comfyui': TargetStats('comfyui', comfyui_url + config.COMFYUI_API['system_stats']),
+                'jupyter': TargetStats('jupyter', deployment['jupyter_url']),
+                'stuck_since': None,  # When ComfyUI's queue stopped moving
+                'failed_checks': 0,
+                'incident_open': False,  # Owner was told about the current incident
+                'last_restart': None,
+            }
+            self.states[deployment['username']] = state
+        return state
+    
+    # ========================================================================
+    # PROBES
+    # ========================================================================
+    
+    async def _probe(self, target: TargetStats):
+        """Probe a target once and record the result."""
+        timeout = aiohttp.ClientTimeout(total=config.HEALTH_MONITOR['request_timeout'])
+        started = time.monotonic()
+        
+        try:
+            async with http_client.get_session().get(target.url, timeout=timeout) as response:
+                await response.read()
+                if response.status >= 400:
+                    target.record(None, f"HTTP {response.status}")
+                    return
+        except asyncio.TimeoutError:
+            target.record(None, "timeout")
+            return
+        except aiohttp.ClientError as e:
+            target.record(None, str(e) or e.__class__.__name__)
+            return
+        
+        target.record(time.monotonic() - started)
+    
+    async def _check_hung(self, state: Dict[str, Any], base_url: str) -> bool:
+        """
+        Check if a ComfyUI's queue is stuck.
+        
+        Returns:
+            True if prompts have been pending with nothing executing for too long
+        """
+        queue = await utils.get_comfyui_queue(base_url)
+        if queue is None:
+            return False  # Unreachable is reported by the probe
+        
+        if queue.get('queue_pending') and not queue.get('queue_running'):
+            if state['stuck_since'] is None:
+                state['stuck_since'] = time.monotonic()
+            return time.monotonic() - state['stuck_since'] > config.HEALTH_MONITOR['hung_after']
+        
+        state['stuck_since'] = None
+        return False
+    
+    async def check(self, deployment: Dict[str, Any]) -> List[str]:
+        """
+        Run one health check of a deployment.
+        
+        Returns:
+            List of problems found (empty if healthy)
+        """
+        state = self.get_state(deployment)
+        comfyui = state['comfyui']
+        jupyter = state['jupyter']
+        await asyncio.gather(self._probe(comfyui), self._probe(jupyter))
+        
+        problems = []
+        if comfyui.consecutive_failures:
+            problems.append(f"ComfyUI unreachable ({comfyui.last_error})")
+        elif await self._check_hung(state, deployment['comfyui_url'].rstrip('/')):
+            problems.append(
+                f"ComfyUI hung: prompts pending with nothing executing for "
+                f"{time.monotonic() - state['stuck_since']:.0f}s"
+            )
+        if jupyter.consecutive_failures:
+            problems.append(f"JupyterLab unreachable ({jupyter.last_error})")
+        
+        return problems
+    
+    # ========================================================================
+    # MONITOR LOOP
+    # ========================================================================
+    
+    async def _monitor_loop(self):
+        """Check every running deployment each interval."""
+        while True:
+            await asyncio.sleep(config.HEALTH_MONITOR['interval'])
+            
+            deployments = deployment_pool.get_all()
+            
+            # Forget deployments that were stopped
+            running = {deployment['username'] for deployment in deployments}
+            for username in list(self.states):
+                if username not in running and username not in modal_manager.restarting:
+                    del self.states[username]
+            
+            await asyncio.gather(*(
+                self._check_deployment(deployment) for deployment in deployments
+                if deployment['username'] not in modal_manager.restarting
+            ))
+    
+    async def _check_deployment(self, deployment: Dict[str, Any]):
+        """Check one deployment and act on the result."""
+        try:
+            problems = await self.check(deployment)
+            await self._handle_result(deployment, problems)
+        except Exception as e:
+            logger.error(f"Error in health monitor for '{deployment['username']}': {e}")
+    
+    async def _handle_result(self, deployment: Dict[str, Any], problems: List[str]):
+        """Track failures, notify once per incident and restart when needed."""
+        username = deployment['username']
+        state = self.get_state(deployment)
+        
+        # Only ComfyUI problems matter for routing and restarts (JupyterLab alone is just reported)
+        comfyui_failed = any(problem.startswith('ComfyUI') for problem in problems)
+        deployment_pool.set_healthy(username, not comfyui_failed)
+        
+        if not problems:
+            if state['incident_open']:
+                logger.info(f"Deployment '{username}' recovered")
+                await self._send_notification(
+                    f"{ICONS['success']} Deployment Recovered",
+                    f"Account: `{username}`\nComfyUI and JupyterLab are responding again.",
+                    COLORS['success']
+                )
+            state['failed_checks'] = 0
+            state['incident_open'] = False
+            return
+        
+        if comfyui_failed:
+            state['failed_checks'] += 1
+        logger.warning(f"Health check failed for '{username}' ({state['failed_checks']}): {'; '.join(problems)}")
+        
+        settings = config.HEALTH_MONITOR
+        restart = (
+            settings['auto_restart']
+            and state['failed_checks'] >= settings['restart_after']
+            and (state['last_restart'] is None or time.monotonic() - state['last_restart'] > settings['restart_cooldown'])
+        )
+        
+        if not state['incident_open']:
+            state['incident_open'] = True
+            action = "Restarting the deployment." if restart else (
+                f"Will restart after {settings['restart_after']} failed checks."
+                if settings['auto_restart'] else "Automatic restart is disabled."
+            )
+            await self._send_notification(
+                f"{ICONS['warning']} Deployment Unhealthy",
+                f"Account: `{username}`\n"
+                + '\n'.join(f"• {problem}" for problem in problems) + f"\n\n{action}",
+                COLORS['warning']
+            )
+        
+        if restart:
+            await self.restart_deployment(deployment)
+    
+    async def restart_deployment(self, deployment: Dict[str, Any]) -> bool:
+        """
+        Restart a deployment on the same account, GPU and endpoint.
+        
+        Returns:
+            True if it came back up
+        """
+        username = deployment['username']
+        state = self.get_state(deployment)
+        logger.warning(f"Restarting deployment on '{username}' ({deployment['gpu']})")
+        
+        state['last_restart'] = time.monotonic()
+        try:
+            success, msg = await modal_manager.restart_deployment(username)
+        finally:
+            state['failed_checks'] = 0
+            state['stuck_since'] = None
+        
+        if not success:
+            await self._send_notification(
+                f"{ICONS['error']} Restart Failed",
+                f"Account: `{username}`\nGPU: {deployment['gpu']}\n{msg}",
+                COLORS['error']
+            )
+        return success
+    
+    async def _send_notification(self, title: str, description: str, color: int):
+        """Notify the owner (if a notifier was given)."""
+        if self._notify:
+            await self._notify(title, description, color)
+    
+    # ========================================================================
+    # STATISTICS
+    # ========================================================================
+    
+    def get_summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the monitor state of every deployment.
+        
+        Returns:
+            Dict mapping username -> {'comfyui', 'jupyter' (one-line summaries),
+            'failed_checks', 'incident_open', 'hung', 'restarting'}
+        """
+        return {
+            username: {
+                'comfyui': state['comfyui'].format_summary(),
+                'jupyter': state['jupyter'].format_summary(),
+                'failed_checks': state['failed_checks'],
+                'incident_open': state['incident_open'],
+                'hung': state['stuck_since'] is not None,
+                'restarting': username in modal_manager.restarting,
+            }
+            for username, state in self.states.items()
+        }
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+health_monitor = HealthMonitor()
+
+# ============================================================================
+# END OF HEALTH MONITOR
+# ============================================================================
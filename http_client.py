@@ -0,0 +1,179 @@
+"""
+HTTP Client Module
+==================
+One long-lived HTTP session shared by the whole bot:
+- Connection pooling with keep-alive (no new TCP/TLS handshake per request)
+- DNS cache and per-host connection limits
+- Created on first use, closed when the bot shuts down
+- Counts new vs. reused connections and DNS cache hits
+"""
+
+import asyncio
+import logging
+from typing import Optional, Dict, Any
+import aiohttp
+import config
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# HTTP CLIENT CLASS
+# ============================================================================
+
+class HttpClient:
+    """Owns the shared aiohttp session and its connection pool."""
+    
+    def __init__(self):
+        """Initialize HTTP client (the session is created on first use)."""
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.stats = {
+            'requests': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'dns_lookups': 0,
+            'dns_cache_hits': 0,
+        }
+        self._trace_config = self._build_trace_config()
+    
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        """Build request tracing hooks that count connection reuse."""
+        trace_config = aiohttp.TraceConfig()
+        
+        def counter(name: str):
+            async def hook(session, context, params):
+                self.stats[name] += 1
+            return hook
+        
+        trace_config.on_request_start.append(counter('requests'))
+        trace_config.on_connection_create_end.append(counter('connections_created'))
+        trace_config.on_connection_reuseconn.append(counter('connections_reused'))
+        trace_config.on_dns_resolvehost_end.append(counter('dns_lookups'))
+        trace_config.on_dns_cache_hit.append(counter('dns_cache_hits'))
+        return trace_config
+    
+    # ========================================================================
+    # SESSION LIFECYCLE
+    # ========================================================================
+    
+    def get_session(self) -> aiohttp.ClientSession:
+        """Get the shared session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            settings = config.HTTP_CLIENT
+            connector = aiohttp.TCPConnector(
+                limit=settings['limit'],
+                limit_per_host=settings['limit_per_host'],
+                ttl_dns_cache=settings['ttl_dns_cache'],
+                keepalive_timeout=settings['keepalive_timeout'],
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[self._trace_config]
+            )
+            logger.info("Created shared HTTP session")
+        return self._session
+    
+    async def close(self):
+        """Close the shared session and all pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info(f"Closed shared HTTP session ({self.format_stats()})")
+        self._session = None
+    
+    # ========================================================================
+    # REQUESTS
+    # ========================================================================
+    
+    async def get_json(self, url: str, timeout: int = None) -> Optional[Dict[Any, Any]]:
+        """
+        Fetch JSON data from URL.
+        
+        Returns:
+            JSON response or None if failed
+        """
+        if timeout is None:
+            timeout = config.REQUEST_TIMEOUT
+        
+        try:
+            async with self.get_session().get(url, timeout=timeout) as response:
+                if response.status == 200:
+                    return await response.json(content_type=None)
+                logger.warning(f"HTTP {response.status} from {url}")
+                return None
+        except asyncio.TimeoutError:
+            logger.error(f"Request timeout for {url}")
+            return None
+        except Exception as e:
+            logger.error(f"Error fetching {url}: {e}")
+            return None
+    
+    async def post_json(self, url: str, data: Dict[Any, Any], timeout: int = None) -> Optional[Dict[Any, Any]]:
+        """
+        POST JSON data to URL.
+        
+        Returns:
+            JSON response or None if failed
+        """
+        if timeout is None:
+            timeout = config.REQUEST_TIMEOUT
+        
+        try:
+            async with self.get_session().post(url, json=data, timeout=timeout) as response:
+                if response.status in [200, 201]:
+                    return await response.json()
+                logger.warning(f"HTTP {response.status} from {url}")
+                logger.debug(f"Response: {await response.text()}")
+                return None
+        except asyncio.TimeoutError:
+            logger.error(f"Request timeout for {url}")
+            return None
+        except Exception as e:
+            logger.error(f"Error posting to {url}: {e}")
+            return None
+    
+    async def is_reachable(self, url: str, timeout: int = 10) -> bool:
+        """Check if a URL answers with HTTP 200."""
+        try:
+            async with self.get_session().get(url, timeout=timeout) as response:
+                return response.status == 200
+        except Exception:
+            return False
+    
+    # ========================================================================
+    # STATISTICS
+    # ========================================================================
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get connection statistics.
+        
+        Returns:
+            Counters plus reuse_rate (reused / all connections used)
+            and dns_hit_rate (cache hits / all lookups)
+        """
+        stats = dict(self.stats)
+        connections = stats['connections_created'] + stats['connections_reused']
+        lookups = stats['dns_lookups'] + stats['dns_cache_hits']
+        stats['reuse_rate'] = stats['connections_reused'] / connections if connections else 0.0
+        stats['dns_hit_rate'] = stats['dns_cache_hits'] / lookups if lookups else 0.0
+        return stats
+    
+    def format_stats(self) -> str:
+        """Format connection statistics as one line."""
+        stats = self.get_stats()
+        return (
+            f"{stats['requests']} requests, "
+            f"{stats['connections_reused']} reused / {stats['connections_created']} new connections "
+            f"({stats['reuse_rate']:.0%} reuse), "
+            f"DNS cache {stats['dns_hit_rate']:.0%}"
+        )
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+http_client = HttpClient()
+
+# ============================================================================
+# END OF HTTP CLIENT
+# ============================================================================
@@ -0,0 +1,270 @@
+"""
+Idle Manager Module
+===================
+Stops deployments nobody is using:
+- Tracks the last prompt and the last control panel interaction
+- Idle timeout per GPU (expensive GPUs stop sooner)
+- Warns in the panel's channel first, with a button to keep it running
+- Stops the deployment when the idle window runs out
+- Optionally starts it again on the next /generate
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+import discord
+import config
+import utils
+from deployment_pool import deployment_pool
+from job_scheduler import job_scheduler
+from modal_manager import modal_manager
+from readiness_prober import readiness_prober
+from ui_config import COLORS, ICONS
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# IDLE WARNING VIEW
+# ============================================================================
+
+class IdleWarningView(discord.ui.View):
+    """Warning with a button that resets the idle timer."""
+    
+    def __init__(self, idle_manager: 'IdleManager', username: str, timeout: float):
+        super().__init__(timeout=timeout)
+        self.idle_manager = idle_manager
+        self.username = username
+    
+    @discord.ui.button(label="Keep Running", style=discord.ButtonStyle.success, emoji="⏱️")
+    async def keep_running(self, button: discord.ui.Button, interaction: discord.Interaction):
+        """Reset the idle timer."""
+        self.idle_manager.record_panel(interaction.channel)
+        self.stop()
+        await interaction.response.edit_message(
+            content=f"{ICONS['success']} `{self.username}` keeps running. The idle timer was reset.",
+            embed=None,
+            view=None
+        )
+
+# ============================================================================
+# IDLE MANAGER CLASS
+# ============================================================================
+
+class IdleManager:
+    """Tracks activity and stops idle deployments."""
+    
+    def __init__(self):
+        """Initialize idle manager."""
+        self.last_prompt = 0.0  # time.time() of the last /generate
+        self.last_panel = 0.0  # time.time() of the last control panel interaction
+        self.last_busy: Dict[str, float] = {}  # Maps username -> last time it had jobs
+        self.panel_channel: Optional[discord.abc.Messageable] = None  # Where the panel was last used
+        self.warnings: Dict[str, discord.Message] = {}  # Maps username -> idle warning sent
+        self.stopped: List[Dict[str, Any]] = []  # Deployments stopped for being idle
+        self._notify: Optional[Callable[[str, str, int], Awaitable[None]]] = None
+        self._resume_task: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self, notify: Callable[[str, str, int], Awaitable[None]] = None):
+        """
+        Start checking for idle deployments.
+        
+        Args:
+            notify: Coroutine called as (title, description, color), used when no panel channel is known
+        """
+        if not config.IDLE_POLICY['enabled']:
+            return
+        
+        self._notify = notify
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._idle_loop())
+            logger.info("Idle manager started")
+    
+    # ========================================================================
+    # ACTIVITY
+    # ========================================================================
+    
+    def record_prompt(self):
+        """Record a generation request."""
+        self.last_prompt = time.time()
+        self._clear_warnings()
+    
+    def record_panel(self, channel: discord.abc.Messageable = None):
+        """Record a control panel interaction (and where it happened)."""
+        self.last_panel = time.time()
+        if channel is not None:
+            self.panel_channel = channel
+        self._clear_warnings()
+    
+    def _clear_warnings(self):
+        """Forget sent warnings, so a new idle period warns again."""
+        self.warnings.clear()
+    
+    def _is_busy(self, deployment: Dict[str, Any]) -> bool:
+        """Check if a deployment has jobs running or waiting."""
+        if job_scheduler.get_queue_length():
+            return True
+        return any(job['base_url'] == deployment['comfyui_url'] for job in job_scheduler.in_flight.values())
+    
+    def get_timeout(self, gpu: str) -> int:
+        """Get the idle timeout for a GPU (in seconds)."""
+        return config.IDLE_POLICY['timeouts'].get(gpu, config.IDLE_POLICY['default_timeout'])
+    
+    def get_idle_time(self, deployment: Dict[str, Any]) -> float:
+        """Get how long a deployment has been idle (in seconds)."""
+        last_activity = max(
+            deployment['started_at'],
+            self.last_prompt,
+            self.last_panel,
+            self.last_busy.get(deployment['username'], 0.0)
+        )
+        return time.time() - last_activity
+    
+    # ========================================================================
+    # IDLE CHECKS
+    # ========================================================================
+    
+    async def _idle_loop(self):
+        """Check every deployment's idle time on an interval."""
+        while True:
+            await asyncio.sleep(config.IDLE_POLICY['check_interval'])
+            
+            try:
+                deployments = deployment_pool.get_all()
+                if deployments:
+                    # Something is running again, nothing to resume
+                    self.stopped = [
+                        stopped for stopped in self.stopped
+                        if not deployment_pool.get(stopped['username'])
+                    ]
+                
+                for deployment in deployments:
+                    if deployment['username'] not in modal_manager.restarting:
+                        await self._check(deployment)
+            except Exception as e:
+                logger.error(f"Error in idle manager: {e}")
+    
+    async def _check(self, deployment: Dict[str, Any]):
+        """Warn about or stop one deployment if it's idle."""
+        username = deployment['username']
+        
+        if self._is_busy(deployment):
+            self.last_busy[username] = time.time()
+            self.warnings.pop(username, None)
+            return
+        
+        remaining = self.get_timeout(deployment['gpu']) - self.get_idle_time(deployment)
+        
+        if remaining <= 0:
+            await self._auto_stop(deployment)
+        elif remaining <= config.IDLE_POLICY['warn_before'] and username not in self.warnings:
+            await self._warn(deployment, remaining)
+    
+    async def _send(self, title: str, description: str, color: int, view: discord.ui.View = None) -> Optional[discord.Message]:
+        """Post to the panel's channel, or notify the owner if there is none."""
+        embed = discord.Embed(title=title, description=description, color=color)
+        
+        if self.panel_channel is not None:
+            try:
+                return await self.panel_channel.send(embed=embed, view=view)
+            except Exception as e:
+                logger.warning(f"Failed to post in the panel channel: {e}")
+        
+        if self._notify:
+            await self._notify(title, description, color)
+        return None
+    
+    async def _warn(self, deployment: Dict[str, Any], remaining: float):
+        """Warn that a deployment is about to be stopped."""
+        username = deployment['username']
+        idle = utils.format_time_remaining(int(self.get_idle_time(deployment)))
+        left = utils.format_time_remaining(int(remaining))
+        logger.info(f"Deployment '{username}' idle for {idle}, stopping in {left}")
+        
+        message = await self._send(
+            f"{ICONS['warning']} ComfyUI Idle",
+            f"`{username}` ({deployment['gpu']}) has been idle for {idle}.\n"
+            f"It will be stopped in **{left}** to save credits.",
+            COLORS['warning'],
+            view=IdleWarningView(self, username, timeout=remaining)
+        )
+        self.warnings[username] = message
+    
+    async def _auto_stop(self, deployment: Dict[str, Any]):
+        """Stop an idle deployment and remember it for resuming."""
+        username = deployment['username']
+        idle = utils.format_time_remaining(int(self.get_idle_time(deployment)))
+        logger.info(f"Stopping idle deployment '{username}' after {idle}")
+        
+        success, msg = await modal_manager.stop_comfyui(username)
+        self.warnings.pop(username, None)
+        self.last_busy.pop(username, None)
+        if not success:
+            logger.warning(f"Failed to stop idle deployment '{username}': {msg}")
+            return
+        
+        self.stopped.append({'username': username, 'gpu': deployment['gpu'], 'stopped_at': time.time()})
+        
+        resume = " The next `/generate` starts it again." if config.IDLE_POLICY['resume_on_generate'] else ""
+        await self._send(
+            f"{ICONS['stop']} ComfyUI Stopped (Idle)",
+            f"`{username}` ({deployment['gpu']}) was idle for {idle} and has been stopped.{resume}",
+            COLORS['info']
+        )
+    
+    # ========================================================================
+    # RESUME
+    # ========================================================================
+    
+    def resume_if_stopped(self) -> Tuple[bool, str]:
+        """
+        Start the last idle-stopped deployment again if nothing is running.
+        
+        Returns:
+            (resuming, message) - resuming is True while a start is underway
+        """
+        if self._resume_task is not None and not self._resume_task.done():
+            return True, "ComfyUI is starting up again"
+        
+        settings = config.IDLE_POLICY
+        if not settings['resume_on_generate'] or deployment_pool.get_all() or not self.stopped:
+            return False, ""
+        
+        stopped = self.stopped[-1]
+        if time.time() - stopped['stopped_at'] > settings['resume_window']:
+            self.stopped.clear()
+            return False, ""
+        
+        self.stopped.clear()
+        self._resume_task = asyncio.create_task(self._resume(stopped['username'], stopped['gpu']))
+        
+        eta = readiness_prober.format_eta(stopped['gpu'], stopped['username'])
+        return True, f"ComfyUI was stopped while idle and is starting again on {stopped['gpu']} (expected {eta})"
+    
+    async def _resume(self, username: str, gpu: str):
+        """Start a deployment again; queued jobs are dispatched once it's up."""
+        logger.info(f"Resuming idle-stopped deployment on '{username}' ({gpu})")
+        try:
+            success, msg = await modal_manager.start_comfyui(username, gpu)
+        except Exception as e:
+            success, msg = False, str(e)
+        
+        if not success:
+            logger.error(f"Failed to resume deployment on '{username}': {msg}")
+            await self._send(
+                f"{ICONS['error']} Resume Failed",
+                f"Could not start `{username}` again: {msg}\nQueued jobs wait until ComfyUI is started.",
+                COLORS['error']
+            )
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+idle_manager = IdleManager()
+
+# ============================================================================
+# END OF IDLE MANAGER
+# ============================================================================
@@ -0,0 +1,570 @@
+"""
+Job Scheduler Module
+====================
+Bot-side queue for generation jobs, in front of ComfyUI:
+- Priority lanes (the owner's jobs go first)
+- Fair queuing: users in a lane take turns, one job each
+- Routes jobs across the deployment pool and caps prompts in flight
+  per deployment, based on each ComfyUI's /queue depth
+- Queue positions and cancellation per user
+- Admission control: when ComfyUI is backed up, heavy jobs go to the
+  low lane, new jobs get an ETA, and past a limit they're rejected
+- Wraps WorkflowManager.generate_with_workflow
+"""
+
+import asyncio
+import itertools
+import logging
+import statistics
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, List, Tuple
+import discord
+import config
+import utils
+from deployment_pool import deployment_pool
+from ui_config import COLORS, ICONS
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# GENERATION SCHEDULER CLASS
+# ============================================================================
+
+class GenerationScheduler:
+    """Fair, prioritized queue of generation jobs."""
+    
+    def __init__(self):
+        """Initialize generation scheduler."""
+        self.workflow_manager = None  # Set by start()
+        self.lanes: Dict[str, OrderedDict] = {
+            lane: OrderedDict() for lane in config.JOB_QUEUE['lanes']
+        }  # Maps lane -> (user_id -> deque of queued jobs), in turn order
+        self.in_flight: Dict[int, Dict[str, Any]] = {}  # Maps job_id -> submitted job
+        self._job_ids = itertools.count(1)
+        self.durations: Dict[str, deque] = {}  # Maps workflow -> recent run times (in seconds)
+        self._queue_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}  # Maps URL -> (read at, /queue)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+    
+    # ========================================================================
+    # LIFECYCLE
+    # ========================================================================
+    
+    def start(self, workflow_manager):
+        """
+        Start dispatching jobs.
+        
+        Args:
+            workflow_manager: WorkflowManager used to submit prompts
+        """
+        self.workflow_manager = workflow_manager
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch_loop())
+            logger.info("Generation scheduler started")
+    
+    # ========================================================================
+    # QUEUEING
+    # ========================================================================
+    
+    def get_lane_for_user(self, user_id: int) -> str:
+        """Get the default lane for a user (owner jobs get the first lane)."""
+        if config.OWNER_ID and str(user_id) == str(config.OWNER_ID):
+            return config.JOB_QUEUE['lanes'][0]
+        return config.JOB_QUEUE['default_lane']
+    
+    def get_user_jobs(self, user_id: int) -> List[Dict[str, Any]]:
+        """Get a user's queued and in-flight jobs."""
+        jobs = [job for job in self.in_flight.values() if job['user_id'] == user_id]
+        for lane in self.lanes.values():
+            jobs.extend(lane.get(user_id, []))
+        return jobs
+    
+    def submit(
+        self,
+        user_id: int,
+        workflow_name: str,
+        prompt: str,
+        guild: discord.Guild = None,
+        status_message: discord.Message = None,
+        live_preview: bool = False,
+        lane: str = None,
+        params: Dict[str, Any] = None,
+        batch: Dict[str, Any] = None,
+        use_cache: bool = True
+    ) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
+        """
+        Add a generation job to the queue.
+        
+        Args:
+            user_id: Discord user who requested the job
+            workflow_name: Workflow name
+            prompt: Text prompt
+            guild: Discord guild to post outputs in (optional)
+            status_message: Message showing the job's state (optional)
+            live_preview: Stream latent previews into the status message
+            lane: Lane to queue in (default: based on the user)
+            params: Extra workflow parameters (negative_prompt, seed, steps, width, height)
+            batch: Batch variants ({'seeds': [...], 'sweep': {...}}), counts as one job
+            use_cache: Serve identical requests from the result cache
+        
+        Returns:
+            (success, message, job)
+        """
+        if lane is None:
+            lane = self.get_lane_for_user(user_id)
+        if lane not in self.lanes:
+            return False, f"Unknown queue lane '{lane}'", None
+        
+        limit = config.JOB_QUEUE['max_jobs_per_user']
+        if len(self.get_user_jobs(user_id)) >= limit:
+            return False, f"You already have {limit} jobs queued. Wait for some to finish.", None
+        
+        job = {
+            'job_id': next(self._job_ids),
+            'user_id': user_id,
+            'lane': lane,
+            'workflow_name': workflow_name,
+            'prompt': prompt,
+            'guild': guild,
+            'status_message': status_message,
+            'live_preview': live_preview,
+            'params': params or {},
+            'batch': batch,
+            'use_cache': use_cache,
+            'state': 'queued',  # queued -> submitted -> done / failed / cancelled
+            'queued_at': time.monotonic(),
+            'prompt_ids': [],
+            'batch_run': None,  # Running batch from workflow_manager.generate_batch
+            'base_url': None,
+            'deployment': None,  # Account it was submitted to
+        }
+        
+        self.lanes[lane].setdefault(user_id, deque()).append(job)
+        self._wakeup.set()
+        
+        logger.info(f"Queued job {job['job_id']} for user {user_id} in lane '{lane}'")
+        return True, "Job queued", job
+    
+    def _remove_queued(self, job: Dict[str, Any]) -> bool:
+        """Remove a queued job from its lane."""
+        users = self.lanes[job['lane']]
+        user_jobs = users.get(job['user_id'])
+        if not user_jobs or job not in user_jobs:
+            return False
+        
+        user_jobs.remove(job)
+        if not user_jobs:
+            del users[job['user_id']]
+        return True
+    
+    def _pop_next(self) -> Optional[Dict[str, Any]]:
+        """Take the next job: first non-empty lane, then the user whose turn it is."""
+        for users in self.lanes.values():
+            if not users:
+                continue
+            
+            user_id, user_jobs = next(iter(users.items()))
+            job = user_jobs.popleft()
+            
+            # User goes to the back of the line for this lane
+            del users[user_id]
+            if user_jobs:
+                users[user_id] = user_jobs
+            
+            return job
+        return None
+    
+    def get_dispatch_order(self) -> List[Dict[str, Any]]:
+        """Get all queued jobs in the order they will be dispatched."""
+        order = []
+        for users in self.lanes.values():
+            queues = [list(user_jobs) for user_jobs in users.values()]
+            # Round-robin: everyone's 1st job, then everyone's 2nd job, ...
+            for round_jobs in itertools.zip_longest(*queues):
+                order.extend(job for job in round_jobs if job is not None)
+        return order
+    
+    def get_position(self, job: Dict[str, Any]) -> Optional[int]:
+        """Get a queued job's position (1 = next to be submitted)."""
+        for position, queued in enumerate(self.get_dispatch_order(), start=1):
+            if queued is job:
+                return position
+        return None
+    
+    def get_queue_length(self) -> int:
+        """Get number of queued (not yet submitted) jobs."""
+        return sum(len(user_jobs) for users in self.lanes.values() for user_jobs in users.values())
+    
+    # ========================================================================
+    # ADMISSION CONTROL
+    # ========================================================================
+    
+    async def get_comfyui_queue(self, base_url: str, max_age: float = None) -> Optional[Dict[str, Any]]:
+        """
+        Get ComfyUI's queue, reusing a recent read.
+        
+        Args:
+            base_url: ComfyUI base URL
+            max_age: Max age of a cached read (default: config.ADMISSION_CONTROL['queue_cache_ttl'])
+        
+        Returns:
+            {'queue_running': [...], 'queue_pending': [...]} or None if unreachable
+        """
+        if max_age is None:
+            max_age = config.ADMISSION_CONTROL['queue_cache_ttl']
+        
+        cached = self._queue_cache.get(base_url)
+        if cached and time.monotonic() - cached[0] <= max_age:
+            return cached[1]
+        
+        queue = await utils.get_comfyui_queue(base_url)
+        if queue is not None:
+            self._queue_cache[base_url] = (time.monotonic(), queue)
+        return queue
+    
+    async def get_loads(self, max_age: float = None) -> Dict[str, Optional[int]]:
+        """
+        Get the queue depth of every deployment that can take jobs.
+        
+        Returns:
+            Dict mapping ComfyUI URL -> prompts running or pending (None if unreachable)
+        """
+        urls = [deployment['comfyui_url'] for deployment in deployment_pool.get_targets()]
+        queues = await asyncio.gather(*(self.get_comfyui_queue(url, max_age) for url in urls))
+        
+        loads = {}
+        for url, queue in zip(urls, queues):
+            if queue is None:
+                loads[url] = None
+            else:
+                loads[url] = len(queue.get('queue_running', [])) + len(queue.get('queue_pending', []))
+        return loads
+    
+    def get_expected_duration(self, workflow_name: str = None) -> float:
+        """
+        Get how long a job usually runs, from recent jobs.
+        
+        Args:
+            workflow_name: Workflow to estimate (default: any workflow)
+        
+        Returns:
+            Median run time in seconds (config's default if there is no history)
+        """
+        if workflow_name:
+            samples = list(self.durations.get(workflow_name, []))
+        else:
+            samples = [duration for durations in self.durations.values() for duration in durations]
+        
+        if not samples:
+            return config.ADMISSION_CONTROL['default_job_seconds']
+        return statistics.median(samples)
+    
+    def is_heavy(self, workflow_name: str) -> bool:
+        """Check if a workflow is a long-running one (e.g. video)."""
+        settings = config.ADMISSION_CONTROL
+        if workflow_name in self.durations:
+            return self.get_expected_duration(workflow_name) >= settings['heavy_job_seconds']
+        
+        name = workflow_name.lower()
+        return any(keyword in name for keyword in settings['heavy_keywords'])
+    
+    def estimate_wait(self, comfyui_depth: int, deployments: int = 1) -> float:
+        """
+        Estimate how long a new job waits before it starts.
+        
+        Args:
+            comfyui_depth: Prompts running or pending on all deployments
+            deployments: Deployments working through the queue in parallel
+        
+        Returns:
+            Estimated wait in seconds
+        """
+        seconds = 0.0
+        for job in self.get_dispatch_order():
+            prompts = 1
+            if job['batch']:
+                prompts = len(job['batch'].get('seeds') or [None])
+                for values in (job['batch'].get('sweep') or {}).values():
+                    prompts *= len(values)
+            seconds += prompts * self.get_expected_duration(job['workflow_name'])
+        seconds += comfyui_depth * self.get_expected_duration()
+        return seconds / max(1, deployments)
+    
+    async def admit(self, user_id: int, workflow_name: str, lane: str = None) -> Tuple[bool, str, str]:
+        """
+        Decide whether to take a new job, based on how backed up ComfyUI is.
+        
+        Below 'defer_depth' jobs are simply queued. From 'defer_depth' on, the
+        user is told the expected wait, and heavy workflows go to the lowest
+        lane so they don't hold up quick ones. From 'reject_depth' on, new
+        jobs are rejected with an ETA (the owner is never rejected).
+        
+        Args:
+            user_id: Discord user who requested the job
+            workflow_name: Workflow name
+            lane: Requested lane (default: based on the user)
+        
+        Returns:
+            (admitted, lane, message) where message is empty if nothing needs saying
+        """
+        if lane is None:
+            lane = self.get_lane_for_user(user_id)
+        
+        settings = config.ADMISSION_CONTROL
+        if not settings['enabled']:
+            return True, lane, ""
+        
+        loads = await self.get_loads()
+        comfyui_depth = sum(load for load in loads.values() if load)
+        deployments = max(1, len(loads))
+        
+        # Thresholds are per deployment, so the pool takes more before it defers
+        depth = comfyui_depth + self.get_queue_length()
+        if depth < settings['defer_depth'] * deployments:
+            return True, lane, ""
+        
+        eta = utils.format_time_remaining(int(self.estimate_wait(comfyui_depth, deployments)))
+        is_owner = lane == config.JOB_QUEUE['lanes'][0]
+        
+        if depth >= settings['reject_depth'] * deployments and not is_owner:
+            logger.info(f"Rejected job for user {user_id}: {depth} jobs ahead")
+            return False, lane, (
+                f"The generator is busy ({depth} jobs ahead, about {eta} of work). "
+                f"Please try again later."
+            )
+        
+        message = f"The generator is busy: {depth} jobs ahead, expected wait ~{eta}."
+        if not is_owner and self.is_heavy(workflow_name):
+            lane = config.JOB_QUEUE['lanes'][-1]
+            message += " Long-running workflows wait until the queue clears."
+        
+        return True, lane, message
+    
+    # ========================================================================
+    # CANCELLATION
+    # ========================================================================
+    
+    async def cancel(self, job: Dict[str, Any]) -> bool:
+        """
+        Cancel a job (queued jobs are dropped, submitted ones cancelled on ComfyUI).
+        
+        Returns:
+            True if cancelled, False if it already finished
+        """
+        if job['state'] == 'queued':
+            if not self._remove_queued(job):
+                return False
+        elif job['state'] == 'submitted':
+            from execution_tracker import execution_tracker
+            
+            running = False
+            for prompt_id in job['prompt_ids']:
+                tracked = execution_tracker.get_job(prompt_id)
+                if not tracked:
+                    continue  # Already finished
+                is_running = tracked['status'] == 'running'
+                if is_running:
+                    # Its interruption is reported, but not delivered as a failure
+                    tracked['cancelled'] = True
+                    running = True
+                else:
+                    # ComfyUI sends no event for prompts deleted from its queue
+                    await execution_tracker.discard(prompt_id)
+                await utils.cancel_comfyui_prompt(job['base_url'], prompt_id, running=is_running)
+            
+            if job['batch_run']:
+                job['batch_run']['status'] = 'cancelled'  # Stops its progress updates and delivery
+        else:
+            return False
+        
+        job['state'] = 'cancelled'
+        logger.info(f"Cancelled job {job['job_id']}")
+        
+        # A single running prompt frees its slot when the interruption is reported;
+        # discarded prompts (and a cancelled batch) never report back
+        if job['batch_run'] or not running:
+            self._release(job, 'cancelled')
+        
+        await self._update_status(
+            job,
+            f"{ICONS['stop']} Cancelled",
+            f"Workflow: `{job['workflow_name']}`",
+            COLORS['warning']
+        )
+        return True
+    
+    async def cancel_user_jobs(self, user_id: int) -> int:
+        """
+        Cancel all of a user's jobs.
+        
+        Returns:
+            Number of jobs cancelled
+        """
+        cancelled = 0
+        for job in self.get_user_jobs(user_id):
+            if await self.cancel(job):
+                cancelled += 1
+        return cancelled
+    
+    # ========================================================================
+    # DISPATCHING
+    # ========================================================================
+    
+    def _get_in_flight(self, base_url: str) -> int:
+        """Get number of the bot's unfinished jobs on a deployment."""
+        return sum(1 for job in self.in_flight.values() if job['base_url'] == base_url)
+    
+    async def _pick_deployment(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Pick the deployment to submit a job to.
+        
+        Returns:
+            Best ranked deployment with room, or None if all are full or unreachable
+        """
+        loads = await self.get_loads(max_age=0)
+        ranked = deployment_pool.rank(
+            {url: load for url, load in loads.items() if load is not None},
+            heavy=self.is_heavy(job['workflow_name'])
+        )
+        
+        for deployment in ranked:
+            url = deployment['comfyui_url']
+            if loads.get(url) is None:
+                continue  # Server unreachable, try again later
+            if self._get_in_flight(url) >= config.JOB_QUEUE['max_in_flight']:
+                continue
+            if loads[url] >= config.JOB_QUEUE['max_comfyui_queue']:
+                continue
+            return deployment
+        return None
+    
+    async def _dispatch_loop(self):
+        """Submit queued jobs whenever ComfyUI has room."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=config.JOB_QUEUE['poll_interval'])
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            
+            try:
+                while self.get_queue_length():
+                    deployment = await self._pick_deployment(self.get_dispatch_order()[0])
+                    if not deployment:
+                        break
+                    await self._submit(self._pop_next(), deployment)
+            except Exception as e:
+                logger.error(f"Error in job dispatcher: {e}")
+    
+    async def _submit(self, job: Dict[str, Any], deployment: Dict[str, Any]):
+        """Submit a job to a deployment's ComfyUI through the workflow manager."""
+        job['state'] = 'submitted'
+        job['submitted_at'] = time.monotonic()
+        job['base_url'] = deployment['comfyui_url']
+        job['deployment'] = deployment['username']
+        self.in_flight[job['job_id']] = job
+        
+        logger.info(
+            f"Submitting job {job['job_id']} to '{deployment['username'] or 'default'}' after "
+            f"{job['submitted_at'] - job['queued_at']:.1f}s in the bot queue"
+        )
+        
+        await self._update_status(
+            job,
+            f"{ICONS['loading']} Generating...",
+            f"Workflow: `{job['workflow_name']}`\nPrompt: {job['prompt'][:100]}...",
+            COLORS['progress']
+        )
+        
+        async def finished(result: Dict[str, Any]):
+            self._release(job, 'done' if result['status'] == 'success' else 'failed', result)
+        
+        if job['batch']:
+            success, msg, response = await self.workflow_manager.generate_batch(
+                job['workflow_name'],
+                job['prompt'],
+                seeds=job['batch'].get('seeds'),
+                sweep=job['batch'].get('sweep'),
+                params=job['params'],
+                guild=job['guild'],
+                status_message=job['status_message'],
+                on_finish=finished,
+                use_cache=job['use_cache'],
+                base_url=job['base_url']
+            )
+        else:
+            success, msg, response = await self.workflow_manager.generate_with_workflow(
+                job['workflow_name'],
+                job['prompt'],
+                guild=job['guild'],
+                status_message=job['status_message'],
+                live_preview=job['live_preview'],
+                on_finish=finished,
+                params=job['params'],
+                use_cache=job['use_cache'],
+                base_url=job['base_url']
+            )
+        
+        if not success:
+            self._release(job, 'failed')
+            await self._update_status(job, f"{ICONS['error']} Generation Failed", msg, COLORS['error'])
+            return
+        
+        if job['batch']:
+            job['batch_run'] = response
+            job['prompt_ids'] = response['prompt_ids']
+        elif response.get('prompt_id'):
+            job['prompt_ids'] = [response['prompt_id']]
+        
+        if not job['prompt_ids']:
+            # Can't be tracked, so don't hold its slot
+            self._release(job, 'done')
+    
+    def _release(self, job: Dict[str, Any], state: str, tracked: Dict[str, Any] = None):
+        """
+        Free a job's in-flight slot.
+        
+        Args:
+            job: The scheduler job
+            state: State the job ends in ('done', 'failed' or 'cancelled')
+            tracked: The execution tracker's job for a finished single prompt
+        """
+        if self.in_flight.pop(job['job_id'], None) is None:
+            return
+        if job['state'] != 'cancelled':
+            job['state'] = state
+        
+        # Learn run times of single jobs for ETAs (batches run many prompts). Only the
+        # execution counts: time spent waiting in ComfyUI's queue is what the ETA adds on top
+        if job['state'] == 'done' and tracked and not tracked.get('cached') and not job['batch']:
+            from execution_tracker import execution_tracker
+            execution_time = execution_tracker.get_execution_time(tracked)
+            if execution_time is not None:
+                durations = self.durations.setdefault(
+                    job['workflow_name'], deque(maxlen=config.ADMISSION_CONTROL['duration_samples'])
+                )
+                durations.append(execution_time)
+        self._wakeup.set()
+    
+    async def _update_status(self, job: Dict[str, Any], title: str, description: str, color: int):
+        """Update a job's status message."""
+        if not job['status_message']:
+            return
+        
+        try:
+            embed = discord.Embed(title=title, description=description, color=color)
+            await job['status_message'].edit(content=None, embed=embed)
+        except Exception as e:
+            logger.warning(f"Failed to update status for job {job['job_id']}: {e}")
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+job_scheduler = GenerationScheduler()
+
+# ============================================================================
+# END OF JOB SCHEDULER
+# ============================================================================
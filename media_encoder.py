@@ -0,0 +1,360 @@
+"""
+Media Encoder Module
+====================
+Shrinks outputs that are too large for a Discord upload:
+- Images are re-encoded as lossy WebP/JPEG (quality first, then resolution)
+- Videos are re-encoded at a lower bitrate, resolution or frame rate
+- Encoding runs in a process pool so the event loop never blocks
+- Results are cached by source hash, so each file is only encoded once
+"""
+
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple, BinaryIO, Union
+from PIL import Image
+import config
+import utils
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.webp']
+VIDEO_EXTENSIONS = ['.mp4', '.webm']
+
+# ============================================================================
+# WORKER FUNCTIONS (run inside the process pool)
+# ============================================================================
+
+def _partial_path(destination_stem: str, extension: str) -> str:
+    """
+    Create a unique temporary file next to the cache entries.
+    
+    Its name never matches OutputEncoder._find_cached ("{key}.*"), so a
+    concurrent request or a crash mid-write can't serve it.
+    """
+    stem = Path(destination_stem)
+    fd, path = tempfile.mkstemp(prefix=stem.name + '-', suffix='-partial' + extension, dir=stem.parent)
+    os.close(fd)
+    return path
+
+def _write_output(destination_stem: str, extension: str, data: bytes) -> str:
+    """Write an encoded file under a temporary name and move it into place."""
+    destination = destination_stem + extension
+    partial = _partial_path(destination_stem, extension)
+    try:
+        Path(partial).write_bytes(data)
+        Path(partial).replace(destination)
+    finally:
+        Path(partial).unlink(missing_ok=True)
+    return destination
+
+def _encode_image(image: Image.Image, image_format: str, quality: int) -> bytes:
+    """Encode an image to bytes with the given format and quality."""
+    buffer = io.BytesIO()
+    
+    if image_format == 'JPEG':
+        image = image.convert('RGB')
+        image.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, format=image_format, quality=quality, method=4)
+    
+    return buffer.getvalue()
+
+def fit_image(source: str, destination_stem: str, max_bytes: int) -> Optional[str]:
+    """
+    Re-encode an image until it fits in max_bytes.
+    
+    For each resolution step (largest first), the best quality that fits is
+    found with a binary search. The first format/resolution that fits wins.
+    
+    Returns:
+        Path to the encoded file or None if nothing fits
+    """
+    settings = config.REENCODE
+    
+    with Image.open(source) as original:
+        if getattr(original, 'is_animated', False):
+            return _fit_animated_image(original, destination_stem, max_bytes)
+        
+        original.load()
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+        
+        for scale in settings['image_scales']:
+            if scale < 1.0:
+                size = (max(1, int(original.width * scale)), max(1, int(original.height * scale)))
+                image = original.resize(size, Image.LANCZOS)
+            else:
+                image = original
+            
+            for image_format in settings['image_formats']:
+                low = settings['image_min_quality']
+                high = settings['image_max_quality']
+                
+                # Nothing fits at this resolution, try a smaller one
+                best = _encode_image(image, image_format, low)
+                if len(best) > max_bytes:
+                    continue
+                
+                while low < high:
+                    quality = (low + high + 1) // 2
+                    data = _encode_image(image, image_format, quality)
+                    if len(data) <= max_bytes:
+                        low, best = quality, data
+                    else:
+                        high = quality - 1
+                
+                extension = '.webp' if image_format == 'WEBP' else '.jpg'
+                return _write_output(destination_stem, extension, best)
+    
+    return None
+
+def _fit_animated_image(original: Image.Image, destination_stem: str, max_bytes: int) -> Optional[str]:
+    """Re-encode an animated GIF/WebP as an animated WebP that fits in max_bytes."""
+    settings = config.REENCODE
+    
+    for scale in settings['image_scales']:
+        frames = []
+        durations = []
+        for index in range(original.n_frames):
+            original.seek(index)
+            frame = original.convert('RGBA')
+            if scale < 1.0:
+                size = (max(1, int(frame.width * scale)), max(1, int(frame.height * scale)))
+                frame = frame.resize(size, Image.LANCZOS)
+            frames.append(frame)
+            durations.append(original.info.get('duration', 100))
+        
+        for quality in (settings['image_max_quality'], 70, settings['image_min_quality']):
+            buffer = io.BytesIO()
+            frames[0].save(
+                buffer,
+                format='WEBP',
+                save_all=True,
+                append_images=frames[1:],
+                duration=durations,
+                loop=0,
+                quality=quality
+            )
+            
+            if buffer.tell() <= max_bytes:
+                return _write_output(destination_stem, '.webp', buffer.getvalue())
+    
+    return None
+
+def _probe_video(source: str) -> Tuple[float, bool]:
+    """Get (duration_seconds, has_audio) for a video using ffprobe."""
+    result = subprocess.run(
+        [
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration:stream=codec_type',
+            '-of', 'json', source
+        ],
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    info = json.loads(result.stdout or '{}')
+    duration = float(info.get('format', {}).get('duration') or 0)
+    has_audio = any(s.get('codec_type') == 'audio' for s in info.get('streams', []))
+    return duration, has_audio
+
+def fit_video(source: str, destination_stem: str, max_bytes: int) -> Optional[str]:
+    """
+    Re-encode a video until it fits in max_bytes.
+    
+    The bitrate is derived from the duration and the size budget. If that
+    bitrate is too low for a watchable result at a given resolution, the
+    resolution is reduced; at the smallest resolution frames are dropped.
+    
+    Returns:
+        Path to the encoded file or None if nothing fits
+    """
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        return None
+    
+    duration, has_audio = _probe_video(source)
+    if duration <= 0:
+        return None
+    
+    destination = destination_stem + '.mp4'
+    # Encoded under another name, so a failed or oversized try is never found as a cache hit
+    partial = _partial_path(destination_stem, '.mp4')
+    
+    try:
+        return _encode_video(source, partial, destination, max_bytes, duration, has_audio)
+    finally:
+        Path(partial).unlink(missing_ok=True)
+
+def _encode_video(
+    source: str,
+    partial: str,
+    destination: str,
+    max_bytes: int,
+    duration: float,
+    has_audio: bool
+) -> Optional[str]:
+    """Try fit_video's resolution steps, moving the first encode that fits to destination."""
+    settings = config.REENCODE
+    audio_kbps = settings['video_audio_bitrate_kbps'] if has_audio else 0
+    budget_kbps = max_bytes * 8 / 1000 / duration
+    heights = settings['video_heights']
+    
+    for index, height in enumerate(heights):
+        video_kbps = int(budget_kbps - audio_kbps)
+        is_last = index == len(heights) - 1
+        
+        if video_kbps < settings['video_min_bitrate_kbps'] and not is_last:
+            continue
+        
+        filters = []
+        if height:
+            filters.append(f"scale=-2:'min({height},ih)'")
+        if video_kbps < settings['video_min_bitrate_kbps']:
+            filters.append(f"fps={settings['video_decimated_fps']}")
+        
+        # Two tries per step: the encoder may overshoot the target bitrate
+        for attempt_kbps in (video_kbps, int(video_kbps * 0.8)):
+            if attempt_kbps <= 0:
+                return None
+            
+            command = ['ffmpeg', '-y', '-v', 'error', '-i', source]
+            if filters:
+                command += ['-vf', ','.join(filters)]
+            command += [
+                '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+                '-b:v', f'{attempt_kbps}k',
+                '-maxrate', f'{attempt_kbps}k',
+                '-bufsize', f'{attempt_kbps * 2}k',
+            ]
+            command += ['-c:a', 'aac', '-b:a', f'{audio_kbps}k'] if has_audio else ['-an']
+            command += ['-movflags', '+faststart', partial]
+            
+            result = subprocess.run(command, capture_output=True, timeout=1800)
+            if result.returncode != 0:
+                return None
+            
+            if Path(partial).stat().st_size <= max_bytes:
+                Path(partial).replace(destination)
+                return destination
+    
+    return None
+
+# ============================================================================
+# OUTPUT ENCODER CLASS
+# ============================================================================
+
+class OutputEncoder:
+    """Re-encodes oversized outputs so they fit Discord's upload limit."""
+    
+    def __init__(self, cache_dir: Path = None):
+        """
+        Initialize output encoder.
+        
+        Args:
+            cache_dir: Directory for encoded files (default: config.ENCODED_CACHE_DIR)
+        """
+        if cache_dir is None:
+            cache_dir = config.ENCODED_CACHE_DIR
+        
+        self.cache_dir = cache_dir
+    
+    def get_max_bytes(self) -> int:
+        """Get the target upload size in bytes."""
+        limit = config.MAX_DISCORD_FILE_SIZE * 1024 * 1024
+        return int(limit * config.REENCODE['size_margin'])
+    
+    def _find_cached(self, cache_key: str) -> Optional[Path]:
+        """Find a previously encoded file for a cache key."""
+        for path in self.cache_dir.glob(f"{cache_key}.*"):
+            return path
+        return None
+    
+    async def fit_for_discord(
+        self,
+        output: Union[Path, BinaryIO],
+        filename: str
+    ) -> Optional[Tuple[Path, str]]:
+        """
+        Re-encode an output so it fits Discord's upload limit.
+        
+        Args:
+            output: Path to the output, or an open binary file object
+            filename: Original output filename
+        
+        Returns:
+            (encoded_path, upload_filename) or None if it can't be made to fit
+        """
+        if not config.REENCODE['enabled']:
+            return None
+        
+        extension = Path(filename).suffix.lower()
+        if extension in IMAGE_EXTENSIONS:
+            worker = fit_image
+        elif extension in VIDEO_EXTENSIONS:
+            worker = fit_video
+        else:
+            return None
+        
+        # The worker processes need the source on disk
+        stream_name = getattr(output, 'name', None)
+        if isinstance(output, Path):
+            source = output
+        elif isinstance(stream_name, str) and Path(stream_name).is_file():
+            source = Path(stream_name)
+        else:
+            spool_file = await utils.spool_stream(output, filename)
+            try:
+                return await self._fit_file(spool_file, filename, worker)
+            finally:
+                spool_file.unlink(missing_ok=True)
+        
+        return await self._fit_file(source, filename, worker)
+    
+    async def _fit_file(self, source: Path, filename: str, worker) -> Optional[Tuple[Path, str]]:
+        """Re-encode (or find the cached re-encode of) a source file on disk."""
+        utils.ensure_directory(self.cache_dir)
+        max_bytes = self.get_max_bytes()
+        source_hash = await utils.run_in_process(utils.hash_file, source)
+        cache_key = f"{source_hash}-{max_bytes}"
+        
+        encoded = self._find_cached(cache_key)
+        if encoded:
+            logger.info(f"Using cached re-encode of '{filename}'")
+        else:
+            logger.info(f"Re-encoding '{filename}' to fit {max_bytes / (1024 * 1024):.1f}MB")
+            try:
+                result = await utils.run_in_process(
+                    worker,
+                    str(source),
+                    str(self.cache_dir / cache_key),
+                    max_bytes
+                )
+            except Exception as e:
+                logger.error(f"Failed to re-encode '{filename}': {e}")
+                return None
+            
+            if not result:
+                logger.warning(f"Could not re-encode '{filename}' under the size limit")
+                return None
+            
+            encoded = Path(result)
+        
+        upload_name = Path(filename).stem + encoded.suffix
+        return encoded, upload_name
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+output_encoder = OutputEncoder()
+
+# ============================================================================
+# END OF MEDIA ENCODER
+# ============================================================================
@@ -4,18 +4,24 @@ Modal Manager Module
 Handles all Modal.com operations:
 - Profile management (create, activate, switch)
 - Token authentication
-- App deployment and control
+- App deployment and control (one deployment per account, see deployment_pool.py)
 - Credit balance checking
 - Volume operations
 """
 
 import logging
 import asyncio
-from typing import Optional, Dict, Any, Tuple
+import time
+from typing import Optional, Dict, Any, Tuple, BinaryIO, Callable, Awaitable
 from pathlib import Path
 import config
 import utils
+import provisioning
 from account_manager import account_manager
+from deployment_pool import deployment_pool
+from gpu_advisor import gpu_advisor
+from execution_tracker import execution_tracker
+from readiness_prober import readiness_prober
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +34,13 @@ class ModalManager:
     
     def __init__(self):
         """Initialize Modal manager."""
-        self.current_deployment = None  # Track current deployment info
+        self.restarting = set()  # Usernames whose deployment is being restarted
+        self.setting_up = set()  # Usernames with a setup running (one at a time per volume)
+    
+    @property
+    def current_deployment(self) -> Optional[Dict[str, Any]]:
+        """The first running deployment (None if nothing is running)."""
+        return deployment_pool.get_primary()
     
     # ========================================================================
     # PROFILE MANAGEMENT
@@ -48,39 +60,13 @@ class ModalManager:
         """
         logger.info(f"Creating Modal profile: {username}")
         
-        # Modern Modal CLI (v0.63+) uses ~/.modal.toml for profile management
-        # We need to add the profile to the .modal.toml file
-        from pathlib import Path
-        import os
-        
-        modal_config_path = Path.home() / ".modal.toml"
-        
         try:
-            # Read existing config or create empty string
-            if modal_config_path.exists():
-                with open(modal_config_path, 'r') as f:
-                    config_content = f.read()
-            else:
-                config_content = ""
-            
-            # Check if profile already exists
-            if f"[{username}]" in config_content:
+            if not self._write_profile(username, token_id, token_secret):
                 logger.info(f"Profile '{username}' already exists in .modal.toml")
                 # Just activate it
                 success, msg = await self.activate_profile(username)
                 return success, msg if success else f"Profile exists but failed to activate: {msg}"
             
-            # Add new profile section
-            new_profile = f"\n[{username}]\n"
-            new_profile += f'token_id = "{token_id}"\n'
-            new_profile += f'token_secret = "{token_secret}"\n'
-            
-            # Write updated config
-            with open(modal_config_path, 'a') as f:
-                f.write(new_profile)
-            
-            logger.info(f"Added profile '{username}' to .modal.toml")
-            
             # Activate the new profile
             success, msg = await self.activate_profile(username)
             if not success:
@@ -88,12 +74,69 @@ class ModalManager:
             
             logger.info(f"Modal profile '{username}' created and activated successfully")
             return True, f"Profile '{username}' created successfully!"
-            
+        
         except Exception as e:
             error_msg = f"Failed to create profile: {str(e)}"
             logger.error(error_msg)
             return False, error_msg
     
+    def _write_profile(self, username: str, token_id: str, token_secret: str) -> bool:
+        """
+        Add a profile to ~/.modal.toml without activating it.
+        
+        Returns:
+            True if added, False if it already existed
+        """
+        # Modern Modal CLI (v0.63+) uses ~/.modal.toml for profile management
+        modal_config_path = Path.home() / ".modal.toml"
+        
+        # Read existing config or create empty string
+        if modal_config_path.exists():
+            with open(modal_config_path, 'r') as f:
+                config_content = f.read()
+        else:
+            config_content = ""
+        
+        # Check if profile already exists
+        if f"[{username}]" in config_content:
+            return False
+        
+        # Add new profile section
+        new_profile = f"\n[{username}]\n"
+        new_profile += f'token_id = "{token_id}"\n'
+        new_profile += f'token_secret = "{token_secret}"\n'
+        
+        # Write updated config
+        with open(modal_config_path, 'a') as f:
+            f.write(new_profile)
+        
+        logger.info(f"Added profile '{username}' to .modal.toml")
+        return True
+    
+    async def ensure_profile(self, username: str) -> Tuple[bool, str]:
+        """
+        Make sure an account has a Modal profile, without switching to it.
+        
+        Commands for that account can then run with MODAL_PROFILE set.
+        
+        Args:
+            username: Account username
+        
+        Returns:
+            (success, message)
+        """
+        creds = account_manager.get_decrypted_credentials(username)
+        if not creds:
+            return False, f"Failed to decrypt credentials for '{username}'"
+        
+        try:
+            self._write_profile(username, creds['token_id'], creds['token_secret'])
+        except Exception as e:
+            logger.error(f"Failed to write profile for '{username}': {e}")
+            return False, f"Failed to create profile: {e}"
+        
+        return True, f"Profile '{username}' is available"
+    
     async def activate_profile(self, username: str) -> Tuple[bool, str]:
         """
         Activate a Modal profile (switch to it).
@@ -236,8 +279,10 @@ class ModalManager:
         """
         logger.info("Finding next available account...")
         
-        # Get next available account
-        next_account = account_manager.get_next_available_account()
+        # Get next available account, preferring ones that need no setup
+        next_account = account_manager.get_next_available_account(
+            prefer_version=provisioning.manifest_version()
+        )
         
         if not next_account:
             return False, "No available accounts with sufficient balance", None
@@ -318,36 +363,203 @@ class ModalManager:
     # COMFYUI DEPLOYMENT
     # ========================================================================
     
-    async def deploy_setup(self, username: str, gpu: str = "T4") -> Tuple[bool, str]:
+    async def deploy_setup(
+        self,
+        username: str,
+        gpu: str = "T4",
+        activate: bool = True,
+        on_stage: Callable[[str], None] = None
+    ) -> Tuple[bool, str]:
         """
         Run complete setup process (app1.py then app2.py sequentially).
         
-        Step 1 (app1.py): Download models, clone repos - 2 hour timeout
+        Step 1 (app1.py): Sync ComfyUI, custom nodes and models with
+                          provisioning.json (only what's missing or changed) - 2 hour timeout
         Step 2 (app2.py): Install dependencies - 20 minute timeout
         
+        Steps the volume's provisioning marker shows as complete for the
+        current manifest are skipped, so a provisioned account returns at once.
+        
         Args:
             username: Account to deploy on
             gpu: GPU to use for setup (default: T4)
+            activate: Switch to the account first; False builds it in the
+                      background (e.g. a standby) without touching the active one
+            on_stage: Called with 'checking', 'step1', 'step2' or 'skipped' as setup progresses
         
         Returns:
             (success, message)
         """
+        # Two setups writing the same volume would corrupt each other's downloads
+        if username in self.setting_up:
+            return False, f"Setup is already running on `{username}`"
+        
+        self.setting_up.add(username)
+        try:
+            return await self._deploy_setup(username, gpu, activate, on_stage)
+        finally:
+            self.setting_up.discard(username)
+    
+    async def _deploy_setup(
+        self,
+        username: str,
+        gpu: str,
+        activate: bool,
+        on_stage: Callable[[str], None]
+    ) -> Tuple[bool, str]:
+        """Run the setup steps deploy_setup() describes (one setup per account at a time)."""
         logger.info(f"Starting setup for '{username}' on GPU: {gpu}")
         
-        # Make sure account is active
-        success, msg = await self.switch_to_account(username)
-        if not success:
-            return False, f"Failed to switch account: {msg}"
+        if activate:
+            # Make sure account is active
+            success, msg = await self.switch_to_account(username)
+            if not success:
+                return False, f"Failed to switch account: {msg}"
+        else:
+            success, msg = await self.ensure_profile(username)
+            if not success:
+                return False, msg
+        
+        if on_stage:
+            on_stage('checking')
+        
+        # Skip what an earlier setup already finished
+        stages = await self.probe_provisioning(username)
+        if stages['step1'] and stages['step2']:
+            if on_stage:
+                on_stage('skipped')
+            logger.info(f"'{username}' is already provisioned for manifest {stages['expected']}, skipping setup")
+            account_manager.update_status(username, 'ready')
+            return True, "✅ Already set up for the current manifest, nothing to do. Use /start to run ComfyUI."
         
         # Update status
         account_manager.update_status(username, 'building')
         
         # ===== STEP 1: Run app1.py =====
+        if stages['step1']:
+            logger.info(f"Setup step 1 already complete for '{username}', skipping")
+        else:
+            if on_stage:
+                on_stage('step1')
+            success, msg = await self._run_setup_step1(username, gpu)
+            if not success:
+                account_manager.update_status(username, 'ready')
+                return False, msg
+        
+        # ===== STEP 2: Run app2.py =====
+        # Step 2 always follows a step 1 run: new custom nodes bring new dependencies
+        logger.info(f"Running setup step 2 (app2.py) for '{username}'")
+        if on_stage:
+            on_stage('step2')
+        app2_path = config.BASE_DIR / 'app2.py'
+        
+        # Use friend's pattern: modal run app.py::run
+        # MODAL_PROFILE runs it on this account whatever profile is active
+        command = f"MODAL_PROFILE={username} GPU_TYPE={gpu} modal run {app2_path}::run"
+        
+        # 20 minute timeout for step 2
+        return_code, stdout, stderr = await utils.run_command(command, timeout=1200)
+        
+        if return_code != 0:
+            error_msg = f"Setup step 2 failed: {stderr}"
+            logger.error(error_msg)
+            account_manager.update_status(username, 'ready')
+            return False, error_msg
+        
+        # Update status to ready (not active, since setup doesn't start services)
+        account_manager.update_status(username, 'ready')
+        
+        # Both steps exit cleanly even if some items or installs failed; the marker knows
+        stages = await self.probe_provisioning(username)
+        if stages['step2']:
+            logger.info(f"Setup completed for '{username}'")
+            return True, "✅ Setup complete! Both steps finished successfully. Use /start to run ComfyUI."
+        
+        if stages['step1']:
+            logger.warning(f"Setup of '{username}' finished step 1 only")
+            return False, ("⚠️ Setup partly complete: ComfyUI, custom nodes and models are in place, "
+                           "but the dependencies did not install. Run setup again to retry step 2.")
+        
+        logger.warning(f"Setup of '{username}' left items unsynced")
+        return False, ("⚠️ Setup incomplete: some custom nodes or models failed to download. "
+                       "Run setup again to fetch only what's missing.")
+    
+    async def deploy_setup_many(
+        self,
+        usernames: list[str],
+        max_parallel: int = None,
+        progress: Dict[str, Dict[str, Any]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Run setup on several accounts at once, without switching the active account.
+        
+        Each build runs on its own account (and volume) on SETUP_GPU, so they
+        don't share anything but the bot's machine.
+        
+        Args:
+            usernames: Accounts to set up
+            max_parallel: Builds running at the same time (default: config.SETUP_ALL['max_parallel'])
+            progress: Dict to fill in as builds progress, so a caller can show it while they run
+        
+        Returns:
+            Maps username -> {'state' ('queued', 'checking', 'step1', 'step2', 'skipped',
+            'done' or 'failed'), 'started_at', 'finished_at', 'message'}
+        """
+        if max_parallel is None:
+            max_parallel = config.SETUP_ALL['max_parallel']
+        if progress is None:
+            progress = {}
+        
+        for username in usernames:
+            progress[username] = {'state': 'queued', 'started_at': None, 'finished_at': None, 'message': ''}
+        
+        semaphore = asyncio.Semaphore(max_parallel)
+        
+        async def build(username: str):
+            entry = progress[username]
+            async with semaphore:
+                if username in self.setting_up:
+                    entry['state'] = 'skipped'
+                    entry['message'] = "Setup was already running"
+                    return
+                
+                entry['started_at'] = time.time()
+                
+                def on_stage(stage: str):
+                    entry['state'] = stage
+                
+                try:
+                    success, msg = await self.deploy_setup(
+                        username, config.SETUP_GPU, activate=False, on_stage=on_stage
+                    )
+                except Exception as e:
+                    logger.error(f"Setup of '{username}' raised: {e}")
+                    success, msg = False, str(e)
+                
+                entry['finished_at'] = time.time()
+                entry['message'] = msg
+                if not success:
+                    entry['state'] = 'failed'
+                elif entry['state'] != 'skipped':
+                    entry['state'] = 'done'
+        
+        logger.info(f"Setting up {len(usernames)} account(s), {max_parallel} at a time")
+        await asyncio.gather(*(build(username) for username in usernames))
+        return progress
+    
+    async def _run_setup_step1(self, username: str, gpu: str) -> Tuple[bool, str]:
+        """Run app1.py (sync the volume with provisioning.json) on an account."""
         logger.info(f"Running setup step 1 (app1.py) for '{username}'")
         app1_path = config.BASE_DIR / 'app1.py'
         
         # Use friend's pattern: modal run app.py::run
-        command = f"GPU_TYPE={gpu} modal run {app1_path}::run"
+        downloads = config.MODEL_DOWNLOADS
+        command = (
+            f"MODAL_PROFILE={username} GPU_TYPE={gpu} modal run {app1_path}::run "
+            f"--max-downloads {downloads['max_concurrent']} "
+            f"--connections-per-file {downloads['connections_per_file']} "
+            f"--clone-workers {config.CUSTOM_NODE_CLONES['max_concurrent']}"
+        )
         
         # 2 hour timeout for step 1
         return_code, stdout, stderr = await utils.run_command(command, timeout=7200)
@@ -355,41 +567,109 @@ class ModalManager:
         if return_code != 0:
             error_msg = f"Setup step 1 failed: {stderr}"
             logger.error(error_msg)
-            account_manager.update_status(username, 'ready')
             return False, error_msg
         
         logger.info(f"Setup step 1 completed for '{username}'")
+        return True, "Setup step 1 completed"
+    
+    async def probe_provisioning(self, username: str) -> Dict[str, Any]:
+        """
+        Check which setup steps an account's volume has finished, and cache it.
         
-        # ===== STEP 2: Run app2.py =====
-        logger.info(f"Running setup step 2 (app2.py) for '{username}'")
-        app2_path = config.BASE_DIR / 'app2.py'
+        Reads the marker app1.py/app2.py leave on the volume (one small file,
+        no container) and compares it with the local manifest's version.
         
-        # Use friend's pattern: modal run app.py::run
-        command = f"GPU_TYPE={gpu} modal run {app2_path}::run"
+        Args:
+            username: Account whose volume to check
         
-        # 20 minute timeout for step 2
-        return_code, stdout, stderr = await utils.run_command(command, timeout=1200)
+        Returns:
+            {'expected' (manifest version), 'step1', 'step2' (bool each)}
+        """
+        expected = provisioning.manifest_version()
+        stages = {'expected': expected, 'step1': False, 'step2': False}
         
-        if return_code != 0:
-            error_msg = f"Setup step 2 failed: {stderr}"
-            logger.error(error_msg)
-            account_manager.update_status(username, 'ready')
-            return False, error_msg
+        success, msg = await self.ensure_profile(username)
+        if not success:
+            logger.warning(f"Cannot probe provisioning for '{username}': {msg}")
+            return stages
         
-        logger.info(f"Setup completed for '{username}'")
+        marker_file = config.TEMP_DIR / f"provisioning_marker_{username}.json"
+        marker_file.unlink(missing_ok=True)  # modal volume get won't overwrite
+        found = await utils.download_from_modal_volume(
+            config.MODAL_VOLUME_NAME,
+            config.MODAL_PATHS['provisioning_marker'],
+            marker_file,
+            profile=username
+        )
+        marker = utils.read_json_file(marker_file) if found else None
         
-        # Update status to ready (not active, since setup doesn't start services)
-        account_manager.update_status(username, 'ready')
+        stages['step1'] = provisioning.stage_complete(marker, 'step1', expected)
+        # Dependencies only count if they were installed on top of the current step 1
+        stages['step2'] = stages['step1'] and provisioning.stage_complete(marker, 'step2', expected)
+        
+        account_manager.update_provisioning(username, expected if stages['step2'] else None)
+        logger.info(f"Provisioning of '{username}': step 1 {'done' if stages['step1'] else 'needed'}, "
+                    f"step 2 {'done' if stages['step2'] else 'needed'}")
+        return stages
+    
+    async def verify_models(self, username: str, recheck: bool = True) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
+        """
+        Get the model integrity report of an account's volume.
+        
+        Args:
+            username: Account whose volume to check
+            recheck: Verify again first (app1.py::verify, only re-hashes changed files);
+                     otherwise read the report from the last setup or check
+        
+        Returns:
+            (success, message, report) - report has 'ok', 'hashed', 'missing' and
+            'corrupt' ([{'id', 'error'}]), 'checked_at' and 'seconds'
+        """
+        success, msg = await self.ensure_profile(username)
+        if not success:
+            return False, msg, None
+        
+        if recheck:
+            logger.info(f"Verifying models on '{username}'")
+            app1_path = config.BASE_DIR / 'app1.py'
+            return_code, stdout, stderr = await utils.run_command(
+                f"MODAL_PROFILE={username} modal run {app1_path}::verify",
+                timeout=3600
+            )
+            if return_code != 0:
+                return False, f"Verification failed: {stderr or stdout}", None
         
-        return True, "✅ Setup complete! Both steps finished successfully. Use /start to run ComfyUI."
+        report_file = config.TEMP_DIR / f"integrity_report_{username}.json"
+        report_file.unlink(missing_ok=True)  # modal volume get won't overwrite
+        success = await utils.download_from_modal_volume(
+            config.MODAL_VOLUME_NAME,
+            config.MODAL_PATHS['integrity_report'],
+            report_file,
+            profile=username
+        )
+        report = utils.read_json_file(report_file) if success else None
+        if not report:
+            return False, "No integrity report on the volume yet (run setup or verify first)", None
+        
+        problems = len(report['missing']) + len(report['corrupt'])
+        return True, f"{report['ok']} model(s) ok, {problems} with problems", report
     
-    async def start_comfyui(self, username: str, gpu: str = None) -> Tuple[bool, str]:
+    async def start_comfyui(
+        self,
+        username: str,
+        gpu: str = None,
+        on_stage: Callable[[str, str, float], Awaitable[None]] = None
+    ) -> Tuple[bool, str]:
         """
         Start ComfyUI on a configured account using app.py.
         
+        Switches to the account first, which stops every running deployment.
+        Use add_deployment() to run on more accounts at once.
+        
         Args:
             username: Account to start on
-            gpu: GPU to use (defaults to account's selected GPU or H100)
+            gpu: GPU to use (defaults to the GPU advisor's pick, else the account's selected GPU or H100)
+            on_stage: Coroutine called as (stage, description, elapsed) while waiting for readiness
         
         Returns:
             (success, message)
@@ -401,80 +681,182 @@ class ModalManager:
         if not success:
             return False, f"Failed to switch account: {msg}"
         
+        return await self._launch(username, gpu, deployment_pool.get_endpoints()[0], on_stage)
+    
+    async def add_deployment(
+        self,
+        username: str,
+        gpu: str = None,
+        on_stage: Callable[[str, str, float], Awaitable[None]] = None
+    ) -> Tuple[bool, str]:
+        """
+        Start ComfyUI on another account, next to the running deployments.
+        
+        Args:
+            username: Account to start on
+            gpu: GPU to use (defaults to the GPU advisor's pick, else the account's selected GPU or H100)
+            on_stage: Coroutine called as (stage, description, elapsed) while waiting for readiness
+        
+        Returns:
+            (success, message)
+        """
+        if deployment_pool.get(username):
+            return False, f"ComfyUI is already running on '{username}'"
+        
+        account = account_manager.get_account_by_username(username)
+        if not account:
+            return False, f"Account '{username}' not found in database"
+        
+        if account['balance'] < config.MIN_CREDIT_THRESHOLD:
+            return False, f"Account '{username}' has insufficient balance (${account['balance']:.2f})"
+        
+        endpoint = deployment_pool.get_free_endpoint()
+        if not endpoint:
+            return False, (
+                f"All {deployment_pool.get_capacity()} endpoints are in use. "
+                "Add a tunnel to DEPLOYMENT_POOL['endpoints'] to run more."
+            )
+        
+        success, msg = await self.ensure_profile(username)
+        if not success:
+            return False, msg
+        
+        logger.info(f"Adding deployment on '{username}' via tunnel '{endpoint['tunnel']}'")
+        return await self._launch(username, gpu, endpoint, on_stage)
+    
+    async def _launch(
+        self,
+        username: str,
+        gpu: str,
+        endpoint: Dict[str, str],
+        on_stage: Callable[[str, str, float], Awaitable[None]] = None
+    ) -> Tuple[bool, str]:
+        """Run app.py on an account and endpoint, wait for it and register the deployment."""
         # Get account
         account = account_manager.get_account_by_username(username)
         
-        # Determine GPU to use
+        # Determine GPU to use (the one chosen before, else the advisor's pick from measured runtimes)
         if gpu is None:
-            gpu = account.get('selected_gpu') or 'H100'
+            gpu = account.get('selected_gpu') or gpu_advisor.pick_gpu() or 'H100'
         
         # Update selected GPU
         account_manager.update_selected_gpu(username, gpu)
-
+        
         # Start ComfyUI using app.py with friend's method
         app_path = config.BASE_DIR / 'app.py'
         
         # Use friend's pattern: modal run app.py::run
-        # This keeps the process running in background
-        command = f"GPU_TYPE={gpu} modal run {app_path}::run"
+        # MODAL_PROFILE runs it on this account whatever profile is active
+        command = (
+            f"MODAL_PROFILE={username} GPU_TYPE={gpu} "
+            f"modal run {app_path}::run --tunnel-name {endpoint['tunnel']}"
+        )
         
         # Start in background (no timeout - let it run)
+        started_at = time.monotonic()
         asyncio.create_task(utils.run_command(command, timeout=None))
         
-        # Wait a moment for Modal to start
-        await asyncio.sleep(10)
-        
-        # Wait for ComfyUI to become ready (check the URL)
-        comfyui_url = config.CLOUDFLARE_URLS['comfyui']
-        is_ready = await utils.wait_for_comfyui(comfyui_url, max_wait=120)  # 2 min check
+        # Probe until tunnel, server and nodes are all up (records the cold start time)
+        is_ready, stage_times = await readiness_prober.wait_until_ready(
+            endpoint['comfyui'],
+            username,
+            gpu,
+            started_at=started_at,
+            on_stage=on_stage
+        )
         
         if not is_ready:
             # Don't fail - server might still be starting
-            logger.warning("ComfyUI health check failed, but server may still be starting")
+            logger.warning("ComfyUI readiness probe timed out, but server may still be starting")
         
         # Mark as deployed
-        self.current_deployment = {
-            'username': username,
-            'gpu': gpu,
-            'jupyter_url': config.CLOUDFLARE_URLS['jupyter'],
-            'comfyui_url': config.CLOUDFLARE_URLS['comfyui'],
-        }
+        deployment_pool.add(username, gpu, endpoint)
         
         account_manager.update_status(username, 'active')
         
-        logger.info(f"ComfyUI started successfully for '{username}' on {gpu}")
-        return True, f"ComfyUI started on {gpu}!"
+        if not is_ready:
+            return True, f"ComfyUI was launched on {gpu} but isn't responding yet"
+        
+        logger.info(f"ComfyUI started successfully for '{username}' on {gpu} in {time.monotonic() - started_at:.0f}s")
+        return True, f"ComfyUI started on {gpu} in {time.monotonic() - started_at:.0f}s!"
     
-    async def stop_comfyui(self) -> Tuple[bool, str]:
+    async def stop_comfyui(self, username: str = None) -> Tuple[bool, str]:
         """
-        Stop the currently running ComfyUI app.
+        Stop running ComfyUI apps.
+        
+        Args:
+            username: Account to stop (default: every deployment)
         
         Returns:
             (success, message)
         """
-        if not self.current_deployment:
+        if username:
+            deployments = [deployment_pool.get(username)] if deployment_pool.get(username) else []
+        else:
+            deployments = deployment_pool.get_all()
+        
+        if not deployments:
             return False, "No ComfyUI deployment is running"
         
-        logger.info("Stopping ComfyUI...")
+        for deployment in deployments:
+            await self._stop_deployment(deployment)
+        
+        if len(deployments) > 1:
+            return True, f"Stopped ComfyUI on {len(deployments)} accounts"
+        return True, "ComfyUI stopped successfully"
+    
+    async def _stop_deployment(self, deployment: Dict[str, Any]):
+        """Stop one deployment's Modal app and unregister it."""
+        username = deployment['username']
+        logger.info(f"Stopping ComfyUI on '{username}'...")
         
         # Stop the Modal app
-        command = config.get_modal_command('app_stop', app_name=config.MODAL_APP_NAME)
+        command = config.get_modal_command('app_stop', profile=username, app_name=config.MODAL_APP_NAME)
         return_code, stdout, stderr = await utils.run_command(command)
         
         if return_code != 0:
             logger.warning(f"Failed to stop app gracefully: {stderr}")
             # Don't return False - still clear deployment
         
+        # Close the execution websocket to this server
+        await execution_tracker.disconnect(deployment['comfyui_url'])
+        
         # Clear deployment info
-        username = self.current_deployment.get('username')
-        self.current_deployment = None
+        deployment_pool.remove(username)
         
         # Update account status
-        if username:
-            account_manager.update_status(username, 'ready')
+        account_manager.update_status(username, 'ready')
         
-        logger.info("ComfyUI stopped")
-        return True, "ComfyUI stopped successfully"
+        logger.info(f"ComfyUI stopped on '{username}'")
+    
+    async def restart_deployment(self, username: str) -> Tuple[bool, str]:
+        """
+        Restart one deployment on the same account, GPU and endpoint.
+        
+        Other deployments keep running.
+        
+        Args:
+            username: Account whose deployment to restart
+        
+        Returns:
+            (success, message)
+        """
+        deployment = deployment_pool.get(username)
+        if not deployment:
+            return False, f"No deployment is running on '{username}'"
+        
+        endpoint = {
+            'tunnel': deployment['tunnel'],
+            'jupyter': deployment['jupyter_url'],
+            'comfyui': deployment['comfyui_url'],
+        }
+        
+        self.restarting.add(username)
+        try:
+            await self._stop_deployment(deployment)
+            return await self._launch(username, deployment['gpu'], endpoint)
+        finally:
+            self.restarting.discard(username)
     
     # ========================================================================
     # VOLUME OPERATIONS
@@ -549,12 +931,14 @@ class ModalManager:
         # Read JSON
         return utils.read_json_file(temp_file)
     
-    async def get_output_file(self, filename: str) -> Optional[Path]:
+    async def get_output_file(self, filename: str, subfolder: str = "", profile: str = None) -> Optional[Path]:
         """
         Download an output file from Modal volume.
         
         Args:
             filename: Output filename
+            subfolder: Subfolder inside the output directory (optional)
+            profile: Account whose volume holds the file (default: the active one)
         
         Returns:
             Local path to downloaded file or None if failed
@@ -563,12 +947,16 @@ class ModalManager:
         
         # Download to temp
         temp_file = config.TEMP_DIR / filename
-        remote_path = f"{config.MODAL_PATHS['outputs']}/{filename}"
+        remote_dir = config.MODAL_PATHS['outputs']
+        if subfolder:
+            remote_dir = f"{remote_dir}/{subfolder}"
+        remote_path = f"{remote_dir}/{filename}"
         
         success = await utils.download_from_modal_volume(
             config.MODAL_VOLUME_NAME,
             remote_path,
-            temp_file
+            temp_file,
+            profile=profile
         )
         
         if not success:
@@ -576,6 +964,49 @@ class ModalManager:
             return None
         
         return temp_file
+    
+    async def open_output(
+        self,
+        filename: str,
+        subfolder: str = "",
+        base_url: str = None,
+        profile: str = None
+    ) -> Optional[BinaryIO]:
+        """
+        Open an output file for uploading to Discord.
+        
+        While ComfyUI is running, the file is streamed straight from its
+        /view endpoint. If the server is down (or the stream fails), falls
+        back to downloading it from the Modal volume.
+        
+        Args:
+            filename: Output filename
+            subfolder: Subfolder inside the output directory (optional)
+            base_url: ComfyUI that produced it (default: the first deployment)
+            profile: Account whose volume holds it; streamed only from that
+                     account's deployment, if it still runs (default: from base_url)
+        
+        Returns:
+            Readable binary file object (caller must close it) or None if failed
+        """
+        if profile:
+            deployment = deployment_pool.get(profile)
+        else:
+            deployment = deployment_pool.get_by_url(base_url) or self.current_deployment
+        if deployment:
+            comfyui_url = deployment['comfyui_url']
+            stream = await utils.fetch_comfyui_output(comfyui_url, filename, subfolder)
+            if stream:
+                return stream
+            logger.warning(f"Could not stream '{filename}' from ComfyUI, falling back to volume")
+        
+        if not profile:
+            profile = deployment['username'] if deployment else None
+        file_path = await self.get_output_file(filename, subfolder, profile=profile)
+        if not file_path:
+            return None
+        
+        return open(file_path, 'rb')
 
 # ============================================================================
 # GLOBAL INSTANCE
@@ -0,0 +1,181 @@
+"""
+Preview Streamer Module
+=======================
+Streams ComfyUI's latent previews into a single Discord message:
+- Decodes binary preview frames from the execution websocket
+- Keeps only the newest frame (older ones are dropped, never queued)
+- Edits the status message with the preview and step progress
+- Edits are rate-limited to stay inside Discord's edit budget
+"""
+
+import asyncio
+import io
+import json
+import logging
+import struct
+import time
+from typing import Optional, Dict, Any, Tuple
+import discord
+import config
+from ui_config import COLORS, ICONS, create_progress_bar
+
+logger = logging.getLogger(__name__)
+
+# Binary websocket event types sent by ComfyUI
+PREVIEW_IMAGE = 1
+PREVIEW_IMAGE_WITH_METADATA = 4
+
+# Image type codes used in PREVIEW_IMAGE frames
+IMAGE_TYPES = {
+    1: 'jpg',
+    2: 'png',
+}
+
+# ============================================================================
+# FRAME DECODING
+# ============================================================================
+
+def decode_preview_frame(data: bytes) -> Optional[Tuple[bytes, str, Optional[str]]]:
+    """
+    Decode a binary websocket message from ComfyUI.
+    
+    Returns:
+        (image_bytes, extension, prompt_id) or None if it isn't a preview.
+        prompt_id is only known for frames that carry metadata.
+    """
+    if len(data) < 8:
+        return None
+    
+    event_type = struct.unpack('>I', data[:4])[0]
+    
+    if event_type == PREVIEW_IMAGE:
+        image_type = struct.unpack('>I', data[4:8])[0]
+        return data[8:], IMAGE_TYPES.get(image_type, 'jpg'), None
+    
+    if event_type == PREVIEW_IMAGE_WITH_METADATA:
+        metadata_length = struct.unpack('>I', data[4:8])[0]
+        try:
+            metadata = json.loads(data[8:8 + metadata_length])
+        except ValueError:
+            return None
+        
+        extension = 'png' if 'png' in metadata.get('image_type', '') else 'jpg'
+        return data[8 + metadata_length:], extension, metadata.get('prompt_id')
+    
+    return None
+
+# ============================================================================
+# PREVIEW STREAMER CLASS
+# ============================================================================
+
+class PreviewStreamer:
+    """Shows the latest preview frame of one job in its status message."""
+    
+    def __init__(self, message: discord.Message, workflow_name: str):
+        """
+        Initialize preview streamer.
+        
+        Args:
+            message: Status message to edit
+            workflow_name: Workflow name (shown in the embed)
+        """
+        self.message = message
+        self.workflow_name = workflow_name
+        self.frame: Optional[Tuple[bytes, str]] = None  # Latest (image_bytes, extension)
+        self.shown_extension: Optional[str] = None  # Extension of the attached preview
+        self.progress: Optional[Tuple[int, int]] = None
+        self.frames_received = 0
+        self.edits_sent = 0
+        self._changed = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.create_task(self._edit_loop())
+    
+    def offer_frame(self, image: bytes, extension: str):
+        """Replace the pending frame with a newer one (the old one is dropped)."""
+        self.frame = (image, extension)
+        self.frames_received += 1
+        self._changed.set()
+    
+    def update_progress(self, job: Dict[str, Any]):
+        """Pick up step progress from the tracked job."""
+        if job.get('progress') != self.progress:
+            self.progress = job.get('progress')
+            self._changed.set()
+    
+    async def close(self):
+        """Stop editing the message (called when the job finishes)."""
+        self._closed = True
+        self._changed.set()
+        await self._task
+        
+        logger.info(
+            f"Preview for '{self.workflow_name}': {self.frames_received} frames received, "
+            f"{self.edits_sent} edits sent"
+        )
+    
+    def _build_embed(self, extension: Optional[str]) -> discord.Embed:
+        """Build the progress embed."""
+        embed = discord.Embed(
+            title=f"{ICONS['loading']} Generating...",
+            description=f"Workflow: `{self.workflow_name}`",
+            color=COLORS['progress']
+        )
+        
+        if self.progress and self.progress[1]:
+            value, maximum = self.progress
+            embed.add_field(
+                name=f"Step {value}/{maximum}",
+                value=create_progress_bar(value, maximum),
+                inline=False
+            )
+        
+        if extension:
+            embed.set_image(url=f"attachment://preview.{extension}")
+        
+        return embed
+    
+    async def _edit_loop(self):
+        """Edit the message whenever something changed, at most once per edit_interval."""
+        interval = config.LIVE_PREVIEW['edit_interval']
+        last_edit = 0.0
+        
+        while True:
+            await self._changed.wait()
+            if self._closed:
+                return
+            
+            # Wait out the rest of the interval; newer frames replace the pending one
+            wait = last_edit + interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                if self._closed:
+                    return
+            
+            self._changed.clear()
+            frame = self.frame
+            self.frame = None
+            
+            try:
+                if frame:
+                    image, extension = frame
+                    await self.message.edit(
+                        embed=self._build_embed(extension),
+                        file=discord.File(io.BytesIO(image), filename=f"preview.{extension}"),
+                        attachments=[]
+                    )
+                    self.shown_extension = extension
+                else:
+                    # Progress only, keep showing the attached preview
+                    await self.message.edit(embed=self._build_embed(self.shown_extension))
+                self.edits_sent += 1
+            except discord.NotFound:
+                logger.warning("Preview message was deleted, stopping preview")
+                return
+            except Exception as e:
+                logger.warning(f"Failed to update preview: {e}")
+            
+            last_edit = time.monotonic()
+
+# ============================================================================
+# END OF PREVIEW STREAMER
+# ============================================================================
@@ -0,0 +1,738 @@
+"""
+Provisioning Sync Engine
+========================
+Brings the workspace volume in line with provisioning.json:
+- ComfyUI, custom nodes (with optional pinned refs) and models are declared in the manifest
+- Each item is compared with the volume and its recorded state
+- Only missing, incomplete or changed items are fetched
+- Per-item state is kept on the volume, so every run repairs what the last one left
+
+Runs inside the setup container (app1.py) and only uses the standard library.
+
+Manifest format:
+    {
+        "comfyui": {"url": ..., "ref": null},
+        "custom_nodes": [{"url": ..., "ref": null}, ...],
+        "models": [{"folder": "loras", "name": ..., "url": ..., "sha256": optional}, ...]
+    }
+A ref is a branch, tag or commit to pin, null for the default branch.
+Keep ComfyUI pinned to a release tag: a fresh volume must get the same
+ComfyUI the workflows were tested on, not whatever master is that day.
+Models are checked against their sha256 (if given) and, for .safetensors,
+a header that must account for the whole file.
+
+Python dependencies are cached on the volume too: setup step 2 (app2.py)
+installs them once per set of requirements files and keeps the resolved
+lock and a wheelhouse, which ComfyUI's image (app.py) installs offline.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+WORKSPACE_DIR = "/root/workspace"
+COMFYUI_DIR = f"{WORKSPACE_DIR}/ComfyUI"
+CUSTOM_NODES_DIR = f"{COMFYUI_DIR}/custom_nodes"
+MODELS_DIR = f"{COMFYUI_DIR}/models"
+STATE_FILE = f"{WORKSPACE_DIR}/.provisioning/state.json"
+INTEGRITY_INDEX_FILE = f"{WORKSPACE_DIR}/.provisioning/integrity.json"
+INTEGRITY_REPORT_FILE = f"{WORKSPACE_DIR}/.provisioning/integrity_report.json"
+# Which setup stages finished, and for which manifest version (read by the bot to skip them)
+MARKER_FILE = f"{WORKSPACE_DIR}/.provisioning/marker.json"
+# Locks and wheelhouses, one directory per requirements hash
+DEPS_CACHE_DIR = f"{WORKSPACE_DIR}/.provisioning/deps"
+# Which requirements hash this container's Python has installed (not on the volume)
+DEPS_INSTALLED_FILE = "/root/.provisioning_deps.json"
+MANIFEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "provisioning.json")
+
+# Attempts per repo before it's reported as failed
+CLONE_TRIES = 3
+# Passes over the models that are still missing after a failed pass
+DOWNLOAD_ROUNDS = 3
+# Bytes read at a time while hashing
+HASH_CHUNK_SIZE = 16 * 1024 * 1024
+# Larger safetensors headers are treated as corrupt
+MAX_HEADER_SIZE = 100 * 1024 * 1024
+# Dependency caches kept besides the current one (for switching back)
+DEPS_CACHE_KEEP = 2
+
+# Online dependency install, run when there's no cache for the requirements
+INSTALL_COMMANDS = [
+    "cd /root/workspace/ComfyUI && uv pip install --system -r requirements.txt",
+    "cd /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager && uv pip install --system -r requirements.txt",
+    "python /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager/cm-cli.py restore-dependencies",
+]
+
+# ============================================================================
+# MANIFEST AND STATE
+# ============================================================================
+
+def load_manifest(path=MANIFEST_FILE):
+    """Load the provisioning manifest."""
+    with open(path) as f:
+        return json.load(f)
+
+def manifest_version(manifest=None):
+    """Short hash of the manifest's content (formatting changes don't count)."""
+    if manifest is None:
+        manifest = load_manifest()
+    canonical = json.dumps(manifest, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:12]
+
+def write_marker(stage, version, path=MARKER_FILE):
+    """Record that a setup stage finished for a manifest version (None: not complete)."""
+    marker = load_json(path, {"stages": {}})
+    marker["stages"][stage] = {"version": version, "completed_at": time.time() if version else None}
+    save_json(path, marker)
+
+def stage_complete(marker, stage, version):
+    """Check if a marker says a stage finished for this manifest version."""
+    entry = (marker or {}).get("stages", {}).get(stage) or {}
+    return entry.get("version") == version
+
+class ProvisioningState:
+    """Per-item sync state, saved to the volume after every change."""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.items = {}  # Maps item ID -> {'spec', 'status', 'synced_at', 'error', ...}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.items = json.load(f).get("items", {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Ignoring unreadable provisioning state: {e}")
+
+    def get(self, item_id):
+        return self.items.get(item_id)
+
+    def set(self, item_id, spec, status, error=None, **extra):
+        """Record an item's outcome and save (atomically, safe from worker threads)."""
+        with self._lock:
+            self.items[item_id] = {
+                "spec": spec,
+                "status": status,
+                "synced_at": time.time(),
+                "error": error,
+                **extra,
+            }
+            save_json(self.path, {"items": self.items})
+
+# ============================================================================
+# PLANNING
+# ============================================================================
+
+def repo_name(url):
+    """Folder name git would clone a URL into."""
+    name = url.rstrip("/").rsplit("/", 1)[-1]
+    return name[:-4] if name.endswith(".git") else name
+
+def is_downloaded(path):
+    """A file is complete once it exists without an aria2 control file next to it."""
+    return os.path.exists(path) and not os.path.exists(path + ".aria2")
+
+def get_items(manifest):
+    """
+    Flatten the manifest into items: {'id', 'kind' ('repo' or 'model'), 'spec', 'path', ...}.
+    The spec is what identifies the item's content (ref for repos, URL for models).
+    """
+    comfyui = manifest["comfyui"]
+    items = [{"id": "comfyui", "kind": "repo", "url": comfyui["url"], "spec": comfyui.get("ref"),
+              "path": COMFYUI_DIR}]
+
+    for node in manifest.get("custom_nodes", []):
+        name = repo_name(node["url"])
+        items.append({"id": f"custom_nodes/{name}", "kind": "repo", "url": node["url"],
+                      "spec": node.get("ref"), "path": os.path.join(CUSTOM_NODES_DIR, name)})
+
+    for model in manifest.get("models", []):
+        items.append({"id": f"models/{model['folder']}/{model['name']}", "kind": "model", "url": model["url"],
+                      "spec": model["url"], "path": os.path.join(MODELS_DIR, model["folder"], model["name"]),
+                      "sha256": model.get("sha256")})
+    return items
+
+def diff_item(item, state):
+    """
+    Compare one item with the volume and its recorded state.
+
+    Returns:
+        None if it's in sync, else why it needs work:
+        'missing', 'incomplete', 'changed' or 'unpinned' (repo present, pin never applied)
+    """
+    record = state.get(item["id"])
+
+    if item["kind"] == "repo":
+        if not os.path.exists(os.path.join(item["path"], ".git")):
+            return "missing"
+        if record is None:
+            # Cloned before provisioning state existed; adopt it unless it must be pinned
+            return "unpinned" if item["spec"] else None
+    else:
+        if not os.path.exists(item["path"]):
+            return "missing"
+        if not is_downloaded(item["path"]):
+            return "incomplete"
+        if record is None:
+            return None
+
+    if record["spec"] != item["spec"]:
+        return "changed"
+    if record["status"] != "done":
+        return "incomplete"
+    return None
+
+# ============================================================================
+# REPOS
+# ============================================================================
+
+def git(*args, cwd=None):
+    """Run a git command, raising with its error line if it fails."""
+    result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = (result.stderr or result.stdout).strip().splitlines()
+        errors = [line for line in lines if line.startswith(("fatal:", "error:"))]
+        raise RuntimeError((errors or lines or ["git failed"])[0])
+    return result.stdout
+
+def clone_repo(url, ref, dest):
+    """
+    Shallow-clone one repo (single branch, depth 1) at ref.
+    Clones into a temporary folder that's renamed when complete, so a
+    failed attempt never leaves a half-cloned repo behind.
+    """
+    partial = dest + ".partial"
+    subprocess.run(["rm", "-rf", partial])
+    if ref is None:
+        git("clone", "--depth", "1", "--single-branch", url, partial)
+    else:
+        # Fetching by ref works for branches, tags and commits alike
+        os.makedirs(partial)
+        git("init", "-q", cwd=partial)
+        git("remote", "add", "origin", url, cwd=partial)
+        git("fetch", "--depth", "1", "origin", ref, cwd=partial)
+        git("checkout", "-q", "FETCH_HEAD", cwd=partial)
+    os.rename(partial, dest)
+
+def checkout_ref(url, ref, dest):
+    """Move an existing clone to ref (the remote's default branch if None)."""
+    git("remote", "set-url", "origin", url, cwd=dest)
+    git("fetch", "--depth", "1", "origin", ref or "HEAD", cwd=dest)
+    git("checkout", "-q", "--force", "FETCH_HEAD", cwd=dest)
+
+def sync_repo(item, reason, state):
+    """Clone or update one repo with retries, and record the outcome."""
+    start = time.time()
+    error = None
+    for attempt in range(1, CLONE_TRIES + 1):
+        try:
+            if reason == "missing":
+                clone_repo(item["url"], item["spec"], item["path"])
+            else:
+                checkout_ref(item["url"], item["spec"], item["path"])
+            head = git("rev-parse", "HEAD", cwd=item["path"]).strip()
+            state.set(item["id"], item["spec"], "done", commit=head)
+            return {"id": item["id"], "status": "cloned" if reason == "missing" else "updated",
+                    "tries": attempt, "seconds": time.time() - start, "error": None}
+        except Exception as e:
+            error = str(e)
+            if attempt < CLONE_TRIES:
+                time.sleep(2 ** attempt)
+
+    subprocess.run(["rm", "-rf", item["path"] + ".partial"])
+    state.set(item["id"], item["spec"], "failed", error)
+    return {"id": item["id"], "status": "failed", "tries": CLONE_TRIES,
+            "seconds": time.time() - start, "error": error}
+
+def sync_repos(work, state, workers=8):
+    """Clone or update repos in a bounded pool; each succeeds or fails on its own."""
+    os.makedirs(CUSTOM_NODES_DIR, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda entry: sync_repo(entry[0], entry[1], state), work))
+
+# ============================================================================
+# MODELS
+# ============================================================================
+
+def get_remote_size(url):
+    """Size of a URL in bytes (after redirects), 0 if unknown."""
+    result = subprocess.run(["curl", "-sIL", "--max-time", "30", url], capture_output=True, text=True)
+    size = 0
+    for line in result.stdout.splitlines():
+        # Keep the last one: the first responses are redirects
+        if line.lower().startswith("content-length:"):
+            size = int(line.split(":", 1)[1].strip() or 0)
+    return size
+
+def download_models(work, state, max_downloads=4, connections_per_file=8):
+    """
+    Download models in parallel with one aria2c run over an input file.
+    Largest files are queued first so the longest download starts right away,
+    partial files resume, and a failed file only fails itself (it's retried
+    in the next round).
+    """
+    for item, reason in work:
+        if reason == "changed":
+            # A different URL means a different file; don't resume into the old one
+            for path in (item["path"], item["path"] + ".aria2"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    pending = [item for item, _ in work]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        sizes = dict(zip((item["id"] for item in pending), pool.map(get_remote_size, (item["url"] for item in pending))))
+    pending.sort(key=lambda item: sizes[item["id"]], reverse=True)
+    print(f"Downloading {sum(sizes.values()) / 1024**3:.1f} GB in {len(pending)} file(s)...")
+
+    for round_number in range(1, DOWNLOAD_ROUNDS + 1):
+        input_file = "/tmp/aria2_models.txt"
+        with open(input_file, "w") as f:
+            for item in pending:
+                f.write(f"{item['url']}\n  dir={os.path.dirname(item['path'])}\n  out={os.path.basename(item['path'])}\n")
+
+        print(f"Downloading {len(pending)} file(s), {max_downloads} at a time (round {round_number})...")
+        subprocess.run([
+            "aria2c", f"--input-file={input_file}",
+            f"--max-concurrent-downloads={max_downloads}",
+            f"--max-connection-per-server={connections_per_file}", f"--split={connections_per_file}",
+            "--min-split-size=64M", "--max-tries=10", "--retry-wait=5",
+            "--continue=true", "--allow-overwrite=false", "--auto-file-renaming=false",
+            "--file-allocation=none", "--console-log-level=warn", "--summary-interval=60",
+        ])
+
+        remaining = []
+        for item in pending:
+            if is_downloaded(item["path"]):
+                state.set(item["id"], item["spec"], "done", size=os.path.getsize(item["path"]))
+            else:
+                remaining.append(item)
+        pending = remaining
+        if not pending:
+            break
+
+    for item in pending:
+        state.set(item["id"], item["spec"], "failed", f"Not complete after {DOWNLOAD_ROUNDS} rounds")
+
+    failed = {item["id"] for item in pending}
+    return [
+        {"id": item["id"], "status": "failed", "error": f"Not complete after {DOWNLOAD_ROUNDS} rounds"}
+        if item["id"] in failed else {"id": item["id"], "status": "downloaded"}
+        for item, _ in work
+    ]
+
+# ============================================================================
+# INTEGRITY
+# ============================================================================
+
+def check_safetensors(path, size):
+    """
+    Validate a safetensors header: it must parse and its tensors must end
+    exactly where the file does (a truncated download ends early).
+
+    Returns:
+        None if valid, else the problem
+    """
+    if size < 8:
+        return "Too small for a safetensors header"
+
+    with open(path, "rb") as f:
+        header_size = int.from_bytes(f.read(8), "little")
+        if header_size <= 0 or header_size > MAX_HEADER_SIZE or 8 + header_size > size:
+            return f"Invalid header size ({header_size} bytes)"
+        try:
+            header = json.loads(f.read(header_size))
+        except ValueError:
+            return "Header is not valid JSON"
+
+    if not isinstance(header, dict):
+        return "Header is not a JSON object"
+
+    data_size = 0
+    for name, tensor in header.items():
+        if name == "__metadata__":
+            continue
+        try:
+            begin, end = tensor["data_offsets"]
+        except (TypeError, KeyError, ValueError):
+            return f"Tensor '{name}' has no data offsets"
+        if not 0 <= begin <= end:
+            return f"Tensor '{name}' has invalid data offsets"
+        data_size = max(data_size, end)
+
+    expected = 8 + header_size + data_size
+    if size < expected:
+        return f"Truncated: {size} of {expected} bytes"
+    return None
+
+def sha256_file(path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_json(path, default):
+    """Read a JSON file, or the default if it's missing or unreadable."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def save_json(path, data):
+    """Write a JSON file atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def verify_model(item, entry):
+    """
+    Check one model, reusing its index entry if size and mtime are unchanged.
+
+    Returns:
+        (status ('ok', 'missing' or 'corrupt'), index entry or None, hashed, error)
+    """
+    if not is_downloaded(item["path"]):
+        reason = "Download incomplete" if os.path.exists(item["path"]) else "Not on the volume"
+        return "missing", None, False, reason
+
+    stat = os.stat(item["path"])
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+        hashed = False
+    else:
+        error = None
+        if item["path"].endswith(".safetensors"):
+            error = check_safetensors(item["path"], stat.st_size)
+        entry = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            # Not worth hashing a file whose header already shows it's broken
+            "sha256": None if error else sha256_file(item["path"]),
+            "header_error": error,
+            "verified_at": time.time(),
+        }
+        hashed = True
+
+    # Compared on every run, so fixing the manifest's checksum needs no re-hash
+    error = entry["header_error"]
+    if not error and item.get("sha256") and entry["sha256"] != item["sha256"].lower():
+        error = "SHA-256 does not match the manifest"
+    return ("corrupt" if error else "ok"), entry, hashed, error
+
+def verify_models(manifest=None, state=None, repair=False, workers=4):
+    """
+    Verify every model in the manifest against the integrity index.
+    Only files whose size or mtime changed since they were last verified
+    are hashed again. The index and a report are saved to the volume.
+
+    repair: delete corrupt files (and mark them in state) so the next sync downloads them again
+
+    Returns:
+        Report dict: {'ok', 'hashed', 'missing' [{'id', 'error'}], 'corrupt' [{'id', 'error'}], 'seconds'}
+    """
+    if manifest is None:
+        manifest = load_manifest()
+
+    start = time.time()
+    index = load_json(INTEGRITY_INDEX_FILE, {})
+    models = [item for item in get_items(manifest) if item["kind"] == "model"]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda item: verify_model(item, index.get(item["id"])), models))
+
+    report = {"ok": 0, "hashed": 0, "missing": [], "corrupt": [], "checked_at": time.time()}
+    for item, (status, entry, hashed, error) in zip(models, results):
+        report["hashed"] += hashed
+        if status == "ok":
+            report["ok"] += 1
+            index[item["id"]] = entry
+            continue
+
+        report[status].append({"id": item["id"], "error": error})
+        if status == "missing" or repair:
+            index.pop(item["id"], None)
+        else:
+            # Unchanged corrupt files aren't hashed again either
+            index[item["id"]] = entry
+
+        if status == "corrupt" and repair:
+            for path in (item["path"], item["path"] + ".aria2"):
+                if os.path.exists(path):
+                    os.remove(path)
+            if state is not None:
+                state.set(item["id"], item["spec"], "corrupt", error)
+
+    report["seconds"] = time.time() - start
+    save_json(INTEGRITY_INDEX_FILE, index)
+    save_json(INTEGRITY_REPORT_FILE, report)
+
+    print(f"Integrity: {report['ok']} ok, {len(report['corrupt'])} corrupt, {len(report['missing'])} missing "
+          f"({report['hashed']} hashed, {report['seconds']:.0f}s)")
+    for problem in report["corrupt"]:
+        print(f"   ❌ {problem['id']}: {problem['error']}{' (removed)' if repair else ''}")
+    return report
+
+# ============================================================================
+# DEPENDENCY CACHE
+# ============================================================================
+
+def requirements_files():
+    """ComfyUI's requirements.txt and every enabled custom node's, in a stable order."""
+    files = [f"{COMFYUI_DIR}/requirements.txt"]
+    if os.path.isdir(CUSTOM_NODES_DIR):
+        for name in sorted(os.listdir(CUSTOM_NODES_DIR)):
+            if not name.endswith(".disabled"):
+                files.append(os.path.join(CUSTOM_NODES_DIR, name, "requirements.txt"))
+    return [path for path in files if os.path.isfile(path)]
+
+def requirements_hash(files=None):
+    """Short hash over the requirements files and the Python version (wheels depend on it)."""
+    if files is None:
+        files = requirements_files()
+    digest = hashlib.sha256(f"python{sys.version_info.major}.{sys.version_info.minor}".encode())
+    for path in files:
+        digest.update(os.path.relpath(path, COMFYUI_DIR).encode() + b"\0")
+        with open(path, "rb") as f:
+            digest.update(f.read() + b"\0")
+    return digest.hexdigest()[:16]
+
+def load_dependency_cache(key):
+    """Get a cache entry's info, or None if there's no complete one for this hash."""
+    return load_json(os.path.join(DEPS_CACHE_DIR, key, "cache.json"), None)
+
+def pip_freeze():
+    """Map installed package name -> its requirement line (name==version or name @ url)."""
+    result = subprocess.run([sys.executable, "-m", "pip", "freeze"], capture_output=True, text=True, check=True)
+    packages = {}
+    for line in result.stdout.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("#", "-e")):
+            continue  # Editable installs can't go in a wheelhouse
+        name = re.split(r"==| @ ", line)[0]
+        packages[re.sub(r"[-_.]+", "-", name).lower()] = line
+    return packages
+
+def run_install_commands(commands):
+    """Install dependencies online (a failing command is reported, the rest still run)."""
+    failed = []
+    for command in commands:
+        if subprocess.run(command, shell=True).returncode != 0:
+            print(f"⚠️ Dependency install failed: {command}")
+            failed.append(command)
+    return failed
+
+def build_dependency_cache(commands=INSTALL_COMMANDS):
+    """
+    Install dependencies online and cache the result, unless it's cached for these requirements.
+
+    The lock pins what the install added or changed on top of the image,
+    and the wheelhouse holds a wheel for each of them (sdists and git
+    packages are built once here).
+    """
+    files = requirements_files()
+    key = requirements_hash(files)
+    info = load_dependency_cache(key)
+    if info:
+        print(f"Dependencies unchanged ({key}, {info['packages']} package(s) cached), nothing to install")
+        return {"key": key, "status": "cached", **info}
+
+    start = time.time()
+    print(f"Installing dependencies for {len(files)} requirements file(s) ({key})...")
+    before = pip_freeze()
+    if run_install_commands(commands):
+        # Caching it would skip the failed part until a requirements.txt changes
+        print("⚠️ Not caching an incomplete install, setup step 2 tries again next time")
+        return {"key": key, "status": "failed"}
+    changed = [line for name, line in pip_freeze().items() if before.get(name) != line]
+
+    # Built next to the final directory and renamed, so a cache is never half there
+    cache_dir = os.path.join(DEPS_CACHE_DIR, key)
+    build_dir = cache_dir + ".partial"
+    wheels_dir = os.path.join(build_dir, "wheels")
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(wheels_dir)
+
+    if changed:
+        print(f"Building the wheelhouse for {len(changed)} package(s)...")
+        requirements_in = os.path.join(build_dir, "requirements.in")
+        with open(requirements_in, "w") as f:
+            f.write("\n".join(sorted(changed)) + "\n")
+        result = subprocess.run(
+            [sys.executable, "-m", "pip", "wheel", "--no-deps", "-w", wheels_dir, "-r", requirements_in],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            lines = (result.stderr or result.stdout).strip().splitlines()
+            raise RuntimeError(f"Failed to build the wheelhouse: {(lines or ['pip wheel failed'])[-1]}")
+
+    # Pins come from the wheels themselves, so the lock installs without an index
+    pins = sorted(
+        "{}=={}".format(*filename.split("-")[:2])
+        for filename in os.listdir(wheels_dir) if filename.endswith(".whl")
+    )
+    with open(os.path.join(build_dir, "requirements.lock"), "w") as f:
+        f.write("".join(f"{pin}\n" for pin in pins))
+
+    info = {
+        "key": key,
+        "files": [os.path.relpath(path, COMFYUI_DIR) for path in files],
+        "packages": len(pins),
+        "built_at": time.time(),
+        "seconds": time.time() - start,
+    }
+    save_json(os.path.join(build_dir, "cache.json"), info)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(build_dir, cache_dir)
+    save_json(DEPS_INSTALLED_FILE, {"key": key, "source": "online", "installed_at": time.time()})
+    prune_dependency_caches(key)
+
+    print(f"Cached {len(pins)} package(s) for {key} in {info['seconds']:.0f}s")
+    return {"status": "built", **info}
+
+def prune_dependency_caches(current_key):
+    """Delete all but the newest DEPS_CACHE_KEEP caches besides the current one."""
+    others = []
+    for key in os.listdir(DEPS_CACHE_DIR):
+        if key != current_key:
+            info = load_dependency_cache(key) or {}
+            others.append((info.get("built_at", 0), key))
+    for _, key in sorted(others, reverse=True)[DEPS_CACHE_KEEP:]:
+        shutil.rmtree(os.path.join(DEPS_CACHE_DIR, key), ignore_errors=True)
+
+def install_dependencies(commands=INSTALL_COMMANDS):
+    """
+    Make this container's Python match the requirements on the volume.
+
+    Skipped if it already does; installs offline from the cache if setup
+    step 2 built one for these requirements; otherwise installs online.
+    Only a complete install is recorded, so a failed one is retried next start.
+
+    Returns:
+        "skipped", "offline", "online" or "failed"
+    """
+    key = requirements_hash()
+    if load_json(DEPS_INSTALLED_FILE, {}).get("key") == key:
+        print(f"Dependencies up to date ({key})")
+        return "skipped"
+
+    source = "online"
+    info = load_dependency_cache(key)
+    if info:
+        cache_dir = os.path.join(DEPS_CACHE_DIR, key)
+        # An empty lock means the image already has everything
+        if not info["packages"] or subprocess.run([
+            "uv", "pip", "install", "--system", "--offline", "--no-index", "--no-deps",
+            "--find-links", os.path.join(cache_dir, "wheels"),
+            "-r", os.path.join(cache_dir, "requirements.lock"),
+        ]).returncode == 0:
+            source = "offline"
+            print(f"Installed {info['packages']} package(s) offline from the dependency cache ({key})")
+        else:
+            print("⚠️ Offline install from the dependency cache failed, installing online")
+    else:
+        print(f"No dependency cache for {key} (setup step 2 builds it), installing online")
+
+    if source == "online" and run_install_commands(commands):
+        print("⚠️ Dependencies incomplete, installing again next start")
+        return "failed"
+
+    save_json(DEPS_INSTALLED_FILE, {"key": key, "source": source, "installed_at": time.time()})
+    return source
+
+# ============================================================================
+# SYNC
+# ============================================================================
+
+def plan(manifest, state):
+    """List (item, reason) for every item that needs work."""
+    work = []
+    for item in get_items(manifest):
+        reason = diff_item(item, state)
+        if reason:
+            work.append((item, reason))
+    return work
+
+def sync(manifest=None, max_downloads=4, connections_per_file=8, clone_workers=8, verify_workers=4):
+    """
+    Fetch everything that's missing, changed or corrupt, and nothing else.
+
+    Returns:
+        Summary dict: {'in_sync', 'cloned', 'updated', 'downloaded',
+        'corrupt' (IDs found corrupt), 'failed' (IDs), 'seconds'}
+    """
+    if manifest is None:
+        manifest = load_manifest()
+
+    start = time.time()
+    state = ProvisioningState()
+    items = get_items(manifest)
+
+    # Adopt items that were installed before state was recorded
+    for item in items:
+        if state.get(item["id"]) is None and diff_item(item, state) is None:
+            state.set(item["id"], item["spec"], "done")
+
+    # Corrupt models (e.g. truncated by an earlier timeout) are removed so they're planned again
+    report = verify_models(manifest, state, repair=True, workers=verify_workers)
+    corrupt = {problem["id"] for problem in report["corrupt"]}
+
+    work = plan(manifest, state)
+    print(f"Provisioning: {len(items) - len(work)} of {len(items)} item(s) in sync")
+    for item, reason in work:
+        print(f"   {reason}: {item['id']}")
+
+    results = []
+
+    # ComfyUI first: everything else lives inside it
+    comfyui_work = [(item, reason) for item, reason in work if item["id"] == "comfyui"]
+    if comfyui_work:
+        result = sync_repo(*comfyui_work[0], state)
+        if result["status"] == "failed":
+            raise RuntimeError(f"Failed to sync ComfyUI: {result['error']}")
+        results.append(result)
+
+    repo_work = [(item, reason) for item, reason in work if item["kind"] == "repo" and item["id"] != "comfyui"]
+    if repo_work:
+        results += sync_repos(repo_work, state, clone_workers)
+
+    model_work = [(item, reason) for item, reason in work if item["kind"] == "model"]
+    if model_work:
+        results += download_models(model_work, state, max_downloads, connections_per_file)
+
+        # Only the new downloads are hashed; a corrupt one counts as failed
+        report = verify_models(manifest, state, repair=True, workers=verify_workers)
+        corrupt_now = {problem["id"]: problem["error"] for problem in report["corrupt"]}
+        corrupt.update(corrupt_now)
+        for r in results:
+            if r["id"] in corrupt_now:
+                r.update(status="failed", error=corrupt_now[r["id"]])
+
+    summary = {
+        "in_sync": len(items) - len(work),
+        "cloned": sum(r["status"] == "cloned" for r in results),
+        "updated": sum(r["status"] == "updated" for r in results),
+        "downloaded": sum(r["status"] == "downloaded" for r in results),
+        "corrupt": sorted(corrupt),
+        "failed": [r["id"] for r in results if r["status"] == "failed"],
+        "seconds": time.time() - start,
+    }
+
+    print(f"Provisioning done in {summary['seconds']:.0f}s: {summary['in_sync']} in sync, "
+          f"{summary['cloned']} cloned, {summary['updated']} updated, "
+          f"{summary['downloaded']} downloaded, {len(summary['corrupt'])} corrupt, {len(summary['failed'])} failed")
+    for r in results:
+        if r["status"] == "failed":
+            print(f"   ❌ {r['id']}: {r.get('error') or 'failed'}")
+        elif r.get("tries", 1) > 1:
+            print(f"   ⚠️ {r['id']} needed {r['tries']} tries")
+    return summary
@@ -0,0 +1,289 @@
+"""
+Readiness Prober Module
+=======================
+Waits for a freshly started ComfyUI and learns how long that takes:
+- Staged checks: tunnel up -> /system_stats -> /object_info loaded
+- Fast early polls with backoff, against a monotonic deadline
+- Records cold-start durations per GPU and account
+- Estimates time-to-ready from recent cold starts
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple, Callable, Awaitable
+import aiohttp
+import config
+import utils
+from http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+# Status Cloudflare returns while the tunnel itself is down
+TUNNEL_DOWN_STATUSES = [530]
+
+# Probe stages, in order: (name, description)
+STAGES = [
+    ('tunnel', 'Waiting for tunnel'),
+    ('server', 'Waiting for ComfyUI server'),
+    ('nodes', 'Loading nodes'),
+]
+
+# ============================================================================
+# DATABASE SCHEMA
+# ============================================================================
+
+CREATE_COLD_STARTS_TABLE = """
+CREATE TABLE IF NOT EXISTS cold_starts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    gpu TEXT NOT NULL,
+    duration REAL NOT NULL,
+    stages TEXT,
+    success INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# ============================================================================
+# READINESS PROBER CLASS
+# ============================================================================
+
+class ReadinessProber:
+    """Probes ComfyUI until it's ready and records cold-start times."""
+    
+    def __init__(self, db_path: Path = None):
+        """
+        Initialize readiness prober.
+        
+        Args:
+            db_path: SQLite database file (default: config.DATABASE_FILE)
+        """
+        if db_path is None:
+            db_path = config.DATABASE_FILE
+        
+        self.db_path = db_path
+        self._init_database()
+    
+    def _init_database(self):
+        """Initialize database table."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(CREATE_COLD_STARTS_TABLE)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to initialize cold start table: {e}")
+            raise
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get database connection."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        return conn
+    
+    # ========================================================================
+    # STAGE CHECKS
+    # ========================================================================
+    
+    async def _get_status(self, url: str, timeout: float) -> Optional[int]:
+        """GET a URL and return its status (None if there was no response)."""
+        try:
+            session = http_client.get_session()
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                return response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+    
+    async def _check_stage(self, stage: str, base_url: str, timeout: float) -> bool:
+        """Run one stage's check."""
+        base_url = base_url.rstrip('/')
+        
+        if stage == 'tunnel':
+            status = await self._get_status(base_url + '/', timeout)
+            return status is not None and status not in TUNNEL_DOWN_STATUSES
+        
+        if stage == 'server':
+            status = await self._get_status(base_url + config.COMFYUI_API['system_stats'], timeout)
+            return status == 200
+        
+        if stage == 'nodes':
+            # Node definitions are only complete once every custom node was imported
+            try:
+                session = http_client.get_session()
+                url = base_url + config.COMFYUI_API['object_info']
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    if response.status != 200:
+                        return False
+                    return bool(await response.json(content_type=None))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                return False
+        
+        return False
+    
+    # ========================================================================
+    # PROBING
+    # ========================================================================
+    
+    async def wait_until_ready(
+        self,
+        base_url: str,
+        username: str,
+        gpu: str,
+        timeout: float = None,
+        started_at: float = None,
+        on_stage: Callable[[str, str, float], Awaitable[None]] = None
+    ) -> Tuple[bool, Dict[str, float]]:
+        """
+        Wait until ComfyUI passes every stage, then record the cold start.
+        
+        Polls start fast and back off; each stage resets to fast polling.
+        The deadline is monotonic, so slow requests count against it.
+        
+        Args:
+            base_url: ComfyUI base URL
+            username: Account ComfyUI was started on
+            gpu: GPU ComfyUI was started on
+            timeout: Max seconds to wait (default: config.COMFYUI_STARTUP_TIMEOUT)
+            started_at: time.monotonic() when the start was launched (default: now)
+            on_stage: Coroutine called as (stage, description, elapsed) when a stage begins
+        
+        Returns:
+            (ready, stage_times) where stage_times maps stage -> seconds since start
+        """
+        settings = config.READINESS_PROBE
+        if timeout is None:
+            timeout = config.COMFYUI_STARTUP_TIMEOUT
+        if started_at is None:
+            started_at = time.monotonic()
+        
+        deadline = started_at + timeout
+        stage_times = {}
+        ready = True
+        
+        for stage, description in STAGES:
+            logger.info(f"Readiness probe: {description.lower()}...")
+            if on_stage:
+                try:
+                    await on_stage(stage, description, time.monotonic() - started_at)
+                except Exception as e:
+                    logger.warning(f"Readiness stage callback failed: {e}")
+            
+            interval = settings['initial_interval']
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    ready = False
+                    break
+                
+                request_timeout = min(settings['request_timeout'], remaining)
+                if await self._check_stage(stage, base_url, request_timeout):
+                    stage_times[stage] = time.monotonic() - started_at
+                    logger.info(f"Readiness probe: '{stage}' passed after {stage_times[stage]:.1f}s")
+                    break
+                
+                await asyncio.sleep(min(interval, max(0, deadline - time.monotonic())))
+                interval = min(interval * settings['backoff'], settings['max_interval'])
+            
+            if not ready:
+                logger.warning(f"Readiness probe timed out in stage '{stage}' after {timeout:.0f}s")
+                break
+        
+        duration = time.monotonic() - started_at
+        self.record_cold_start(username, gpu, duration, stage_times, ready)
+        return ready, stage_times
+    
+    # ========================================================================
+    # COLD START HISTORY
+    # ========================================================================
+    
+    def record_cold_start(
+        self,
+        username: str,
+        gpu: str,
+        duration: float,
+        stage_times: Dict[str, float],
+        success: bool
+    ):
+        """Store one cold start."""
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO cold_starts (username, gpu, duration, stages, success)
+                VALUES (?, ?, ?, ?, ?)
+            """, (username, gpu, duration, json.dumps(stage_times), int(success)))
+            conn.commit()
+            conn.close()
+            
+            logger.info(
+                f"Cold start on {gpu} ({username}): {duration:.1f}s "
+                f"({'ready' if success else 'not ready'})"
+            )
+        except Exception as e:
+            logger.error(f"Failed to record cold start: {e}")
+    
+    def _recent_durations(self, where: str, args: tuple) -> List[float]:
+        """Get recent successful cold start durations matching a filter."""
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT duration FROM cold_starts
+                WHERE success = 1 {where}
+                ORDER BY id DESC
+                LIMIT ?
+            """, args + (config.READINESS_PROBE['eta_samples'],))
+            rows = cursor.fetchall()
+            conn.close()
+            return [row['duration'] for row in rows]
+        except Exception as e:
+            logger.error(f"Failed to read cold starts: {e}")
+            return []
+    
+    def estimate_ready_time(self, gpu: str, username: str = None) -> Tuple[float, int]:
+        """
+        Estimate how long a start takes, from recent cold starts.
+        
+        Uses this GPU on this account if there is history, else this GPU
+        on any account, else any start, else config's default.
+        
+        Returns:
+            (eta_seconds, number_of_samples)
+        """
+        filters = []
+        if username:
+            filters.append(("AND gpu = ? AND username = ?", (gpu, username)))
+        filters.append(("AND gpu = ?", (gpu,)))
+        filters.append(("", ()))
+        
+        for where, args in filters:
+            durations = self._recent_durations(where, args)
+            if durations:
+                return statistics.median(durations), len(durations)
+        
+        return config.READINESS_PROBE['default_eta'], 0
+    
+    def format_eta(self, gpu: str, username: str = None) -> str:
+        """Format the ETA for a start, e.g. "~2m (median of 5 starts)"."""
+        eta, samples = self.estimate_ready_time(gpu, username)
+        text = f"~{utils.format_time_remaining(int(eta))}"
+        if samples:
+            text += f" (median of {samples} start{'s' if samples != 1 else ''})"
+        return text
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+readiness_prober = ReadinessProber()
+
+# ============================================================================
+# END OF READINESS PROBER
+# ============================================================================
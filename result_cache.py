@@ -0,0 +1,300 @@
+"""
+Result Cache Module
+===================
+Remembers which outputs an exact workflow produced:
+- Keyed by a canonical hash of the final API-format workflow
+  (same workflow + same parameters + same seed = same key)
+- A hit reposts the existing outputs instead of rendering again
+- Entries expire after a TTL and can be bypassed per request
+- Tracks hit rate and the GPU time saved
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+import config
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# DATABASE SCHEMA
+# ============================================================================
+
+CREATE_RESULT_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS result_cache (
+    cache_key TEXT PRIMARY KEY,
+    workflow_name TEXT NOT NULL,
+    outputs TEXT NOT NULL,
+    execution_time REAL DEFAULT 0,
+    hits INTEGER DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_hit_at REAL DEFAULT NULL,
+    base_url TEXT DEFAULT NULL,
+    username TEXT DEFAULT NULL
+)
+"""
+
+# Columns added after the table was first created
+RESULT_CACHE_TABLE_MIGRATIONS = {
+    'base_url': 'TEXT DEFAULT NULL',  # ComfyUI that rendered the outputs
+    'username': 'TEXT DEFAULT NULL',  # Account whose volume holds them
+}
+
+# ============================================================================
+# RESULT CACHE CLASS
+# ============================================================================
+
+class ResultCache:
+    """Maps workflow hashes to the outputs they produced."""
+    
+    def __init__(self, db_path: Path = None):
+        """
+        Initialize result cache.
+        
+        Args:
+            db_path: SQLite database file (default: config.DATABASE_FILE)
+        """
+        if db_path is None:
+            db_path = config.DATABASE_FILE
+        
+        self.db_path = db_path
+        self.lookups = 0  # Since the bot started
+        self.hits = 0
+        self._init_database()
+    
+    def _init_database(self):
+        """Initialize database table."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(CREATE_RESULT_CACHE_TABLE)
+            cursor.execute("PRAGMA table_info(result_cache)")
+            columns = {row[1] for row in cursor.fetchall()}
+            for column, definition in RESULT_CACHE_TABLE_MIGRATIONS.items():
+                if column not in columns:
+                    cursor.execute(f"ALTER TABLE result_cache ADD COLUMN {column} {definition}")
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to initialize result cache: {e}")
+            raise
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get database connection."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        return conn
+    
+    # ========================================================================
+    # KEYS
+    # ========================================================================
+    
+    def make_key(self, workflow: Dict[str, Any]) -> str:
+        """
+        Hash a final workflow canonically (key order and whitespace don't matter).
+        
+        Args:
+            workflow: API-format workflow, with every parameter injected
+        
+        Returns:
+            Cache key
+        """
+        canonical = json.dumps(workflow, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    
+    # ========================================================================
+    # LOOKUP / STORE
+    # ========================================================================
+    
+    def lookup(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the outputs for a workflow hash.
+        
+        Args:
+            cache_key: Key from make_key()
+        
+        Returns:
+            Entry dict ('outputs' is a list of {'filename', 'subfolder'}, 'base_url'
+            and 'username' say where they are) or None
+        """
+        if not config.RESULT_CACHE['enabled']:
+            return None
+        
+        self.lookups += 1
+        
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM result_cache WHERE cache_key = ?", (cache_key,))
+            row = cursor.fetchone()
+            
+            if row and time.time() - row['created_at'] > config.RESULT_CACHE['ttl']:
+                cursor.execute("DELETE FROM result_cache WHERE cache_key = ?", (cache_key,))
+                conn.commit()
+                row = None
+            
+            if row:
+                cursor.execute("""
+                    UPDATE result_cache
+                    SET hits = hits + 1, last_hit_at = ?
+                    WHERE cache_key = ?
+                """, (time.time(), cache_key))
+                conn.commit()
+            conn.close()
+        
+        except Exception as e:
+            logger.error(f"Result cache lookup failed: {e}")
+            return None
+        
+        if not row:
+            return None
+        
+        self.hits += 1
+        entry = dict(row)
+        entry['outputs'] = json.loads(entry['outputs'])
+        logger.info(f"Result cache hit for '{entry['workflow_name']}' ({cache_key[:12]})")
+        return entry
+    
+    def store(
+        self,
+        cache_key: str,
+        workflow_name: str,
+        outputs: List[Dict[str, Any]],
+        execution_time: float = 0,
+        base_url: str = None,
+        username: str = None
+    ) -> bool:
+        """
+        Remember the outputs a workflow produced.
+        
+        Args:
+            cache_key: Key from make_key()
+            workflow_name: Workflow name
+            outputs: Outputs from the execution tracker ({'filename', 'subfolder', ...})
+            execution_time: Render time in seconds (counted as saved on each hit)
+            base_url: ComfyUI that rendered them
+            username: Account whose volume holds them
+        
+        Returns:
+            True if stored
+        """
+        if not config.RESULT_CACHE['enabled'] or not outputs:
+            return False
+        
+        stored_outputs = [
+            {'filename': output['filename'], 'subfolder': output.get('subfolder', '')}
+            for output in outputs
+        ]
+        
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO result_cache
+                (cache_key, workflow_name, outputs, execution_time, created_at, base_url, username)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                cache_key, workflow_name, json.dumps(stored_outputs), execution_time or 0, time.time(),
+                base_url, username
+            ))
+            
+            # Drop the oldest entries beyond the limit
+            cursor.execute("""
+                DELETE FROM result_cache WHERE cache_key IN (
+                    SELECT cache_key FROM result_cache
+                    ORDER BY created_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (config.RESULT_CACHE['max_entries'],))
+            conn.commit()
+            conn.close()
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to store result cache entry: {e}")
+            return False
+    
+    def invalidate(self, cache_key: str):
+        """Drop an entry (e.g. its outputs were deleted from the volume)."""
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM result_cache WHERE cache_key = ?", (cache_key,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to invalidate result cache entry: {e}")
+    
+    def clear(self) -> int:
+        """
+        Drop every entry.
+        
+        Returns:
+            Number of entries removed
+        """
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM result_cache")
+            removed = cursor.rowcount
+            conn.commit()
+            conn.close()
+            return removed
+        except Exception as e:
+            logger.error(f"Failed to clear result cache: {e}")
+            return 0
+    
+    # ========================================================================
+    # STATISTICS
+    # ========================================================================
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+        
+        Returns:
+            Dict with entries, lookups, hits, hit_rate (since start),
+            total_hits and seconds_saved (all time)
+        """
+        stats = {
+            'entries': 0,
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+            'total_hits': 0,
+            'seconds_saved': 0.0,
+        }
+        
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COUNT(*), SUM(hits), SUM(hits * execution_time)
+                FROM result_cache
+            """)
+            entries, total_hits, seconds_saved = cursor.fetchone()
+            conn.close()
+            
+            stats['entries'] = entries or 0
+            stats['total_hits'] = total_hits or 0
+            stats['seconds_saved'] = seconds_saved or 0.0
+        
+        except Exception as e:
+            logger.error(f"Failed to get result cache stats: {e}")
+        
+        return stats
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+result_cache = ResultCache()
+
+# ============================================================================
+# END OF RESULT CACHE
+# ============================================================================
@@ -0,0 +1,267 @@
+"""
+Standby Planner Module
+======================
+Builds the next accounts before the running ones run dry:
+- Forecasts when each running account drops below MIN_CREDIT_THRESHOLD
+  (from its balance trend, or its GPU's price until there is a trend)
+- Starts setup on standby accounts early enough to finish before that
+- Builds on the cheap SETUP_GPU in the background, next to the live deployment
+- Keeps up to STANDBY_POLICY['standby_count'] accounts ready
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+import config
+import provisioning
+import utils
+from account_manager import account_manager
+from deployment_pool import deployment_pool
+from gpu_advisor import GPU_PRICES
+from modal_manager import modal_manager
+from ui_config import COLORS, ICONS
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# STANDBY PLANNER CLASS
+# ============================================================================
+
+class StandbyPlanner:
+    """Forecasts account depletion and pre-provisions standby accounts."""
+    
+    def __init__(self):
+        """Initialize standby planner."""
+        self.balance_samples: Dict[str, deque] = {}  # Maps username -> (time, balance) samples
+        self.building: Dict[str, asyncio.Task] = {}  # Maps username -> setup running on it
+        self.setup_durations = deque(maxlen=5)  # Seconds taken by recent full setups
+        self._notify: Optional[Callable[[str, str, int], Awaitable[None]]] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self, notify: Callable[[str, str, int], Awaitable[None]] = None):
+        """
+        Start planning standbys.
+        
+        Args:
+            notify: Coroutine called as (title, description, color) when a standby build starts or ends
+        """
+        if not config.STANDBY_POLICY['enabled']:
+            return
+        
+        self._notify = notify
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._planner_loop())
+            logger.info("Standby planner started")
+    
+    # ========================================================================
+    # FORECAST
+    # ========================================================================
+    
+    def record_balance(self, username: str, balance: float):
+        """Record a balance reading (builds the trend used by the forecast)."""
+        samples = self.balance_samples.setdefault(
+            username, deque(maxlen=config.STANDBY_POLICY['balance_samples'])
+        )
+        samples.append((time.time(), balance))
+    
+    def get_burn_rate(self, username: str) -> float:
+        """
+        Get how fast an account spends credits (in $ per hour).
+        
+        Uses the balance trend once the readings span
+        STANDBY_POLICY['min_trend_span'], else the price of the GPU it runs on.
+        """
+        samples = self.balance_samples.get(username)
+        if samples and len(samples) >= 2:
+            (first_time, first_balance), (last_time, last_balance) = samples[0], samples[-1]
+            span = last_time - first_time
+            if span >= config.STANDBY_POLICY['min_trend_span'] and last_balance < first_balance:
+                return (first_balance - last_balance) / span * 3600
+        
+        deployment = deployment_pool.get(username)
+        return GPU_PRICES.get(deployment['gpu'], 0.0) if deployment else 0.0
+    
+    def get_balance(self, username: str) -> float:
+        """Estimate an account's balance now, from its last reading and burn rate."""
+        samples = self.balance_samples.get(username)
+        if samples:
+            reading_time, balance = samples[-1]
+        else:
+            account = account_manager.get_account_by_username(username)
+            if not account:
+                return 0.0
+            # Without a reading of our own, assume the stored balance is current
+            reading_time, balance = time.time(), account['balance']
+        
+        elapsed = time.time() - reading_time
+        return balance - self.get_burn_rate(username) * elapsed / 3600
+    
+    def forecast(self, username: str) -> Optional[float]:
+        """
+        Forecast when an account crosses MIN_CREDIT_THRESHOLD.
+        
+        Returns:
+            Seconds from now (0 if already below), or None if it isn't spending
+        """
+        burn_rate = self.get_burn_rate(username)
+        if burn_rate <= 0:
+            return None
+        
+        headroom = self.get_balance(username) - config.MIN_CREDIT_THRESHOLD
+        return max(0.0, headroom / burn_rate * 3600)
+    
+    def get_forecasts(self) -> List[Dict[str, Any]]:
+        """Get a forecast for every running account, soonest depletion first."""
+        forecasts = []
+        for deployment in deployment_pool.get_all():
+            username = deployment['username']
+            forecasts.append({
+                'username': username,
+                'gpu': deployment['gpu'],
+                'balance': self.get_balance(username),
+                'burn_rate': self.get_burn_rate(username),
+                'seconds_left': self.forecast(username),
+            })
+        
+        return sorted(forecasts, key=lambda f: float('inf') if f['seconds_left'] is None else f['seconds_left'])
+    
+    def get_setup_time(self) -> float:
+        """Get the expected duration of a full setup (in seconds)."""
+        if self.setup_durations:
+            return statistics.median(self.setup_durations)
+        return sum(config.SETUP_TIME.values())
+    
+    def get_lead_time(self) -> float:
+        """Get how long before depletion standby builds must start (in seconds)."""
+        return self.get_setup_time() + config.STANDBY_POLICY['safety_margin']
+    
+    # ========================================================================
+    # STANDBYS
+    # ========================================================================
+    
+    def get_standbys(self) -> Tuple[List[Dict[str, Any]], List[str], List[Dict[str, Any]]]:
+        """
+        Sort the accounts that aren't running into standbys.
+        
+        Returns:
+            (ready - provisioned for the current manifest,
+             building - usernames with a setup running,
+             candidates - could be built, provisioned-first then by balance)
+        """
+        version = provisioning.manifest_version()
+        setup_cost = GPU_PRICES.get(config.SETUP_GPU, 0.0) * self.get_setup_time() / 3600
+        min_balance = config.MIN_CREDIT_THRESHOLD + setup_cost
+        
+        # Setups started elsewhere (/setup, /setup_all) count too: never two on one volume
+        building = set(self.building) | modal_manager.setting_up
+        
+        ready = []
+        candidates = []
+        for account in account_manager.get_all_accounts():
+            username = account['username']
+            if account['is_active'] or deployment_pool.get(username) or username in building:
+                continue
+            if account['status'] in ('dead', 'building') or account['balance'] < min_balance:
+                continue
+            if account['provisioned_version'] == version:
+                ready.append(account)
+            else:
+                candidates.append(account)
+        
+        candidates.sort(key=lambda account: account['balance'], reverse=True)
+        return ready, sorted(building), candidates
+    
+    async def plan(self) -> List[str]:
+        """
+        Start standby builds if a running account will deplete within the lead time.
+        
+        Returns:
+            Usernames whose build was started
+        """
+        forecasts = self.get_forecasts()
+        soonest = forecasts[0]['seconds_left'] if forecasts else None
+        if soonest is None or soonest > self.get_lead_time():
+            return []
+        
+        ready, building, candidates = self.get_standbys()
+        missing = config.STANDBY_POLICY['standby_count'] - len(ready) - len(building)
+        if missing <= 0:
+            return []
+        
+        started = []
+        for account in candidates[:missing]:
+            username = account['username']
+            self.building[username] = asyncio.create_task(self._build(username, forecasts[0]))
+            started.append(username)
+        
+        if not started and not ready and not building:
+            logger.warning("A running account is about to deplete and no account can be pre-provisioned")
+        return started
+    
+    async def _build(self, username: str, forecast: Dict[str, Any]):
+        """Run setup on a standby account in the background."""
+        left = utils.format_time_remaining(int(forecast['seconds_left']))
+        logger.info(f"Pre-provisioning '{username}': '{forecast['username']}' depletes in ~{left}")
+        await self._send(
+            f"{ICONS['building']} Preparing Standby",
+            f"`{forecast['username']}` runs below ${config.MIN_CREDIT_THRESHOLD:.2f} in ~{left}.\n"
+            f"Setting up `{username}` on {config.SETUP_GPU} now, so the switch doesn't wait for a build.",
+            COLORS['building']
+        )
+        
+        start = time.time()
+        try:
+            success, msg = await modal_manager.deploy_setup(username, config.SETUP_GPU, activate=False)
+        except Exception as e:
+            success, msg = False, str(e)
+        finally:
+            self.building.pop(username, None)
+        
+        elapsed = time.time() - start
+        if not success:
+            logger.error(f"Pre-provisioning '{username}' failed: {msg}")
+            await self._send(
+                f"{ICONS['error']} Standby Setup Failed",
+                f"Could not set up `{username}`: {msg}",
+                COLORS['error']
+            )
+            return
+        
+        # A fast-path run (already provisioned) says nothing about build time
+        if elapsed >= config.STANDBY_POLICY['min_build_time']:
+            self.setup_durations.append(elapsed)
+        
+        await self._send(
+            f"{ICONS['success']} Standby Ready",
+            f"`{username}` is set up and ready to take over ({utils.format_time_remaining(int(elapsed))}).",
+            COLORS['success']
+        )
+    
+    async def _send(self, title: str, description: str, color: int):
+        """Notify the owner, if a notifier was given."""
+        if self._notify:
+            await self._notify(title, description, color)
+    
+    async def _planner_loop(self):
+        """Plan standbys on an interval."""
+        while True:
+            try:
+                await self.plan()
+            except Exception as e:
+                logger.error(f"Error in standby planner: {e}")
+            
+            await asyncio.sleep(config.STANDBY_POLICY['check_interval'])
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+standby_planner = StandbyPlanner()
+
+# ============================================================================
+# END OF STANDBY PLANNER
+# ============================================================================
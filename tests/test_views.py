@@ -0,0 +1,42 @@
+"""
+Smoke tests for the button views: their callbacks import the bot's
+top-level modules at run time, so an import that only fails inside a
+callback is caught here instead of by the first button press.
+"""
+
+import ast
+import asyncio
+from pathlib import Path
+
+import pytest
+
+VIEWS_DIR = Path(__file__).resolve().parent.parent / "views"
+
+
+@pytest.mark.parametrize("path", sorted(VIEWS_DIR.glob("*.py")), ids=lambda path: path.name)
+def test_views_only_import_inside_their_package(path):
+    """views is a top-level package, so '..' imports can never resolve."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    parent_imports = [
+        node.lineno for node in ast.walk(tree)
+        if isinstance(node, ast.ImportFrom) and node.level > 1
+    ]
+    assert not parent_imports, f"relative imports beyond views/ on lines {parent_imports}"
+
+
+def test_panel_interaction_check_records_activity():
+    """interaction_check runs before every panel button, so it must never raise."""
+    from idle_manager import idle_manager
+    from views import MainControlPanel
+
+    class Interaction:
+        channel = object()
+
+    async def check():
+        panel = MainControlPanel(bot=None)
+        return await panel.interaction_check(Interaction())
+
+    idle_manager.last_panel = 0.0
+    assert asyncio.run(check()) is True
+    assert idle_manager.last_panel > 0
+    assert idle_manager.panel_channel is Interaction.channel
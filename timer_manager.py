@@ -0,0 +1,408 @@
+"""
+Timer Manager Module
+====================
+Durable timers that survive bot restarts:
+- Timers are stored in SQLite with their due time and payload
+- A scheduler loop fires due timers through registered handlers
+- Pending timers are picked up again at startup (overdue ones fire right away)
+- One active timer per kind and key (scheduling again returns the existing one)
+- Timers can be cancelled, snoozed or fired early
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+import config
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# DATABASE SCHEMA
+# ============================================================================
+
+CREATE_TIMERS_TABLE = """
+CREATE TABLE IF NOT EXISTS timers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    due_at REAL NOT NULL,
+    payload TEXT DEFAULT '{}',
+    status TEXT DEFAULT 'pending',
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at REAL
+)
+"""
+
+# Only one pending or firing timer per kind and key
+CREATE_TIMERS_ACTIVE_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_timers_active
+ON timers (kind, key) WHERE status IN ('pending', 'firing')
+"""
+
+# ============================================================================
+# TIMER MANAGER CLASS
+# ============================================================================
+
+class TimerManager:
+    """Persists timers and fires them when they're due."""
+    
+    def __init__(self, db_path: Path = None):
+        """
+        Initialize timer manager.
+        
+        Args:
+            db_path: SQLite database file (default: config.DATABASE_FILE)
+        """
+        if db_path is None:
+            db_path = config.DATABASE_FILE
+        
+        self.db_path = db_path
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]] = {}  # Maps kind -> handler
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._init_database()
+    
+    def _init_database(self):
+        """Initialize database table."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(CREATE_TIMERS_TABLE)
+            cursor.execute(CREATE_TIMERS_ACTIVE_INDEX)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to initialize timers table: {e}")
+            raise
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get database connection."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        return conn
+    
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Convert a timer row to a dict with its payload decoded."""
+        timer = dict(row)
+        timer['payload'] = json.loads(timer['payload'] or '{}')
+        return timer
+    
+    # ========================================================================
+    # SCHEDULER
+    # ========================================================================
+    
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """
+        Register the coroutine that runs when a timer of this kind is due.
+        
+        Args:
+            kind: Timer kind (e.g. 'auto_switch')
+            handler: Coroutine called with the timer's payload
+        """
+        self.handlers[kind] = handler
+    
+    def start(self):
+        """Resume timers interrupted by a restart and start the scheduler loop."""
+        if self._task is not None and not self._task.done():
+            return
+        
+        self._recover()
+        self._cleanup()
+        self._task = asyncio.create_task(self._scheduler_loop())
+        
+        pending = self.get_pending()
+        logger.info(f"Timer manager started ({len(pending)} pending timer(s))")
+    
+    def _recover(self):
+        """Put timers that were firing when the bot stopped back in the queue."""
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("UPDATE timers SET status = 'pending' WHERE status = 'firing'")
+            if cursor.rowcount:
+                logger.warning(f"Resuming {cursor.rowcount} timer(s) interrupted by a restart")
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to recover timers: {e}")
+    
+    def _cleanup(self):
+        """Delete finished timers older than config.TIMERS['keep_days']."""
+        cutoff = time.time() - config.TIMERS['keep_days'] * 86400
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM timers
+                WHERE status NOT IN ('pending', 'firing') AND finished_at < ?
+            """, (cutoff,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to clean up timers: {e}")
+    
+    async def _scheduler_loop(self):
+        """Fire due timers, waking up on an interval or when timers change."""
+        while True:
+            try:
+                for timer in self._get_due():
+                    self._dispatch(timer)
+            except Exception as e:
+                logger.error(f"Error in timer scheduler: {e}")
+            
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=config.TIMERS['poll_interval'])
+            except asyncio.TimeoutError:
+                pass
+    
+    def _get_due(self) -> List[Dict[str, Any]]:
+        """Get pending timers whose due time has passed, oldest first."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM timers
+            WHERE status = 'pending' AND due_at <= ?
+            ORDER BY due_at
+        """, (time.time(),))
+        rows = cursor.fetchall()
+        conn.close()
+        return [self._to_dict(row) for row in rows]
+    
+    def _set_status(self, timer_id: int, status: str, error: str = None):
+        """Update a timer's status."""
+        finished_at = None if status in ('pending', 'firing') else time.time()
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE timers SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, error, finished_at, timer_id)
+        )
+        conn.commit()
+        conn.close()
+    
+    def _dispatch(self, timer: Dict[str, Any]):
+        """Mark a due timer as firing and run its handler in the background."""
+        if timer['kind'] not in self.handlers:
+            logger.warning(f"No handler for timer kind '{timer['kind']}', leaving it pending")
+            return
+        
+        # Marked before running, so the loop doesn't fire it twice and a
+        # restart while the handler runs resumes it
+        self._set_status(timer['id'], 'firing')
+        asyncio.create_task(self._fire(timer))
+    
+    async def _fire(self, timer: Dict[str, Any]):
+        """Run a timer's handler and record the outcome."""
+        overdue = time.time() - timer['due_at']
+        logger.info(f"Firing timer {timer['kind']}:{timer['key']} ({overdue:.0f}s after due)")
+        
+        try:
+            await self.handlers[timer['kind']](timer['payload'])
+            self._set_status(timer['id'], 'done')
+        except Exception as e:
+            logger.error(f"Timer {timer['kind']}:{timer['key']} failed: {e}")
+            self._set_status(timer['id'], 'failed', str(e))
+    
+    # ========================================================================
+    # TIMERS
+    # ========================================================================
+    
+    def schedule(
+        self,
+        kind: str,
+        key: str,
+        delay: float,
+        payload: Dict[str, Any] = None
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Schedule a timer, unless one is already active for this kind and key.
+        
+        Args:
+            kind: Timer kind (selects the handler)
+            key: What the timer is about (e.g. a username)
+            delay: Seconds from now until it fires
+            payload: JSON-serializable data passed to the handler
+        
+        Returns:
+            (created, timer) - created is False if the existing timer was returned
+        """
+        existing = self.get_active(kind, key)
+        if existing:
+            return False, existing
+        
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO timers (kind, key, due_at, payload)
+                VALUES (?, ?, ?, ?)
+            """, (kind, key, time.time() + delay, json.dumps(payload or {})))
+            conn.commit()
+            timer_id = cursor.lastrowid
+        except sqlite3.IntegrityError:
+            # Scheduled concurrently; keep the first one
+            conn.close()
+            return False, self.get_active(kind, key)
+        conn.close()
+        
+        self._wake.set()
+        logger.info(f"Scheduled timer {kind}:{key} in {delay:.0f}s")
+        return True, self.get(timer_id)
+    
+    def get(self, timer_id: int) -> Optional[Dict[str, Any]]:
+        """Get a timer by ID."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM timers WHERE id = ?", (timer_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return self._to_dict(row) if row else None
+    
+    def get_active(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Get the pending or firing timer for a kind and key."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM timers
+            WHERE kind = ? AND key = ? AND status IN ('pending', 'firing')
+        """, (kind, key))
+        row = cursor.fetchone()
+        conn.close()
+        return self._to_dict(row) if row else None
+    
+    def get_last(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Get the most recent timer for a kind and key, whatever its status."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT * FROM timers WHERE kind = ? AND key = ? ORDER BY id DESC LIMIT 1", (kind, key)
+        )
+        row = cursor.fetchone()
+        conn.close()
+        return self._to_dict(row) if row else None
+    
+    def clear_cancelled(self, kind: str, keep_key: str = None) -> int:
+        """
+        Forget cancelled timers of a kind, so get_last() no longer finds them.
+        
+        Args:
+            kind: Timer kind
+            keep_key: Key whose cancelled timers are kept
+        
+        Returns:
+            Number of timers forgotten
+        """
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM timers
+            WHERE kind = ? AND status = 'cancelled' AND key IS NOT ?
+        """, (kind, keep_key))
+        count = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return count
+    
+    def get_pending(self, kind: str = None) -> List[Dict[str, Any]]:
+        """Get pending timers (optionally of one kind), soonest first."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        if kind:
+            cursor.execute(
+                "SELECT * FROM timers WHERE status = 'pending' AND kind = ? ORDER BY due_at", (kind,)
+            )
+        else:
+            cursor.execute("SELECT * FROM timers WHERE status = 'pending' ORDER BY due_at")
+        rows = cursor.fetchall()
+        conn.close()
+        return [self._to_dict(row) for row in rows]
+    
+    def _get_pending_by_id(self, timer_id: int) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Get a timer that can still be changed (None and a reason if it can't)."""
+        timer = self.get(timer_id)
+        if not timer:
+            return None, "Timer not found"
+        if timer['status'] == 'firing':
+            return None, "Timer is already running"
+        if timer['status'] != 'pending':
+            return None, f"Timer is already {timer['status']}"
+        return timer, ""
+    
+    def cancel(self, timer_id: int) -> Tuple[bool, str]:
+        """
+        Cancel a pending timer.
+        
+        Returns:
+            (success, message)
+        """
+        timer, reason = self._get_pending_by_id(timer_id)
+        if not timer:
+            return False, reason
+        
+        self._set_status(timer_id, 'cancelled')
+        logger.info(f"Cancelled timer {timer['kind']}:{timer['key']}")
+        return True, "Timer cancelled"
+    
+    def snooze(self, timer_id: int, seconds: float = None) -> Tuple[bool, str]:
+        """
+        Push a pending timer back.
+        
+        Args:
+            timer_id: Timer ID
+            seconds: How long to add (default: config.TIMERS['snooze_time'])
+        
+        Returns:
+            (success, message)
+        """
+        if seconds is None:
+            seconds = config.TIMERS['snooze_time']
+        
+        timer, reason = self._get_pending_by_id(timer_id)
+        if not timer:
+            return False, reason
+        
+        # Snoozing an overdue timer counts from now
+        due_at = max(timer['due_at'], time.time()) + seconds
+        self._set_due(timer_id, due_at)
+        logger.info(f"Snoozed timer {timer['kind']}:{timer['key']} by {seconds:.0f}s")
+        return True, "Timer snoozed"
+    
+    def fire_now(self, timer_id: int) -> Tuple[bool, str]:
+        """
+        Make a pending timer due immediately.
+        
+        Returns:
+            (success, message)
+        """
+        timer, reason = self._get_pending_by_id(timer_id)
+        if not timer:
+            return False, reason
+        
+        self._set_due(timer_id, time.time())
+        self._wake.set()
+        return True, "Timer fires now"
+    
+    def _set_due(self, timer_id: int, due_at: float):
+        """Update a timer's due time."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE timers SET due_at = ? WHERE id = ?", (due_at, timer_id))
+        conn.commit()
+        conn.close()
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+timer_manager = TimerManager()
+
+# ============================================================================
+# END OF TIMER MANAGER
+# ============================================================================
@@ -60,6 +60,7 @@ ICONS = {
     'warning': '⚠️',          # Warning
     'error': '❌',            # Error
     'clock': '⏱️',            # Timer
+    'info': 'ℹ️',             # Information
     
     # GPU Icons
     'gpu': '🖥️',             # GPU selector
@@ -10,11 +10,17 @@ import json
 import asyncio
 import subprocess
 import logging
+import hashlib
+import shutil
+import tempfile
+import time
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Any, List, BinaryIO
 import aiohttp
 from cryptography.fernet import Fernet
 import config
+from http_client import http_client
 
 logger = logging.getLogger(__name__)
 
@@ -32,16 +38,23 @@ def get_encryption_key() -> bytes:
         logger.info(f"Generated new encryption key: {config.ENCRYPTION_KEY_FILE}")
         return key
 
-def encrypt_data(data: str) -> str:
-    """Encrypt sensitive data (like Modal tokens)."""
-    key = get_encryption_key()
+def is_leaked_encryption_key() -> bool:
+    """Check if the encryption key is one listed in config.LEAKED_ENCRYPTION_KEYS."""
+    if not config.ENCRYPTION_KEY_FILE.exists():
+        return False
+    digest = hashlib.sha256(config.ENCRYPTION_KEY_FILE.read_bytes().strip()).hexdigest()
+    return digest in config.LEAKED_ENCRYPTION_KEYS
+
+def encrypt_data(data: str, key: bytes = None) -> str:
+    """Encrypt sensitive data (like Modal tokens), with the stored key unless one is given."""
+    key = key or get_encryption_key()
     f = Fernet(key)
     encrypted = f.encrypt(data.encode())
     return encrypted.decode()
 
-def decrypt_data(encrypted_data: str) -> str:
-    """Decrypt sensitive data."""
-    key = get_encryption_key()
+def decrypt_data(encrypted_data: str, key: bytes = None) -> str:
+    """Decrypt sensitive data, with the stored key unless one is given."""
+    key = key or get_encryption_key()
     f = Fernet(key)
     decrypted = f.decrypt(encrypted_data.encode())
     return decrypted.decode()
@@ -74,6 +87,44 @@ def is_valid_output_file(filename: str) -> bool:
     ext = Path(filename).suffix.lower()
     return ext in config.ALLOWED_OUTPUT_EXTENSIONS
 
+def hash_file(filepath: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Get the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_stream_to_file(stream: BinaryIO, filepath: Path) -> Path:
+    """Copy a file object to disk (stream position is restored)."""
+    ensure_directory(filepath.parent)
+    position = stream.tell()
+    stream.seek(0)
+    with open(filepath, 'wb') as f:
+        shutil.copyfileobj(stream, f)
+    stream.seek(position)
+    return filepath
+
+async def spool_stream(stream: BinaryIO, filename: str) -> Path:
+    """
+    Copy a file object to its own temp file, off the event loop.
+    
+    The caller deletes the file when done with it.
+    """
+    spool_dir = ensure_directory(config.TEMP_DIR / "spool")
+    fd, path = tempfile.mkstemp(dir=spool_dir, prefix=f"{Path(clean_filename(filename)).stem}-",
+                                suffix=Path(filename).suffix)
+    os.close(fd)
+    return await asyncio.to_thread(save_stream_to_file, stream, Path(path))
+
+def get_stream_size(stream: BinaryIO) -> int:
+    """Get the size of a seekable file object in bytes (position is preserved)."""
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
 # ============================================================================
 # JSON OPERATIONS
 # ============================================================================
@@ -145,7 +196,7 @@ async def run_command(command: str, timeout: int = 300) -> tuple[int, str, str]:
             logger.error(f"Command failed (code {return_code}): {command}\nStderr: {stderr_str}")
         
         return return_code, stdout_str, stderr_str
-        
+    
     except Exception as e:
         logger.error(f"Error running command '{command}': {e}")
         return -1, "", str(e)
@@ -174,7 +225,7 @@ def run_command_sync(command: str, timeout: int = 300) -> tuple[int, str, str]:
             logger.error(f"Command failed (code {result.returncode}): {command}\nStderr: {result.stderr}")
         
         return result.returncode, result.stdout.strip(), result.stderr.strip()
-        
+    
     except subprocess.TimeoutExpired:
         logger.error(f"Command timed out after {timeout}s: {command}")
         return -1, "", "Command timed out"
@@ -182,70 +233,56 @@ def run_command_sync(command: str, timeout: int = 300) -> tuple[int, str, str]:
         logger.error(f"Error running command '{command}': {e}")
         return -1, "", str(e)
 
+# ============================================================================
+# PROCESS POOL (for CPU-heavy work that would block the event loop)
+# ============================================================================
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Get the shared process pool, creating it on first use."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=config.MEDIA_PROCESS_WORKERS)
+    return _process_pool
+
+async def run_in_process(func, *args):
+    """Run a picklable function in the shared process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), func, *args)
+
+def shutdown_process_pool():
+    """Shut down the shared process pool."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+    _process_pool = None
+
 # ============================================================================
 # HTTP REQUEST UTILITIES
 # ============================================================================
 
 async def fetch_url(url: str, timeout: int = None) -> Optional[Dict[Any, Any]]:
     """
-    Fetch JSON data from URL.
+    Fetch JSON data from URL (over the shared pooled session).
     
     Returns:
         JSON response or None if failed
     """
-    if timeout is None:
-        timeout = config.REQUEST_TIMEOUT
-    
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=timeout) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.warning(f"HTTP {response.status} from {url}")
-                    return None
-    except asyncio.TimeoutError:
-        logger.error(f"Request timeout for {url}")
-        return None
-    except Exception as e:
-        logger.error(f"Error fetching {url}: {e}")
-        return None
+    return await http_client.get_json(url, timeout)
 
 async def post_json(url: str, data: Dict[Any, Any], timeout: int = None) -> Optional[Dict[Any, Any]]:
     """
-    POST JSON data to URL.
+    POST JSON data to URL (over the shared pooled session).
     
     Returns:
         JSON response or None if failed
     """
-    if timeout is None:
-        timeout = config.REQUEST_TIMEOUT
-    
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, timeout=timeout) as response:
-                if response.status in [200, 201]:
-                    return await response.json()
-                else:
-                    logger.warning(f"HTTP {response.status} from {url}")
-                    text = await response.text()
-                    logger.debug(f"Response: {text}")
-                    return None
-    except asyncio.TimeoutError:
-        logger.error(f"Request timeout for {url}")
-        return None
-    except Exception as e:
-        logger.error(f"Error posting to {url}: {e}")
-        return None
+    return await http_client.post_json(url, data, timeout)
 
 async def check_url_reachable(url: str, timeout: int = 10) -> bool:
     """Check if a URL is reachable."""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=timeout) as response:
-                return response.status == 200
-    except:
-        return False
+    return await http_client.is_reachable(url, timeout)
 
 async def wait_for_url(url: str, max_wait: int = 300, check_interval: int = 5) -> bool:
     """
@@ -260,20 +297,99 @@ async def wait_for_url(url: str, max_wait: int = 300, check_interval: int = 5) -
         True if URL became reachable, False if timed out
     """
     logger.info(f"Waiting for {url} to become reachable...")
-    elapsed = 0
+    started = time.monotonic()
+    deadline = started + max_wait
     
-    while elapsed < max_wait:
-        if await check_url_reachable(url, timeout=check_interval):
+    # Deadline is monotonic, so time spent inside slow requests counts too
+    while time.monotonic() < deadline:
+        request_timeout = max(1, min(check_interval, deadline - time.monotonic()))
+        if await check_url_reachable(url, timeout=request_timeout):
             logger.info(f"{url} is now reachable!")
             return True
         
-        await asyncio.sleep(check_interval)
-        elapsed += check_interval
-        logger.debug(f"Still waiting for {url}... ({elapsed}/{max_wait}s)")
+        await asyncio.sleep(max(0, min(check_interval, deadline - time.monotonic())))
+        logger.debug(f"Still waiting for {url}... ({time.monotonic() - started:.0f}/{max_wait}s)")
     
     logger.error(f"Timeout waiting for {url} after {max_wait}s")
     return False
 
+async def stream_url_to_buffer(
+    url: str,
+    params: Dict[str, str] = None,
+    max_retries: int = None
+) -> Optional[BinaryIO]:
+    """
+    Stream a URL into a spooled buffer.
+    
+    Small files stay in memory, large ones spill to TEMP_DIR. If the
+    connection drops mid-transfer, the download resumes from the last
+    received byte with a Range request instead of starting over.
+    
+    Returns:
+        Buffer positioned at the start, or None if failed
+    """
+    if max_retries is None:
+        max_retries = config.MAX_RETRIES
+    
+    buffer = tempfile.SpooledTemporaryFile(
+        max_size=config.OUTPUT_SPOOL_MAX_MEMORY,
+        dir=config.TEMP_DIR
+    )
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=config.REQUEST_TIMEOUT)
+    received = 0
+    total = None
+    attempts = 0
+    
+    while True:
+        headers = {'Range': f'bytes={received}-'} if received else {}
+        
+        try:
+            session = http_client.get_session()
+            async with session.get(url, params=params, headers=headers, timeout=timeout) as response:
+                if response.status == 416 and total is not None and received >= total:
+                    break
+                
+                if response.status == 200:
+                    # Server ignored the Range header, start from scratch
+                    if received:
+                        logger.debug(f"Range not honoured by {url}, restarting download")
+                        buffer.seek(0)
+                        buffer.truncate()
+                        received = 0
+                    total = response.content_length
+                elif response.status == 206:
+                    content_range = response.headers.get('Content-Range', '')
+                    size = content_range.rsplit('/', 1)[-1]
+                    if size.isdigit():
+                        total = int(size)
+                else:
+                    logger.warning(f"HTTP {response.status} from {url}")
+                    buffer.close()
+                    return None
+                
+                async for chunk in response.content.iter_chunked(config.DOWNLOAD_CHUNK_SIZE):
+                    buffer.write(chunk)
+                    received += len(chunk)
+            
+            if total is None or received >= total:
+                break
+            
+            raise aiohttp.ClientPayloadError(f"Connection closed at {received}/{total} bytes")
+        
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            attempts += 1
+            if attempts > max_retries:
+                logger.error(f"Giving up on {url} after {attempts} attempts: {e}")
+                buffer.close()
+                return None
+            
+            logger.warning(f"Download of {url} interrupted at {received} bytes ({e}), resuming...")
+            await asyncio.sleep(config.RETRY_DELAY)
+    
+    buffer.seek(0)
+    logger.info(f"Streamed {received} bytes from {url}")
+    return buffer
+
 # ============================================================================
 # COMFYUI SPECIFIC UTILITIES
 # ============================================================================
@@ -296,43 +412,130 @@ async def wait_for_comfyui(base_url: str, max_wait: int = None) -> bool:
     url = base_url.rstrip('/') + config.COMFYUI_API['system_stats']
     return await wait_for_url(url, max_wait, config.COMFYUI_CHECK_INTERVAL)
 
-async def send_comfyui_prompt(base_url: str, workflow: Dict[Any, Any], prompt: str) -> Optional[Dict[Any, Any]]:
+async def send_comfyui_prompt(
+    base_url: str,
+    workflow: Dict[Any, Any],
+    prompt: str,
+    client_id: str = "discord_bot"
+) -> Optional[Dict[Any, Any]]:
     """
     Send a generation prompt to ComfyUI.
     
     Args:
         base_url: ComfyUI base URL
-        workflow: Workflow JSON
-        prompt: Text prompt to inject
+        workflow: Workflow JSON (prompt already injected)
+        prompt: Text prompt (for logging)
+        client_id: Websocket client ID that should receive execution events
     
     Returns:
-        Response JSON or None if failed
+        Response JSON (includes 'prompt_id') or None if failed
     """
-    # Inject prompt into workflow (this is simplified - actual implementation
-    # would need to find the correct node to inject the prompt into)
-    # TODO: Implement proper prompt injection logic
-    
     url = base_url.rstrip('/') + config.COMFYUI_API['prompt']
     payload = {
         "prompt": workflow,
-        "client_id": "discord_bot"
+        "client_id": client_id
+    }
+    
+    logger.debug(f"Sending prompt to ComfyUI: {truncate_string(prompt or '', 80)}")
+    
+    # Shared session keeps the connection alive between prompts (batches POST back to back)
+    try:
+        session = http_client.get_session()
+        async with session.post(url, json=payload, timeout=config.REQUEST_TIMEOUT) as response:
+            if response.status in [200, 201]:
+                return await response.json()
+            
+            logger.warning(f"HTTP {response.status} from {url}")
+            logger.debug(f"Response: {await response.text()}")
+            return None
+    except asyncio.TimeoutError:
+        logger.error(f"Request timeout for {url}")
+        return None
+    except Exception as e:
+        logger.error(f"Error posting to {url}: {e}")
+        return None
+
+async def fetch_comfyui_output(
+    base_url: str,
+    filename: str,
+    subfolder: str = "",
+    folder_type: str = "output"
+) -> Optional[BinaryIO]:
+    """
+    Stream an output file straight from ComfyUI's /view endpoint.
+    
+    Args:
+        base_url: ComfyUI base URL
+        filename: Output filename
+        subfolder: Subfolder inside the output directory
+        folder_type: ComfyUI folder type ('output', 'temp' or 'input')
+    
+    Returns:
+        Buffer with the file contents or None if failed
+    """
+    url = base_url.rstrip('/') + config.COMFYUI_API['view']
+    params = {
+        'filename': filename,
+        'subfolder': subfolder,
+        'type': folder_type,
     }
+    return await stream_url_to_buffer(url, params=params)
+
+async def get_comfyui_queue(base_url: str) -> Optional[Dict[str, Any]]:
+    """
+    Get ComfyUI's queue.
+    
+    Returns:
+        {'queue_running': [...], 'queue_pending': [...]} or None if failed
+    """
+    url = base_url.rstrip('/') + config.COMFYUI_API['queue']
+    return await fetch_url(url, timeout=10)
+
+async def cancel_comfyui_prompt(base_url: str, prompt_id: str, running: bool = False) -> bool:
+    """
+    Cancel a prompt on ComfyUI.
+    
+    Pending prompts are removed from the queue, a running prompt is interrupted.
     
-    return await post_json(url, payload)
+    Returns:
+        True if the request was accepted, False otherwise
+    """
+    base_url = base_url.rstrip('/')
+    
+    if running:
+        url = base_url + config.COMFYUI_API['interrupt']
+        payload = {'prompt_id': prompt_id}
+    else:
+        url = base_url + config.COMFYUI_API['queue']
+        payload = {'delete': [prompt_id]}
+    
+    try:
+        session = http_client.get_session()
+        async with session.post(url, json=payload, timeout=config.REQUEST_TIMEOUT) as response:
+            return response.status == 200
+    except Exception as e:
+        logger.error(f"Error cancelling prompt {prompt_id}: {e}")
+        return False
 
 # ============================================================================
 # MODAL VOLUME UTILITIES
 # ============================================================================
 
-async def list_modal_volume_files(volume_name: str, path: str) -> List[str]:
+async def list_modal_volume_files(volume_name: str, path: str, profile: str = None) -> List[str]:
     """
     List files in a Modal volume path.
     
+    Args:
+        volume_name: Modal volume name
+        path: Path inside the volume
+        profile: Modal profile whose volume to read (default: the active one)
+    
     Returns:
         List of filenames
     """
     command = config.get_modal_command(
         'volume_ls',
+        profile=profile,
         volume_name=volume_name,
         path=path
     )
@@ -347,10 +550,21 @@ async def list_modal_volume_files(volume_name: str, path: str) -> List[str]:
     files = [line.strip() for line in stdout.split('\n') if line.strip()]
     return files
 
-async def download_from_modal_volume(volume_name: str, remote_path: str, local_path: Path) -> bool:
+async def download_from_modal_volume(
+    volume_name: str,
+    remote_path: str,
+    local_path: Path,
+    profile: str = None
+) -> bool:
     """
     Download a file from Modal volume.
     
+    Args:
+        volume_name: Modal volume name
+        remote_path: Path inside the volume
+        local_path: Where to save the file
+        profile: Modal profile whose volume to read (default: the active one)
+    
     Returns:
         True if successful, False otherwise
     """
@@ -358,6 +572,7 @@ async def download_from_modal_volume(volume_name: str, remote_path: str, local_p
     
     command = config.get_modal_command(
         'volume_get',
+        profile=profile,
         volume_name=volume_name,
         remote_path=remote_path,
         local_path=str(local_path)
@@ -5,10 +5,13 @@ Button-based UI Views for Discord Bot
 from .main_menu import MainControlPanel
 from .user_config import UserConfigMenu, SwitchAccountView
 from .credits import CreditsView
+from .timers import TimerView, format_timer
 
 __all__ = [
     'MainControlPanel',
     'UserConfigMenu',
     'SwitchAccountView',
     'CreditsView',
+    'TimerView',
+    'format_timer',
 ]
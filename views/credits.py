@@ -3,7 +3,6 @@ Credits View - Functions for checking credits from CreditTracker
 """
 
 import discord
-import aiohttp
 import json
 from pathlib import Path
 
@@ -16,31 +15,26 @@ async def get_credits_from_tracker():
         float: Credit balance, or None if not available
     """
     try:
-        from .. import config
+        from http_client import http_client
         
         # Check if ComfyUI is running
-        from ..modal_manager import modal_manager
+        from modal_manager import modal_manager
         if not modal_manager.current_deployment:
             return None
         
         # URL to balance.json on running server
-        comfyui_url = config.CLOUDFLARE_URLS['comfyui']
+        comfyui_url = modal_manager.current_deployment['comfyui_url']
         
         # The balance.json should be accessible at:
         # https://comfyui.tensorart.site/custom_nodes/ComfyUI-CreditTracker/balance.json
         balance_url = f"{comfyui_url.rstrip('/')}/custom_nodes/ComfyUI-CreditTracker/balance.json"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(balance_url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # The balance.json structure should be: {"balance": 12.34}
-                    # Adjust this based on actual structure
-                    balance = data.get('balance', None)
-                    
-                    if balance is not None:
-                        return float(balance)
+        data = await http_client.get_json(balance_url, timeout=10)
+        
+        # The balance.json structure should be: {"balance": 12.34}
+        # Adjust this based on actual structure
+        if data and data.get('balance') is not None:
+            return float(data['balance'])
         
         return None
         
@@ -15,6 +15,13 @@ class MainControlPanel(View):
         super().__init__(timeout=None)  # No timeout for persistent UI
         self.bot = bot
     
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """Count every button press as activity for the idle timer"""
+        from idle_manager import idle_manager
+        
+        idle_manager.record_panel(interaction.channel)
+        return True
+    
     @discord.ui.button(label="▶️ Start", style=discord.ButtonStyle.success, custom_id="btn_start", row=0)
     async def start_button(self, button: Button, interaction: discord.Interaction):
         """Start ComfyUI server"""
@@ -22,9 +29,11 @@ class MainControlPanel(View):
         
         try:
             # Import here to avoid circular imports
-            from ..modal_manager import modal_manager
-            from ..account_manager import account_manager
-            from .. import config
+            from modal_manager import modal_manager
+            from account_manager import account_manager
+            from readiness_prober import readiness_prober
+            from gpu_advisor import gpu_advisor
+            import config
             
             # Get active account
             active_account = account_manager.get_active_account()
@@ -36,7 +45,7 @@ class MainControlPanel(View):
                 return
             
             username = active_account['username']
-            gpu = active_account.get('selected_gpu', 'H100')
+            gpu = active_account.get('selected_gpu') or gpu_advisor.pick_gpu() or 'H100'
             
             # Check if already running
             if modal_manager.current_deployment:
@@ -49,7 +58,7 @@ class MainControlPanel(View):
             # Send starting message
             await interaction.followup.send(
                 f"🚀 Starting ComfyUI on `{username}` with GPU: **{gpu}**...\n"
-                f"⏳ This will take 2-3 minutes. Please wait...",
+                f"⏳ Expected ready in {readiness_prober.format_eta(gpu, username)}. Please wait...",
                 ephemeral=True
             )
             
@@ -77,7 +86,7 @@ class MainControlPanel(View):
                     f"❌ Failed to start ComfyUI: {message}",
                     ephemeral=True
                 )
-                
+        
         except Exception as e:
             await interaction.followup.send(
                 f"❌ Error starting server: {str(e)}",
@@ -90,7 +99,7 @@ class MainControlPanel(View):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            from ..modal_manager import modal_manager
+            from modal_manager import modal_manager
             
             # Check if running
             if not modal_manager.current_deployment:
@@ -113,7 +122,7 @@ class MainControlPanel(View):
                     f"❌ Failed to stop server: {message}",
                     ephemeral=True
                 )
-                
+        
         except Exception as e:
             await interaction.followup.send(
                 f"❌ Error stopping server: {str(e)}",
@@ -137,7 +146,7 @@ class MainControlPanel(View):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            from ..account_manager import account_manager
+            from account_manager import account_manager
             from .credits import get_credits_from_tracker
             
             # Get active account
@@ -177,13 +186,38 @@ class MainControlPanel(View):
                     f"(Server must be running to check credits from CreditTracker)",
                     ephemeral=True
                 )
-                
+        
         except Exception as e:
             await interaction.followup.send(
                 f"❌ Error retrieving credits: {str(e)}",
                 ephemeral=True
             )
     
+    @discord.ui.button(label="⏰ Timers", style=discord.ButtonStyle.primary, custom_id="btn_timers", row=2)
+    async def timers_button(self, button: Button, interaction: discord.Interaction):
+        """Show pending timers with buttons to cancel or snooze them"""
+        from timer_manager import timer_manager
+        from .timers import TimerView, format_timer
+        
+        pending = timer_manager.get_pending()
+        if not pending:
+            await interaction.response.send_message(
+                "⏰ No pending timers.",
+                ephemeral=True
+            )
+            return
+        
+        await interaction.response.send_message(
+            f"⏰ **Pending Timers** ({len(pending)})",
+            ephemeral=True
+        )
+        for timer in pending:
+            await interaction.followup.send(
+                format_timer(timer),
+                view=TimerView(timer['id']),
+                ephemeral=True
+            )
+    
     @discord.ui.button(label="🚪 Exit", style=discord.ButtonStyle.secondary, custom_id="btn_exit", row=2)
     async def exit_button(self, button: Button, interaction: discord.Interaction):
         """Close the control panel"""
@@ -0,0 +1,71 @@
+"""
+Timer Views - Buttons to cancel, snooze or fire pending timers
+"""
+
+import time
+import discord
+from discord.ui import Button, View
+
+
+class TimerView(View):
+    """
+    Buttons for one pending timer (persistent, re-added at startup)
+    """
+    
+    def __init__(self, timer_id: int, fire_label: str = "Switch Now"):
+        super().__init__(timeout=None)  # Outlives the message's interaction window
+        self.timer_id = timer_id
+        
+        # Custom IDs carry the timer ID, so the buttons keep working after a restart
+        for label, style, emoji, action in (
+            (fire_label, discord.ButtonStyle.danger, "⏭️", "fire"),
+            ("Snooze", discord.ButtonStyle.primary, "⏰", "snooze"),
+            ("Cancel", discord.ButtonStyle.secondary, "✖️", "cancel"),
+        ):
+            button = Button(label=label, style=style, emoji=emoji, custom_id=f"timer_{action}:{timer_id}")
+            button.callback = self._make_callback(action)
+            self.add_item(button)
+    
+    def _make_callback(self, action: str):
+        """Create the callback for one of the buttons"""
+        async def callback(interaction: discord.Interaction):
+            from timer_manager import timer_manager
+            import config
+            import utils
+            
+            if action == 'fire':
+                success, message = timer_manager.fire_now(self.timer_id)
+            elif action == 'snooze':
+                success, message = timer_manager.snooze(self.timer_id)
+                if success:
+                    message = f"Snoozed for {utils.format_time_remaining(config.TIMERS['snooze_time'])}"
+            else:
+                success, message = timer_manager.cancel(self.timer_id)
+            
+            if not success:
+                await interaction.response.send_message(f"❌ {message}", ephemeral=True)
+                return
+            
+            # Snoozed timers keep their buttons, finished ones lose them
+            keep_buttons = action == 'snooze'
+            await interaction.response.edit_message(view=self if keep_buttons else None)
+            await interaction.followup.send(f"✅ {message}", ephemeral=True)
+        
+        return callback
+
+
+def format_timer(timer: dict) -> str:
+    """
+    Describe a pending timer, e.g. "Auto-switch `alice` in 12m"
+    
+    Args:
+        timer: Timer dict from timer_manager
+    
+    Returns:
+        str: One-line description
+    """
+    import utils
+    
+    remaining = max(0, int(timer['due_at'] - time.time()))
+    kind = timer['kind'].replace('_', '-').capitalize()
+    return f"{kind} `{timer['key']}` in {utils.format_time_remaining(remaining)}"
@@ -44,8 +44,8 @@ class AddAccountModal_DISABLED:
         await interaction.response.defer(ephemeral=True)
         
         try:
-            from ..account_manager import account_manager
-            from ..modal_manager import modal_manager
+            from account_manager import account_manager
+            from modal_manager import modal_manager
             
             username = self.username.value.strip()
             token_id = self.token_id.value.strip()
@@ -68,7 +68,7 @@ class AddAccountModal_DISABLED:
                 return
             
             # Check max accounts
-            from .. import config
+            import config
             if len(account_manager.list_accounts()) >= config.MAX_ACCOUNTS:
                 await interaction.followup.send(
                     f"❌ Maximum number of accounts ({config.MAX_ACCOUNTS}) reached!",
@@ -159,8 +159,8 @@ class SwitchAccountView(View):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            from ..modal_manager import modal_manager
-            from ..account_manager import account_manager
+            from modal_manager import modal_manager
+            from account_manager import account_manager
             
             selected_username = interaction.data['values'][0]
             
@@ -234,7 +234,7 @@ class UserConfigMenu(View):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            from ..account_manager import account_manager
+            from account_manager import account_manager
             
             # Get all accounts
             accounts = account_manager.list_accounts()
@@ -7,12 +7,23 @@ Manages ComfyUI workflows and Discord channels:
 - Tracks workflow usage
 """
 
+import asyncio
+import itertools
 import logging
+import time
 import discord
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, BinaryIO, Union, Callable, Awaitable, Tuple
 from pathlib import Path
 import config
+import utils
 from modal_manager import modal_manager
+from media_encoder import output_encoder
+from execution_tracker import execution_tracker
+from preview_streamer import PreviewStreamer
+from workflow_templates import workflow_templates
+from result_cache import result_cache
+from deployment_pool import deployment_pool
+from gpu_advisor import gpu_advisor
 
 logger = logging.getLogger(__name__)
 
@@ -165,7 +176,7 @@ class WorkflowManager:
             self.workflow_channels[workflow_name] = channel.id
             logger.info(f"Created channel: #{channel_name}")
             return channel
-            
+        
         except discord.Forbidden:
             logger.error("Bot lacks permission to create channel")
             return None
@@ -182,6 +193,9 @@ class WorkflowManager:
         """
         logger.info("Refreshing workflow channels...")
         
+        # Workflows may have changed on the volume
+        workflow_templates.invalidate()
+        
         # Get list of workflows from Modal
         workflows = await modal_manager.list_workflows()
         
@@ -223,97 +237,594 @@ class WorkflowManager:
         """
         return await modal_manager.get_workflow(workflow_name)
     
-    def inject_prompt_into_workflow(
+    async def build_workflow(
         self,
-        workflow: Dict[Any, Any],
-        prompt: str
-    ) -> Dict[Any, Any]:
+        workflow_name: str,
+        prompt: str,
+        params: Dict[str, Any] = None
+    ) -> Optional[Dict[Any, Any]]:
         """
-        Inject text prompt into workflow JSON.
+        Build a workflow for one generation from its compiled template.
         
-        This is a simplified implementation. The actual logic depends on
-        your workflow structure. You may need to customize this for your
-        specific workflows.
+        The template is compiled once and cached, so this only copies the
+        nodes that receive a value.
         
         Args:
-            workflow: Workflow JSON dict
+            workflow_name: Workflow name
             prompt: Text prompt to inject
+            params: Extra parameters (negative_prompt, seed, steps, width, height)
         
         Returns:
-            Modified workflow dict
-        """
-        # Search for text input nodes in the workflow
-        # Common node types that accept text prompts:
-        # - "CLIPTextEncode"
-        # - "Text"
-        # - "String"
-        # - "Prompt"
-        
-        prompt_node_types = [
-            "CLIPTextEncode",
-            "Text",
-            "String", 
-            "Prompt",
-            "PromptText",
-            "TextInput"
-        ]
-        
-        # Iterate through workflow nodes
-        if isinstance(workflow, dict):
-            for node_id, node_data in workflow.items():
-                if isinstance(node_data, dict):
-                    # Check if this is a prompt node
-                    node_type = node_data.get('class_type', '')
-                    
-                    if node_type in prompt_node_types:
-                        # Inject prompt into the 'inputs' section
-                        if 'inputs' in node_data:
-                            # Common input field names for prompts
-                            prompt_fields = ['text', 'prompt', 'string', 'value']
-                            
-                            for field in prompt_fields:
-                                if field in node_data['inputs']:
-                                    logger.info(f"Injecting prompt into node {node_id}, field '{field}'")
-                                    node_data['inputs'][field] = prompt
-                                    break
-        
-        return workflow
+            Workflow dict or None if the workflow couldn't be loaded
+        """
+        template = await workflow_templates.get(workflow_name)
+        if not template:
+            return None
+        
+        return template.instantiate(prompt, **(params or {}))
     
     async def generate_with_workflow(
         self,
         workflow_name: str,
-        prompt: str
+        prompt: str,
+        guild: discord.Guild = None,
+        status_message: discord.Message = None,
+        live_preview: bool = False,
+        on_finish: Callable[[Dict[str, Any]], Awaitable[None]] = None,
+        params: Dict[str, Any] = None,
+        use_cache: bool = True,
+        base_url: str = None
     ) -> tuple[bool, str, Optional[Dict[Any, Any]]]:
         """
         Generate image using a workflow and prompt.
         
+        The prompt is tracked over ComfyUI's websocket. When it finishes,
+        outputs are posted to the workflow channel and the status message
+        (if given) is updated with the result.
+        
+        If the exact same workflow was rendered before, its outputs are
+        reposted from the result cache instead.
+        
         Args:
             workflow_name: Workflow name
             prompt: Text prompt
+            guild: Discord guild to post outputs in (optional)
+            status_message: Message to update when the generation finishes (optional)
+            live_preview: Stream latent previews into the status message
+            on_finish: Coroutine called with the tracked job after outputs are delivered
+            params: Extra workflow parameters (negative_prompt, seed, steps, width, height)
+            use_cache: Serve identical requests from the result cache
+            base_url: ComfyUI to run on (default: config.CLOUDFLARE_URLS['comfyui'])
         
         Returns:
             (success, message, response_data)
         """
         logger.info(f"Generating with workflow '{workflow_name}' and prompt: {prompt}")
         
-        # Get workflow JSON
-        workflow = await self.get_workflow_json(workflow_name)
+        # Build workflow from its compiled template
+        workflow = await self.build_workflow(workflow_name, prompt, params)
         if not workflow:
             return False, f"Workflow '{workflow_name}' not found", None
         
-        # Inject prompt
-        workflow = self.inject_prompt_into_workflow(workflow, prompt)
+        cache_key = result_cache.make_key(workflow) if use_cache else None
+        if cache_key:
+            entry = result_cache.lookup(cache_key)
+            if entry and await self.deliver_cached(entry, workflow_name, prompt, guild, status_message):
+                if on_finish:
+                    await on_finish({'status': 'success', 'cached': True, 'outputs': entry['outputs']})
+                return True, "Served from cache!", {'cached': True, 'outputs': entry['outputs']}
+        
+        # Open the websocket first so no execution events are missed
+        comfyui_url = base_url or config.CLOUDFLARE_URLS['comfyui']
+        await execution_tracker.ensure_connected(comfyui_url)
         
         # Send to ComfyUI
-        comfyui_url = config.CLOUDFLARE_URLS['comfyui']
-        response = await utils.send_comfyui_prompt(comfyui_url, workflow, prompt)
+        response = await utils.send_comfyui_prompt(
+            comfyui_url,
+            workflow,
+            prompt,
+            client_id=execution_tracker.client_id
+        )
         
         if not response:
             return False, "Failed to send prompt to ComfyUI", None
         
+        prompt_id = response.get('prompt_id')
+        if prompt_id:
+            preview = None
+            if live_preview and status_message:
+                preview = PreviewStreamer(status_message, workflow_name)
+            
+            async def finished(job: Dict[str, Any]):
+                if cache_key and job['status'] == 'success':
+                    self._store_result(cache_key, workflow_name, job)
+                self._record_runtime(workflow_name, job)
+                # A cancelled job's status message already says so
+                if not job.get('cancelled'):
+                    await self.deliver_outputs(job)
+                if on_finish:
+                    await on_finish(job)
+            
+            execution_tracker.track(
+                prompt_id,
+                comfyui_url,
+                on_finish=finished,
+                workflow_name=workflow_name,
+                prompt=prompt,
+                guild=guild,
+                status_message=status_message,
+                preview=preview
+            )
+        
         logger.info(f"Generation started: {response}")
         return True, "Generation started!", response
     
+    def _store_result(self, cache_key: str, workflow_name: str, job: Dict[str, Any]):
+        """Cache a finished job's outputs, with the deployment and account that hold them."""
+        deployment = deployment_pool.get_by_url(job['base_url'])
+        result_cache.store(
+            cache_key,
+            workflow_name,
+            job['outputs'],
+            execution_tracker.get_execution_time(job),
+            base_url=job['base_url'],
+            username=deployment['username'] if deployment else None
+        )
+    
+    def _record_runtime(self, workflow_name: str, job: Dict[str, Any]):
+        """Record a finished job's runtime for the GPU advisor."""
+        if job['status'] != 'success':
+            return
+        
+        deployment = deployment_pool.get_by_url(job['base_url'])
+        if not deployment:
+            return  # GPU unknown (ComfyUI wasn't started by the bot)
+        
+        gpu_advisor.record_run(
+            workflow_name,
+            deployment['gpu'],
+            execution_tracker.get_execution_time(job),
+            len(job['outputs'])
+        )
+    
+    # ========================================================================
+    # BATCH GENERATION
+    # ========================================================================
+    
+    def parse_sweep(self, text: str) -> Dict[str, List[int]]:
+        """
+        Parse a parameter sweep like "steps=20,30; width=512,768".
+        
+        Returns:
+            Dict mapping parameter -> values
+        
+        Raises:
+            ValueError: If the text can't be parsed
+        """
+        sweep = {}
+        for part in text.split(';'):
+            if not part.strip():
+                continue
+            
+            name, _, values = part.partition('=')
+            name = name.strip()
+            if not name or not values.strip():
+                raise ValueError(f"Invalid sweep '{part.strip()}' (expected name=value,value)")
+            
+            try:
+                sweep[name] = [int(value) for value in values.split(',') if value.strip()]
+            except ValueError:
+                raise ValueError(f"Sweep values for '{name}' must be whole numbers")
+        
+        return sweep
+    
+    def build_variants(
+        self,
+        seeds: List[int] = None,
+        sweep: Dict[str, List[Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Expand seeds and a parameter sweep into one parameter set per prompt.
+        
+        Every seed is combined with every point of the sweep.
+        
+        Returns:
+            List of parameter dicts
+        """
+        combos = [{}]
+        if sweep:
+            combos = [dict(zip(sweep, values)) for values in itertools.product(*sweep.values())]
+        
+        if not seeds:
+            return combos
+        
+        return [{'seed': seed, **combo} for seed in seeds for combo in combos]
+    
+    def format_variant(self, variant: Dict[str, Any]) -> str:
+        """Format a variant's parameters as a short label."""
+        return ', '.join(f"{name}={value}" for name, value in variant.items()) or "default"
+    
+    async def generate_batch(
+        self,
+        workflow_name: str,
+        prompt: str,
+        seeds: List[int] = None,
+        sweep: Dict[str, List[Any]] = None,
+        params: Dict[str, Any] = None,
+        guild: discord.Guild = None,
+        status_message: discord.Message = None,
+        on_finish: Callable[[Dict[str, Any]], Awaitable[None]] = None,
+        use_cache: bool = True,
+        base_url: str = None
+    ) -> tuple[bool, str, Optional[Dict[str, Any]]]:
+        """
+        Generate several variants of a prompt from one template.
+        
+        All variants are instantiated from the same compiled template and
+        POSTed back to back over the shared keep-alive session. When the
+        last one finishes, all outputs are posted together. Variants found
+        in the result cache are not rendered again.
+        
+        Args:
+            workflow_name: Workflow name
+            prompt: Text prompt
+            seeds: Seeds to generate (optional)
+            sweep: Dict mapping parameter -> values to try (optional)
+            params: Parameters shared by every variant (optional)
+            guild: Discord guild to post outputs in (optional)
+            status_message: Message to update with batch progress (optional)
+            on_finish: Coroutine called with the batch when every variant finished
+            use_cache: Serve variants from the result cache when possible
+            base_url: ComfyUI to run on (default: config.CLOUDFLARE_URLS['comfyui'])
+        
+        Returns:
+            (success, message, batch)
+        """
+        variants = self.build_variants(seeds, sweep)
+        if len(variants) > config.BATCH['max_variants']:
+            return False, f"Batch has {len(variants)} variants (max: {config.BATCH['max_variants']})", None
+        
+        template = await workflow_templates.get(workflow_name)
+        if not template:
+            return False, f"Workflow '{workflow_name}' not found", None
+        
+        supported = template.get_parameters()
+        for name in variants[0]:
+            if name not in supported:
+                return False, f"Workflow '{workflow_name}' has no '{name}' input to vary", None
+        
+        logger.info(f"Generating batch of {len(variants)} with workflow '{workflow_name}'")
+        
+        batch = {
+            'workflow_name': workflow_name,
+            'prompt': prompt,
+            'variants': variants,
+            'prompt_ids': [],
+            'results': {},  # Maps variant index -> finished tracker job
+            'failed_submits': 0,
+            'cached': 0,
+            'submitting': True,
+            'guild': guild,
+            'status_message': status_message,
+            'submitted_at': time.monotonic(),
+            'status': None,
+            'on_finish': on_finish,
+        }
+        
+        comfyui_url = base_url or config.CLOUDFLARE_URLS['comfyui']
+        await execution_tracker.ensure_connected(comfyui_url)
+        
+        for index, variant in enumerate(variants):
+            workflow = template.instantiate(prompt, **{**(params or {}), **variant})
+            
+            cache_key = result_cache.make_key(workflow) if use_cache else None
+            entry = result_cache.lookup(cache_key) if cache_key else None
+            if entry:
+                batch['results'][index] = {
+                    'status': 'success',
+                    'cached': True,
+                    'outputs': entry['outputs'],
+                    'base_url': entry['base_url'],
+                    'username': entry['username'],
+                }
+                batch['cached'] += 1
+                continue
+            
+            response = await utils.send_comfyui_prompt(
+                comfyui_url,
+                workflow,
+                prompt,
+                client_id=execution_tracker.client_id
+            )
+            
+            prompt_id = response.get('prompt_id') if response else None
+            if not prompt_id:
+                logger.warning(f"Failed to submit batch variant {self.format_variant(variant)}")
+                batch['failed_submits'] += 1
+                continue
+            
+            batch['prompt_ids'].append(prompt_id)
+            
+            async def finished(job: Dict[str, Any], index=index, cache_key=cache_key):
+                if cache_key and job['status'] == 'success':
+                    self._store_result(cache_key, workflow_name, job)
+                self._record_runtime(workflow_name, job)
+                batch['results'][index] = job
+                await self._batch_progress(batch)
+            
+            execution_tracker.track(
+                prompt_id,
+                comfyui_url,
+                on_finish=finished,
+                workflow_name=workflow_name,
+                prompt=prompt,
+                variant=variant
+            )
+        
+        batch['submitting'] = False
+        
+        if not batch['prompt_ids'] and not batch['cached']:
+            return False, "Failed to send batch to ComfyUI", None
+        
+        # Variants may have finished while later ones were being sent
+        await self._batch_progress(batch)
+        
+        return True, f"Batch of {len(batch['prompt_ids']) + batch['cached']} started!", batch
+    
+    async def _batch_progress(self, batch: Dict[str, Any]):
+        """Update a batch's status message and deliver it when every variant finished."""
+        from ui_config import COLORS, ICONS, create_progress_bar
+        
+        if batch['submitting'] or batch['status']:
+            return
+        
+        done = len(batch['results'])
+        total = len(batch['variants']) - batch['failed_submits']
+        
+        if done < total:
+            if batch['status_message']:
+                embed = discord.Embed(
+                    title=f"{ICONS['loading']} Generating Batch...",
+                    description=f"Workflow: `{batch['workflow_name']}`\n"
+                                f"Prompt: {utils.truncate_string(batch['prompt'], 100)}",
+                    color=COLORS['progress']
+                )
+                embed.add_field(name=f"{done}/{total} done", value=create_progress_bar(done, total), inline=False)
+                await self._edit_status_message(batch['status_message'], embed)
+            return
+        
+        batch['status'] = 'success' if any(
+            job['status'] == 'success' for job in batch['results'].values()
+        ) else 'error'
+        
+        await self.deliver_batch(batch)
+        
+        if batch['on_finish']:
+            await batch['on_finish'](batch)
+    
+    async def deliver_batch(self, batch: Dict[str, Any]):
+        """
+        Post a finished batch's outputs together and update its status message.
+        
+        Args:
+            batch: Finished batch from generate_batch
+        """
+        from ui_config import COLORS, ICONS
+        
+        entries = []
+        failed = batch['failed_submits']
+        for index in sorted(batch['results']):
+            job = batch['results'][index]
+            if job['status'] != 'success':
+                failed += 1
+                continue
+            label = self.format_variant(batch['variants'][index])
+            entries.extend(
+                (label, {**output, 'base_url': job.get('base_url'), 'username': job.get('username')})
+                for output in job['outputs']
+            )
+        
+        posted = 0
+        guild = batch['guild']
+        if guild and entries:
+            posted = await self.post_batch_to_channel(guild, batch['workflow_name'], entries, batch['prompt'])
+        
+        if batch['status_message']:
+            succeeded = len(batch['variants']) - failed
+            embed = discord.Embed(
+                title=f"{ICONS['success']} Batch Complete" if succeeded else f"{ICONS['error']} Batch Failed",
+                description=f"Workflow: `{batch['workflow_name']}`",
+                color=COLORS['success'] if succeeded else COLORS['error']
+            )
+            embed.add_field(name="Variants", value=f"{succeeded}/{len(batch['variants'])} succeeded", inline=True)
+            embed.add_field(name="Outputs", value=f"{posted}/{len(entries)} posted", inline=True)
+            embed.add_field(name="Total Time", value=f"{time.monotonic() - batch['submitted_at']:.1f}s", inline=True)
+            if batch['cached']:
+                embed.add_field(name="From Cache", value=f"{batch['cached']} variant(s)", inline=True)
+            
+            channel_id = self.workflow_channels.get(batch['workflow_name'])
+            if channel_id and posted:
+                embed.add_field(name="Channel", value=f"<#{channel_id}>", inline=False)
+            
+            await self._edit_status_message(batch['status_message'], embed)
+    
+    async def serve_cached(
+        self,
+        workflow_name: str,
+        prompt: str,
+        params: Dict[str, Any] = None,
+        guild: discord.Guild = None,
+        send_status: Callable[[], Awaitable[discord.Message]] = None
+    ) -> bool:
+        """
+        Repost a request's outputs if the exact same workflow was rendered before.
+        
+        Checked before a request is queued, so a hit is answered right away
+        (even with no deployment running, the outputs come from the volume).
+        
+        Args:
+            workflow_name: Workflow name
+            prompt: Text prompt
+            params: Extra workflow parameters
+            guild: Discord guild to post outputs in (optional)
+            send_status: Coroutine that sends the status message, only called on a hit (optional)
+        
+        Returns:
+            True if served, False if it has to be rendered
+        """
+        workflow = await self.build_workflow(workflow_name, prompt, params)
+        if not workflow:
+            return False
+        
+        entry = result_cache.lookup(result_cache.make_key(workflow))
+        if not entry:
+            return False
+        
+        status_message = await send_status() if send_status else None
+        if await self.deliver_cached(entry, workflow_name, prompt, guild, status_message):
+            return True
+        
+        # The outputs were deleted, so it's rendered after all
+        if status_message:
+            try:
+                await status_message.delete()
+            except Exception:
+                pass
+        return False
+    
+    async def deliver_cached(
+        self,
+        entry: Dict[str, Any],
+        workflow_name: str,
+        prompt: str,
+        guild: discord.Guild = None,
+        status_message: discord.Message = None
+    ) -> bool:
+        """
+        Repost outputs from a result cache entry.
+        
+        Args:
+            entry: Entry from result_cache.lookup()
+            workflow_name: Workflow name
+            prompt: Original prompt
+            guild: Discord guild to post outputs in (optional)
+            status_message: Message to update (optional)
+        
+        Returns:
+            True if served, False if the outputs are gone and it must be rendered
+        """
+        from ui_config import COLORS, ICONS
+        
+        outputs = entry['outputs']
+        posted = 0
+        if guild:
+            for output in outputs:
+                if await self.post_output_by_name(
+                    guild,
+                    workflow_name,
+                    output['filename'],
+                    output['subfolder'],
+                    prompt=prompt,
+                    base_url=entry['base_url'],
+                    profile=entry['username']
+                ):
+                    posted += 1
+            
+            if posted < len(outputs):
+                # Outputs were deleted from the volume, don't serve this entry again
+                result_cache.invalidate(entry['cache_key'])
+                if not posted:
+                    return False
+        
+        if status_message:
+            embed = discord.Embed(
+                title=f"{ICONS['success']} Served from Cache",
+                description=f"Workflow: `{workflow_name}`\n"
+                            "This exact request was rendered before, so no GPU time was used.",
+                color=COLORS['success']
+            )
+            embed.add_field(name="Outputs", value=f"{posted}/{len(outputs)} posted", inline=True)
+            embed.add_field(name="GPU Time Saved", value=f"{entry['execution_time']:.1f}s", inline=True)
+            
+            channel_id = self.workflow_channels.get(workflow_name)
+            if channel_id and posted:
+                embed.add_field(name="Channel", value=f"<#{channel_id}>", inline=False)
+            
+            await self._edit_status_message(status_message, embed)
+        
+        return True
+    
+    async def deliver_outputs(self, job: Dict[str, Any]):
+        """
+        Post a finished job's outputs and update its status message.
+        
+        Called by the execution tracker when a prompt finishes.
+        
+        Args:
+            job: Finished job from the execution tracker
+        """
+        from ui_config import COLORS, ICONS
+        
+        workflow_name = job['workflow_name']
+        status_message = job.get('status_message')
+        
+        if job['status'] == 'error':
+            logger.error(f"Generation failed for '{workflow_name}': {job['error']}")
+            if status_message:
+                embed = discord.Embed(
+                    title=f"{ICONS['error']} Generation Failed",
+                    description=f"Workflow: `{workflow_name}`\n"
+                                f"Error: {utils.truncate_string(job['error'], 1000)}",
+                    color=COLORS['error']
+                )
+                await self._edit_status_message(status_message, embed)
+            return
+        
+        execution_time = execution_tracker.get_execution_time(job)
+        queue_time = execution_tracker.get_queue_time(job)
+        
+        # Post every output to the workflow channel
+        posted = 0
+        guild = job.get('guild')
+        if guild:
+            for output in job['outputs']:
+                success = await self.post_output_by_name(
+                    guild,
+                    workflow_name,
+                    output['filename'],
+                    output['subfolder'],
+                    prompt=job.get('prompt'),
+                    generation_time=execution_time,
+                    base_url=job['base_url']
+                )
+                if success:
+                    posted += 1
+        
+        if status_message:
+            embed = discord.Embed(
+                title=f"{ICONS['success']} Generation Complete",
+                description=f"Workflow: `{workflow_name}`",
+                color=COLORS['success']
+            )
+            embed.add_field(name="Queue Time", value=f"{queue_time:.1f}s", inline=True)
+            embed.add_field(name="Generation Time", value=f"{execution_time:.1f}s", inline=True)
+            embed.add_field(name="Outputs", value=f"{posted}/{len(job['outputs'])} posted", inline=True)
+            
+            channel_id = self.workflow_channels.get(workflow_name)
+            if channel_id:
+                embed.add_field(name="Channel", value=f"<#{channel_id}>", inline=False)
+            
+            await self._edit_status_message(status_message, embed)
+    
+    async def _edit_status_message(self, message: discord.Message, embed: discord.Embed):
+        """Replace a status message's embed and drop any preview image."""
+        try:
+            await message.edit(embed=embed, attachments=[])
+        except discord.NotFound:
+            logger.warning("Status message was deleted before it could be updated")
+        except Exception as e:
+            logger.error(f"Failed to update status message: {e}")
+    
     # ========================================================================
     # OUTPUT POSTING
     # ========================================================================
@@ -322,9 +833,10 @@ class WorkflowManager:
         self,
         guild: discord.Guild,
         workflow_name: str,
-        output_file: Path,
+        output_file: Union[Path, BinaryIO],
         prompt: str = None,
-        generation_time: float = None
+        generation_time: float = None,
+        filename: str = None
     ) -> bool:
         """
         Post generated output to the appropriate workflow channel.
@@ -332,9 +844,10 @@ class WorkflowManager:
         Args:
             guild: Discord guild
             workflow_name: Workflow name
-            output_file: Path to output file
+            output_file: Path to output file, or an open binary file object
             prompt: Original prompt (optional)
             generation_time: Generation time in seconds (optional)
+            filename: Attachment filename (required when output_file is a file object)
         
         Returns:
             True if successful, False otherwise
@@ -346,14 +859,29 @@ class WorkflowManager:
             return False
         
         # Check file size
-        file_size_mb = output_file.stat().st_size / (1024 * 1024)
+        if isinstance(output_file, Path):
+            filename = filename or output_file.name
+            file_size_mb = output_file.stat().st_size / (1024 * 1024)
+        else:
+            file_size_mb = utils.get_stream_size(output_file) / (1024 * 1024)
+        
+        original_size_mb = None
         if file_size_mb > config.MAX_DISCORD_FILE_SIZE:
-            logger.error(f"File too large: {file_size_mb:.2f}MB (max: {config.MAX_DISCORD_FILE_SIZE}MB)")
-            await channel.send(
-                f"❌ Output file is too large ({file_size_mb:.2f}MB). "
-                f"Use `/get_output {output_file.name}` to download manually."
-            )
-            return False
+            # Try to re-encode it to fit before giving up
+            encoded = await output_encoder.fit_for_discord(output_file, filename)
+            
+            if not encoded:
+                logger.error(f"File too large: {file_size_mb:.2f}MB (max: {config.MAX_DISCORD_FILE_SIZE}MB)")
+                await channel.send(
+                    f"❌ Output file is too large ({file_size_mb:.2f}MB). "
+                    f"Use `/get_output {filename}` to download manually."
+                )
+                return False
+            
+            original_size_mb = file_size_mb
+            output_file, upload_filename = encoded
+        else:
+            upload_filename = filename
         
         # Create embed
         from ui_config import COLORS, ICONS, MESSAGES
@@ -373,13 +901,18 @@ class WorkflowManager:
         if generation_time:
             embed.add_field(name="Generation Time", value=f"{generation_time:.1f}s", inline=True)
         
+        if original_size_mb:
+            embed.set_footer(
+                text=f"Re-encoded to fit Discord (original: {filename}, {original_size_mb:.1f}MB)"
+            )
+        
         # Post to channel
         try:
-            file = discord.File(output_file)
+            file = discord.File(output_file, filename=upload_filename)
             await channel.send(embed=embed, file=file)
             logger.info(f"Posted output to #{channel.name}")
             return True
-            
+        
         except discord.Forbidden:
             logger.error(f"No permission to post in #{channel.name}")
             return False
@@ -387,6 +920,176 @@ class WorkflowManager:
             logger.error(f"Failed to post output: {e}")
             return False
     
+    async def post_output_by_name(
+        self,
+        guild: discord.Guild,
+        workflow_name: str,
+        filename: str,
+        subfolder: str = "",
+        prompt: str = None,
+        generation_time: float = None,
+        base_url: str = None,
+        profile: str = None
+    ) -> bool:
+        """
+        Fetch an output by filename and post it to the workflow channel.
+        
+        The file is streamed from ComfyUI when it is running, otherwise
+        downloaded from the Modal volume.
+        
+        Args:
+            guild: Discord guild
+            workflow_name: Workflow name
+            filename: Output filename
+            subfolder: Subfolder inside the output directory (optional)
+            prompt: Original prompt (optional)
+            generation_time: Generation time in seconds (optional)
+            base_url: ComfyUI that produced it (default: the first deployment)
+            profile: Account whose volume holds it (default: from base_url)
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        output = await modal_manager.open_output(filename, subfolder, base_url, profile)
+        if not output:
+            logger.error(f"Failed to fetch output '{filename}'")
+            return False
+        
+        try:
+            return await self.post_output_to_channel(
+                guild,
+                workflow_name,
+                output,
+                prompt=prompt,
+                generation_time=generation_time,
+                filename=filename
+            )
+        finally:
+            output.close()
+    
+    async def _open_for_upload(
+        self,
+        filename: str,
+        subfolder: str = "",
+        base_url: str = None,
+        profile: str = None
+    ) -> Optional[Tuple[BinaryIO, str, int]]:
+        """
+        Open an output for upload, re-encoding it if it's too large.
+        
+        Returns:
+            (file_object, upload_filename, size_bytes) or None if failed
+        """
+        output = await modal_manager.open_output(filename, subfolder, base_url, profile)
+        if not output:
+            logger.error(f"Failed to fetch output '{filename}'")
+            return None
+        
+        size = utils.get_stream_size(output)
+        if size <= config.MAX_DISCORD_FILE_SIZE * 1024 * 1024:
+            return output, filename, size
+        
+        try:
+            encoded = await output_encoder.fit_for_discord(output, filename)
+        finally:
+            output.close()
+        
+        if not encoded:
+            logger.error(f"Output '{filename}' is too large to post")
+            return None
+        
+        encoded_path, upload_filename = encoded
+        return open(encoded_path, 'rb'), upload_filename, encoded_path.stat().st_size
+    
+    async def post_batch_to_channel(
+        self,
+        guild: discord.Guild,
+        workflow_name: str,
+        entries: List[Tuple[str, Dict[str, Any]]],
+        prompt: str = None
+    ) -> int:
+        """
+        Post a batch's outputs as grouped messages (as few as Discord allows).
+        
+        Args:
+            guild: Discord guild
+            workflow_name: Workflow name
+            entries: List of (variant_label, output) where output has 'filename', 'subfolder'
+                and optionally 'base_url' (the ComfyUI that produced it) and
+                'username' (the account whose volume holds it)
+            prompt: Original prompt (optional)
+        
+        Returns:
+            Number of outputs posted
+        """
+        from ui_config import COLORS, ICONS
+        
+        channel = await self.get_or_create_channel(guild, workflow_name)
+        if not channel:
+            logger.error(f"Failed to get channel for workflow '{workflow_name}'")
+            return 0
+        
+        opened = await asyncio.gather(*(
+            self._open_for_upload(
+                output['filename'], output['subfolder'], output.get('base_url'), output.get('username')
+            )
+            for _, output in entries
+        ))
+        
+        # Split into messages by attachment count and total upload size
+        max_bytes = config.MAX_DISCORD_FILE_SIZE * 1024 * 1024
+        groups = [[]]
+        group_size = 0
+        for number, ((label, _), upload) in enumerate(zip(entries, opened), start=1):
+            if not upload:
+                continue
+            size = upload[2]
+            if groups[-1] and (
+                len(groups[-1]) >= config.BATCH['files_per_message'] or group_size + size > max_bytes
+            ):
+                groups.append([])
+                group_size = 0
+            groups[-1].append((number, label, upload))
+            group_size += size
+        
+        posted = 0
+        try:
+            for part, group in enumerate(groups, start=1):
+                if not group:
+                    continue
+                
+                embed = discord.Embed(
+                    title=f"{ICONS['image']} Batch Generated",
+                    description='\n'.join(f"`{number}` {label}" for number, label, _ in group),
+                    color=COLORS['success']
+                )
+                embed.add_field(name="Workflow", value=workflow_name, inline=True)
+                if prompt:
+                    embed.add_field(name="Prompt", value=utils.truncate_string(prompt, 1000), inline=False)
+                if len(groups) > 1:
+                    embed.set_footer(text=f"Part {part}/{len(groups)}")
+                
+                files = [
+                    discord.File(stream, filename=f"{number}_{upload_filename}")
+                    for number, _, (stream, upload_filename, _) in group
+                ]
+                
+                try:
+                    await channel.send(embed=embed, files=files)
+                    posted += len(files)
+                except discord.Forbidden:
+                    logger.error(f"No permission to post in #{channel.name}")
+                    break
+                except Exception as e:
+                    logger.error(f"Failed to post batch outputs: {e}")
+        finally:
+            for upload in opened:
+                if upload:
+                    upload[0].close()
+        
+        logger.info(f"Posted {posted} batch output(s) to #{channel.name}")
+        return posted
+    
     # ========================================================================
     # STATISTICS
     # ========================================================================
@@ -0,0 +1,360 @@
+"""
+Workflow Templates Module
+=========================
+Compiles ComfyUI workflows into reusable templates:
+- Each workflow is scanned once and its injection points are recorded
+  (prompt, negative prompt, seed, steps, width, height)
+- Per-workflow override files can pin or disable injection points
+- Compiled templates are cached, so a generation needs no download or scan
+- Each generation gets a copy-on-write instance (only touched nodes are copied)
+"""
+
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+import config
+import utils
+from modal_manager import modal_manager
+
+logger = logging.getLogger(__name__)
+
+# Parameters a template can inject
+PARAMETERS = ['prompt', 'negative_prompt', 'seed', 'steps', 'width', 'height']
+
+# Inputs that pass conditioning through from another node (e.g. FluxGuidance)
+CONDITIONING_INPUTS = ['conditioning', 'conditioning_to', 'conditioning_1']
+
+# How many pass-through nodes to follow when looking for prompt text
+MAX_LINK_DEPTH = 8
+
+# ============================================================================
+# COMPILER
+# ============================================================================
+
+def _is_link(value: Any) -> bool:
+    """Check if an input value is a link to another node ([node_id, output_index])."""
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[1], int)
+
+def _node_order(node_id: str) -> Tuple[int, str]:
+    """Sort key that orders numeric node IDs numerically."""
+    head = node_id.split(':')[0]
+    return (int(head), node_id) if head.isdigit() else (float('inf'), node_id)
+
+def _find_text_field(workflow: Dict[str, Any], node_id: str, depth: int = 0) -> Optional[Tuple[str, str]]:
+    """
+    Follow a conditioning link back to the field holding the prompt text.
+    
+    Returns:
+        (node_id, field) or None if no text field was found
+    """
+    if depth > MAX_LINK_DEPTH:
+        return None
+    
+    node = workflow.get(node_id)
+    if not isinstance(node, dict):
+        return None
+    
+    inputs = node.get('inputs', {})
+    settings = config.WORKFLOW_TEMPLATES
+    
+    if node.get('class_type') in settings['prompt_node_types']:
+        for field in settings['prompt_fields']:
+            if field not in inputs:
+                continue
+            value = inputs[field]
+            if _is_link(value):
+                # Text comes from a primitive/string node
+                return _find_text_field(workflow, str(value[0]), depth + 1)
+            if isinstance(value, str):
+                return node_id, field
+    
+    # Pass-through node, keep following the conditioning
+    for field in CONDITIONING_INPUTS:
+        if _is_link(inputs.get(field)):
+            return _find_text_field(workflow, str(inputs[field][0]), depth + 1)
+    
+    return None
+
+def _add_point(points: Dict[str, List[Tuple[str, str]]], param: str, point: Optional[Tuple[str, str]]):
+    """Record an injection point once."""
+    if point and point not in points[param]:
+        points[param].append(point)
+
+def detect_injection_points(workflow: Dict[str, Any]) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Find where each parameter goes in an API-format workflow.
+    
+    Prompts are found by following the positive/negative inputs of samplers
+    and guiders back to their text nodes, so negative prompts are never
+    mistaken for the prompt. Seed, steps and size are literal inputs.
+    
+    Returns:
+        Dict mapping parameter -> list of (node_id, field)
+    """
+    settings = config.WORKFLOW_TEMPLATES
+    points: Dict[str, List[Tuple[str, str]]] = {param: [] for param in PARAMETERS}
+    
+    for node_id in sorted(workflow, key=_node_order):
+        node = workflow[node_id]
+        if not isinstance(node, dict):
+            continue
+        
+        inputs = node.get('inputs', {})
+        class_type = node.get('class_type', '')
+        
+        for param, link_field in (('prompt', 'positive'), ('negative_prompt', 'negative')):
+            if _is_link(inputs.get(link_field)):
+                _add_point(points, param, _find_text_field(workflow, str(inputs[link_field][0])))
+        
+        # Guiders without a negative (e.g. BasicGuider) take the prompt as 'conditioning'
+        if class_type.endswith('Guider') and _is_link(inputs.get('conditioning')):
+            _add_point(points, 'prompt', _find_text_field(workflow, str(inputs['conditioning'][0])))
+        
+        for field in settings['seed_fields']:
+            if isinstance(inputs.get(field), int):
+                _add_point(points, 'seed', (node_id, field))
+        
+        for field in settings['steps_fields']:
+            if isinstance(inputs.get(field), int):
+                _add_point(points, 'steps', (node_id, field))
+        
+        if class_type in settings['latent_node_types']:
+            for field in settings['size_fields']:
+                if isinstance(inputs.get(field), int):
+                    _add_point(points, field, (node_id, field))
+    
+    # Workflows without a sampler (e.g. API nodes): use the first text node
+    if not points['prompt']:
+        for node_id in sorted(workflow, key=_node_order):
+            point = _find_text_field(workflow, node_id)
+            if point and point not in points['negative_prompt']:
+                points['prompt'].append(point)
+                break
+    
+    # A text node feeding both sides is the prompt
+    points['negative_prompt'] = [p for p in points['negative_prompt'] if p not in points['prompt']]
+    
+    return points
+
+# ============================================================================
+# WORKFLOW TEMPLATE CLASS
+# ============================================================================
+
+class WorkflowTemplate:
+    """A compiled workflow with known injection points."""
+    
+    def __init__(
+        self,
+        name: str,
+        workflow: Dict[str, Any],
+        points: Dict[str, List[Tuple[str, str]]],
+        defaults: Dict[str, Any] = None
+    ):
+        """
+        Initialize workflow template.
+        
+        Args:
+            name: Workflow name
+            workflow: API-format workflow (never modified)
+            points: Dict mapping parameter -> list of (node_id, field)
+            defaults: Parameter values used when a request doesn't set them
+        """
+        self.name = name
+        self.workflow = workflow
+        self.points = points
+        self.defaults = defaults or {}
+        self.compiled_at = time.monotonic()
+    
+    def get_parameters(self) -> List[str]:
+        """Get the parameters this template can inject."""
+        return [param for param in PARAMETERS if self.points.get(param)]
+    
+    def instantiate(self, prompt: str = None, **params) -> Dict[str, Any]:
+        """
+        Create a workflow for one request.
+        
+        Untouched nodes are shared with the template; only nodes that
+        receive a value are copied, so the template stays unchanged.
+        
+        Args:
+            prompt: Text prompt (optional)
+            **params: negative_prompt, seed, steps, width, height
+        
+        Returns:
+            Workflow dict ready to send to ComfyUI
+        """
+        values = dict(self.defaults)
+        values.update({param: value for param, value in params.items() if value is not None})
+        if prompt is not None:
+            values['prompt'] = prompt
+        
+        instance = dict(self.workflow)
+        copied = set()
+        
+        for param, value in values.items():
+            if param not in PARAMETERS:
+                logger.warning(f"Unknown workflow parameter '{param}' ignored")
+                continue
+            
+            for node_id, field in self.points.get(param, []):
+                if node_id not in copied:
+                    node = dict(instance[node_id])
+                    node['inputs'] = dict(node['inputs'])
+                    instance[node_id] = node
+                    copied.add(node_id)
+                instance[node_id]['inputs'][field] = value
+        
+        return instance
+
+# ============================================================================
+# TEMPLATE CACHE CLASS
+# ============================================================================
+
+class WorkflowTemplateCache:
+    """Compiles workflows on first use and caches the templates."""
+    
+    def __init__(self, overrides_dir: Path = None):
+        """
+        Initialize template cache.
+        
+        Args:
+            overrides_dir: Directory with override files (default: config.WORKFLOW_OVERRIDES_DIR)
+        """
+        if overrides_dir is None:
+            overrides_dir = config.WORKFLOW_OVERRIDES_DIR
+        
+        self.overrides_dir = overrides_dir
+        self.templates: Dict[str, WorkflowTemplate] = {}
+        self._override_mtimes: Dict[str, Optional[float]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+    
+    def _normalize_name(self, workflow_name: str) -> str:
+        """Strip the .json extension from a workflow name."""
+        return workflow_name[:-5] if workflow_name.endswith('.json') else workflow_name
+    
+    def _get_override_file(self, name: str) -> Path:
+        """Get the override file path for a workflow."""
+        return self.overrides_dir / f"{name}.json"
+    
+    def _get_override_mtime(self, name: str) -> Optional[float]:
+        """Get the override file's modification time (None if there is none)."""
+        override_file = self._get_override_file(name)
+        return override_file.stat().st_mtime if override_file.exists() else None
+    
+    def load_overrides(self, name: str) -> Dict[str, Any]:
+        """
+        Load a workflow's override file.
+        
+        Format:
+            {
+                "prompt": [["6", "text"]],       # Replace detected points
+                "negative_prompt": [],           # Empty list disables a parameter
+                "defaults": {"steps": 20}        # Values used when not requested
+            }
+        
+        Returns:
+            Override dict (empty if there is no override file)
+        """
+        override_file = self._get_override_file(name)
+        if not override_file.exists():
+            return {}
+        
+        return utils.read_json_file(override_file) or {}
+    
+    def compile(self, name: str, workflow: Dict[str, Any]) -> WorkflowTemplate:
+        """
+        Compile a workflow into a template.
+        
+        Args:
+            name: Workflow name
+            workflow: API-format workflow
+        
+        Returns:
+            Compiled template
+        """
+        points = detect_injection_points(workflow)
+        overrides = self.load_overrides(name)
+        
+        for param in PARAMETERS:
+            if param not in overrides:
+                continue
+            
+            valid = []
+            for node_id, field in overrides[param]:
+                node_id = str(node_id)
+                if field in workflow.get(node_id, {}).get('inputs', {}):
+                    valid.append((node_id, field))
+                else:
+                    logger.warning(f"Override for '{name}' points to missing input {node_id}.{field}")
+            points[param] = valid
+        
+        template = WorkflowTemplate(name, workflow, points, overrides.get('defaults'))
+        
+        summary = ', '.join(
+            f"{param}={['.'.join(p) for p in points[param]]}" for param in template.get_parameters()
+        )
+        logger.info(f"Compiled workflow '{name}': {summary or 'no injection points'}")
+        return template
+    
+    def _is_fresh(self, name: str) -> bool:
+        """Check if a cached template can still be used."""
+        template = self.templates.get(name)
+        if not template:
+            return False
+        if time.monotonic() - template.compiled_at > config.WORKFLOW_TEMPLATES['cache_ttl']:
+            return False
+        return self._override_mtimes.get(name) == self._get_override_mtime(name)
+    
+    async def get(self, workflow_name: str) -> Optional[WorkflowTemplate]:
+        """
+        Get a compiled template, downloading and compiling it if needed.
+        
+        Args:
+            workflow_name: Workflow name
+        
+        Returns:
+            Template or None if the workflow couldn't be loaded
+        """
+        name = self._normalize_name(workflow_name)
+        
+        if self._is_fresh(name):
+            return self.templates[name]
+        
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            # Another request may have compiled it while we waited
+            if self._is_fresh(name):
+                return self.templates[name]
+            
+            workflow = await modal_manager.get_workflow(name)
+            if not isinstance(workflow, dict):
+                return None
+            
+            self._override_mtimes[name] = self._get_override_mtime(name)
+            self.templates[name] = self.compile(name, workflow)
+            return self.templates[name]
+    
+    def invalidate(self, workflow_name: str = None):
+        """
+        Drop cached templates so they are recompiled on next use.
+        
+        Args:
+            workflow_name: Workflow to drop (default: all)
+        """
+        if workflow_name is None:
+            self.templates.clear()
+        else:
+            self.templates.pop(self._normalize_name(workflow_name), None)
+
+# ============================================================================
+# GLOBAL INSTANCE
+# ============================================================================
+
+# Create a global instance for easy access
+workflow_templates = WorkflowTemplateCache()
+
+# ============================================================================
+# END OF WORKFLOW TEMPLATES
+# ============================================================================